@@ -20,6 +20,7 @@ rather than reading environment variables directly or by accessing this configur
 
 import os
 import sys
+import tempfile
 
 from dotenv import find_dotenv, load_dotenv
 
@@ -63,7 +64,106 @@ class _Config():  # pylint: disable=too-few-public-methods
     JWT_OIDC_CACHING_ENABLED = os.getenv('JWT_OIDC_CACHING_ENABLED')
     JWT_OIDC_JWKS_CACHE_TIMEOUT = int(os.getenv('JWT_OIDC_JWKS_CACHE_TIMEOUT', '300'))
 
+    # One or more Gotenberg base URLs, comma separated; conversions go to the least loaded healthy endpoint
     GOTENBERG_URL = os.getenv('GOTENBERG_URL', 'http://localhost:3000')
+    GOTENBERG_TIMEOUT = int(os.getenv('GOTENBERG_TIMEOUT', '500'))
+    # Conversions in flight per worker process, and per report within that
+    GOTENBERG_MAX_IN_FLIGHT = int(os.getenv('GOTENBERG_MAX_IN_FLIGHT', '6'))
+    GOTENBERG_MAX_IN_FLIGHT_PER_REQUEST = int(os.getenv('GOTENBERG_MAX_IN_FLIGHT_PER_REQUEST', '4'))
+    GOTENBERG_POOL_SIZE = int(os.getenv('GOTENBERG_POOL_SIZE', '10'))
+    # Retries on 429/503 with jittered exponential backoff starting at GOTENBERG_RETRY_BACKOFF seconds
+    GOTENBERG_MAX_RETRIES = int(os.getenv('GOTENBERG_MAX_RETRIES', '3'))
+    GOTENBERG_RETRY_BACKOFF = float(os.getenv('GOTENBERG_RETRY_BACKOFF', '0.5'))
+    # Send inline fonts, images and large style blocks as separate files instead of inside index.html
+    GOTENBERG_EXTERNALIZE_ASSETS = os.getenv('GOTENBERG_EXTERNALIZE_ASSETS', 'true').lower() == 'true'
+    # Endpoint health probes (0 disables), warm-up conversions at startup and after an outage, and ejection of an
+    # endpoint for GOTENBERG_EJECT_SECONDS after GOTENBERG_EJECT_FAILURES failed conversions in a row
+    GOTENBERG_HEALTH_INTERVAL = float(os.getenv('GOTENBERG_HEALTH_INTERVAL', '10'))
+    GOTENBERG_HEALTH_TIMEOUT = float(os.getenv('GOTENBERG_HEALTH_TIMEOUT', '2'))
+    GOTENBERG_WARMUP = os.getenv('GOTENBERG_WARMUP', 'true').lower() == 'true'
+    GOTENBERG_EJECT_FAILURES = int(os.getenv('GOTENBERG_EJECT_FAILURES', '3'))
+    GOTENBERG_EJECT_SECONDS = float(os.getenv('GOTENBERG_EJECT_SECONDS', '30'))
+    # Request HTML plus response PDF bytes a worker process may hold for in-flight renders
+    RENDER_MEMORY_BUDGET_MB = int(os.getenv('RENDER_MEMORY_BUDGET_MB', '256'))
+
+    # 'gotenberg' renders a footer per page; 'native' renders it once and stamps page numbers itself
+    FOOTER_STAMPING_MODE = os.getenv('FOOTER_STAMPING_MODE', 'gotenberg')
+    # Documents longer than this are always stamped natively
+    FOOTER_NATIVE_PAGE_THRESHOLD = int(os.getenv('FOOTER_NATIVE_PAGE_THRESHOLD', '500'))
+
+    # Report templates are compiled once at startup and recompiled when their mtime changes
+    TEMPLATE_PRECOMPILE = os.getenv('TEMPLATE_PRECOMPILE', 'true').lower() == 'true'
+    TEMPLATE_AUTO_RELOAD = os.getenv('TEMPLATE_AUTO_RELOAD', 'true').lower() == 'true'
+    # Optional directory for compiled template bytecode shared by worker processes
+    TEMPLATE_BYTECODE_CACHE_DIR = os.getenv('TEMPLATE_BYTECODE_CACHE_DIR', '')
+    # Seconds between scans of the template folder for the in memory catalogue; 0 scans only at startup
+    TEMPLATE_WATCH_SECONDS = float(os.getenv('TEMPLATE_WATCH_SECONDS', '5'))
+
+    # Processes rendering statement chunk templates off the request worker; 0 renders them inline
+    CHUNK_RENDER_PROCESSES = int(os.getenv('CHUNK_RENDER_PROCESSES', '2'))
+    # Statement chunk sizing: chunks per Gotenberg slot, with at least CHUNK_MIN_SECONDS of conversion and at
+    # most CHUNK_MAX_HTML_MB of HTML each, measured per template; CHUNK_DEFAULT_ROWS rows each before that
+    CHUNK_TARGET_PER_SLOT = int(os.getenv('CHUNK_TARGET_PER_SLOT', '2'))
+    CHUNK_MIN_SECONDS = float(os.getenv('CHUNK_MIN_SECONDS', '1.0'))
+    CHUNK_MAX_HTML_MB = float(os.getenv('CHUNK_MAX_HTML_MB', '4'))
+    CHUNK_DEFAULT_ROWS = int(os.getenv('CHUNK_DEFAULT_ROWS', '500'))
+    # Keep invoices that fit in one chunk whole, packing consecutive small invoices into shared chunks
+    CHUNK_PACK_INVOICES = os.getenv('CHUNK_PACK_INVOICES', 'true').lower() == 'true'
+
+    # Processes rendering inline-template reports with warm WeasyPrint state, and their timeout in seconds;
+    # 0 renders in the request worker without a timeout
+    WEASYPRINT_RENDER_PROCESSES = int(os.getenv('WEASYPRINT_RENDER_PROCESSES', '2'))
+    WEASYPRINT_RENDER_TIMEOUT = float(os.getenv('WEASYPRINT_RENDER_TIMEOUT', '60'))
+
+    # Directory where each worker writes its metrics so /ops/metrics merges every worker (gunicorn_config.py
+    # sets one per server start); empty exports only the answering worker's, right only with a single worker
+    METRICS_MULTIPROC_DIR = os.getenv('METRICS_MULTIPROC_DIR', '')
+    METRICS_SNAPSHOT_SECONDS = float(os.getenv('METRICS_SNAPSHOT_SECONDS', '5'))
+
+    # Cache of stored template PDFs: '' (off), 'memory', 'disk' or 'redis' (needs the redis package, checked at startup)
+    REPORT_CACHE_BACKEND = os.getenv('REPORT_CACHE_BACKEND', '')
+    REPORT_CACHE_TTL = int(os.getenv('REPORT_CACHE_TTL', '600'))
+    REPORT_CACHE_MAX_MB = int(os.getenv('REPORT_CACHE_MAX_MB', '64'))
+    REPORT_CACHE_MAX_ENTRY_MB = int(os.getenv('REPORT_CACHE_MAX_ENTRY_MB', '8'))
+    REPORT_CACHE_DIR = os.getenv('REPORT_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'report-api-cache'))
+    REPORT_CACHE_REDIS_URL = os.getenv('REPORT_CACHE_REDIS_URL', 'redis://localhost:6379/0')
+
+    # Asynchronous report jobs: render threads per worker, queue limit, and the spool finished PDFs wait in
+    REPORT_JOB_WORKERS = int(os.getenv('REPORT_JOB_WORKERS', '2'))
+    REPORT_JOB_MAX_QUEUED = int(os.getenv('REPORT_JOB_MAX_QUEUED', '20'))
+    REPORT_JOB_SPOOL_DIR = os.getenv('REPORT_JOB_SPOOL_DIR', os.path.join(tempfile.gettempdir(), 'report-api-jobs'))
+    REPORT_JOB_SPOOL_MAX_MB = int(os.getenv('REPORT_JOB_SPOOL_MAX_MB', '1024'))
+    REPORT_JOB_TTL = int(os.getenv('REPORT_JOB_TTL', '3600'))
+    # Comma separated hosts allowed as callbackUrl targets; empty rejects every callbackUrl
+    REPORT_JOB_CALLBACK_HOSTS = os.getenv('REPORT_JOB_CALLBACK_HOSTS', '')
+
+    # Batch reports: render threads per worker shared by every batch, and the most items one batch may hold
+    REPORT_BATCH_WORKERS = int(os.getenv('REPORT_BATCH_WORKERS', '4'))
+    REPORT_BATCH_MAX_ITEMS = int(os.getenv('REPORT_BATCH_MAX_ITEMS', '100'))
+
+    # Chunked statements are merged and stamped into spooled files, held in memory up to PDF_SPOOL_MEMORY_MB
+    SPOOL_CHUNKED_REPORTS = os.getenv('SPOOL_CHUNKED_REPORTS', 'true').lower() == 'true'
+    PDF_SPOOL_MEMORY_MB = int(os.getenv('PDF_SPOOL_MEMORY_MB', '16'))
+
+    # PDFs of these templates ('*' for all, ?optimize= overrides) share identical font and image streams and are
+    # written with compressed object streams; optionally linearized, and images longer than MAX_IMAGE_PX shrunk
+    PDF_OPTIMIZE_TEMPLATES = os.getenv('PDF_OPTIMIZE_TEMPLATES', '')
+    PDF_OPTIMIZE_LINEARIZE = os.getenv('PDF_OPTIMIZE_LINEARIZE', 'false').lower() == 'true'
+    PDF_OPTIMIZE_MAX_IMAGE_PX = int(os.getenv('PDF_OPTIMIZE_MAX_IMAGE_PX', '0'))
+
+    # Request bodies are decoded as they arrive and rejected once over either limit (compressed, then decoded JSON)
+    REQUEST_MAX_BODY_MB = int(os.getenv('REQUEST_MAX_BODY_MB', '256'))
+    REQUEST_MAX_JSON_MB = int(os.getenv('REQUEST_MAX_JSON_MB', '1024'))
+
+    # CSV reports stream in blocks of this size, gzipped at CSV_GZIP_LEVEL when the client accepts it (0 disables)
+    CSV_BLOCK_SIZE_KB = int(os.getenv('CSV_BLOCK_SIZE_KB', '64'))
+    CSV_GZIP_LEVEL = int(os.getenv('CSV_GZIP_LEVEL', '6'))
+
+    # Max chunk PDFs rendering or waiting to be merged at once for a single statement
+    CHUNK_REORDER_WINDOW = int(os.getenv('CHUNK_REORDER_WINDOW', '8'))
+
+    # Send each PDF report's per stage render times in a Server-Timing response header
+    RENDER_SERVER_TIMING = os.getenv('RENDER_SERVER_TIMING', 'false').lower() == 'true'
 
     TESTING = False
     DEBUG = True
@@ -81,6 +181,12 @@ class TestConfig(_Config):  # pylint: disable=too-few-public-methods
 
     USE_TEST_KEYCLOAK_DOCKER = 'YES'
 
+    CHUNK_RENDER_PROCESSES = 0
+    WEASYPRINT_RENDER_PROCESSES = 0
+    TEMPLATE_WATCH_SECONDS = 0
+    GOTENBERG_HEALTH_INTERVAL = 0
+    GOTENBERG_WARMUP = False
+
     JWT_OIDC_TEST_MODE = True
     JWT_OIDC_TEST_AUDIENCE = os.getenv('JWT_OIDC_AUDIENCE')
     JWT_OIDC_TEST_CLIENT_SECRET = os.getenv('JWT_OIDC_CLIENT_SECRET')
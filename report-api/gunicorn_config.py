@@ -16,6 +16,7 @@
 """
 
 import os
+import tempfile
 
 
 workers = int(os.environ.get('GUNICORN_PROCESSES', '2'))
@@ -28,3 +29,6 @@ keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', '2'))
 
 forwarded_allow_ips = '*'  # pylint: disable=invalid-name
 secure_scheme_headers = {'X-Forwarded-Proto': 'https'}  # pylint: disable=invalid-name
+
+# Workers share this directory so a metrics scrape answered by any one of them covers them all
+os.environ.setdefault('METRICS_MULTIPROC_DIR', tempfile.mkdtemp(prefix='report-api-metrics-'))
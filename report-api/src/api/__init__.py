@@ -20,6 +20,12 @@ from sbc_common_components.exception_handling.exception_handler import Exception
 
 import config  # pylint:disable=import-error
 from api import models
+from api.services.gotenberg_client import GotenbergClient
+from api.services.metrics_exporter import worker_snapshots
+from api.services.report_cache import ReportCache
+from api.services.template_catalogue import template_catalogue
+from api.services.template_registry import template_registry
+from api.services.weasyprint_pool import WeasyPrintPool
 from api.utils.auth import jwt
 from api.utils.logging import setup_logging
 from api.utils.run_version import get_run_version
@@ -40,6 +46,13 @@ def create_app(run_mode=os.getenv('FLASK_ENV', 'production')):
 
     setup_jwt_manager(app, jwt)
 
+    template_registry.init_app(app)
+    template_catalogue.init_app(app)
+    GotenbergClient.init_app(app)
+    WeasyPrintPool.init_app(app)
+    ReportCache.init_app(app)
+    worker_snapshots.init_app(app)
+
     ExceptionHandler(app)
 
     @app.after_request
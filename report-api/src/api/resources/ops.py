@@ -13,8 +13,11 @@
 # limitations under the License.
 """Endpoints to check and manage the health of the service."""
 
+from flask import Response
 from flask_restx import Namespace, Resource
 
+from api.services.metrics_exporter import CONTENT_TYPE, prometheus_text
+
 
 API = Namespace('OPS', description='Service - OPS checks')
 
@@ -41,3 +44,13 @@ class Readyz(Resource):
         """Return a JSON object that identifies if the service is setupAnd ready to work."""
         # TODO: add a poll to the DB when called
         return {'message': 'api is ready'}, 200
+
+
+@API.route('metrics')
+class Metrics(Resource):
+    """Render pipeline metrics of every worker process, merged by the one that answers, for Prometheus to scrape."""
+
+    @staticmethod
+    def get():
+        """Return the metrics in the Prometheus text format."""
+        return Response(prometheus_text(), content_type=CONTENT_TYPE)
@@ -12,51 +12,135 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 """Endpoints to check and manage payments."""
-import gzip
+import csv
+import itertools
 import json
+import time
+import zlib
 from http import HTTPStatus
 
-from flask import Response, abort, request, stream_with_context
+from flask import Response, abort, current_app, request, send_file, stream_with_context, url_for
 from flask_restx import Namespace, Resource
 from jinja2 import TemplateNotFound
+from werkzeug.wsgi import wrap_file
 
 from api.services import CsvService, ReportService
+from api.services.pdf_optimizer import optimize_options, optimize_pdf
+from api.services.pdf_spool import is_spooled, new_spooled_pdf, pdf_size
+from api.services.report_batch_service import ReportBatchService, write_merged_pdf, write_zip
+from api.services.render_metrics import end_trace, start_trace
+from api.services.report_job_service import ReportJobQueueFullError, ReportJobService, job_response
+from api.services.weasyprint_pool import ReportRenderTimeoutError
 from api.utils.auth import jwt as _jwt
+from api.utils.json_stream import RequestTooLargeError, decode_json_stream, iter_lines, read_body
 
 
 API = Namespace('Reports', description='Service - Reports')
 
+# Arrays decoded element by element as the request arrives: statement transactions and CSV rows
+STREAMED_JSON_PATHS = (
+    ('templateVars', 'grouped_invoices', '*', 'transactions', '*'),
+    ('templateVars', 'values', '*'),
+)
+
 
 def _parse_request_json():
-    """Parse request JSON, handling GZIP decompression if needed."""
-    content_encoding = request.headers.get('Content-Encoding', '').lower()
-    if content_encoding == 'gzip':
-        try:
-            compressed_data = request.get_data()
-            decompressed_data = gzip.decompress(compressed_data)
-            return json.loads(decompressed_data.decode('utf-8'))
-        except (gzip.BadGzipFile, json.JSONDecodeError, UnicodeDecodeError) as e:
-            abort(HTTPStatus.BAD_REQUEST, f'Failed to decompress or parse GZIP data: {str(e)}')
-    return request.get_json()
+    """Parse request JSON, handling GZIP decompression if needed.
+
+    JSON bodies are decompressed and decoded incrementally, within REQUEST_MAX_BODY_MB and REQUEST_MAX_JSON_MB.
+    """
+    compressed = request.headers.get('Content-Encoding', '').lower() == 'gzip'
+    if request.mimetype == 'application/x-ndjson':
+        return _parse_ndjson_request(compressed)
+    if not compressed and not request.is_json:
+        return request.get_json()
+    try:
+        return decode_json_stream(_request_blocks(compressed), STREAMED_JSON_PATHS)
+    except RequestTooLargeError as e:
+        abort(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, str(e))
+    except (zlib.error, EOFError, ValueError) as e:
+        data_format = 'GZIP' if compressed else 'JSON'
+        abort(HTTPStatus.BAD_REQUEST, f'Failed to decompress or parse {data_format} data: {str(e)}')
+
+
+def _request_blocks(compressed):
+    """Return the request body as decompressed blocks, rejecting a declared length over the limit up front."""
+    max_body_bytes = current_app.config.get('REQUEST_MAX_BODY_MB', 256) * 1024 * 1024
+    if (request.content_length or 0) > max_body_bytes:
+        abort(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, f'Request body is larger than {max_body_bytes} bytes')
+    return read_body(
+        request.stream, compressed, max_body_bytes, current_app.config.get('REQUEST_MAX_JSON_MB', 1024) * 1024 * 1024
+    )
+
+
+def _parse_ndjson_request(compressed):
+    """Parse an NDJSON body: the first line is the request JSON and each following line is one CSV row.
+
+    The rows stay in the request body and are read as the CSV streams out.
+    """
+    lines = iter_lines(_request_blocks(compressed))
+    try:
+        request_json = json.loads(next(lines, b''))
+    except RequestTooLargeError as e:
+        abort(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, str(e))
+    except (zlib.error, EOFError, ValueError) as e:
+        abort(HTTPStatus.BAD_REQUEST, f'Failed to decompress or parse NDJSON data: {str(e)}')
+    if not isinstance(request_json, dict):
+        abort(HTTPStatus.BAD_REQUEST, 'The first NDJSON line must be the request object')
+    request_json.setdefault('templateVars', {})['values'] = _ndjson_rows(lines)
+    return request_json
+
 
+def _ndjson_rows(lines):
+    for line in lines:
+        if line.strip():
+            yield json.loads(line)
 
-def _generate_csv_report(request_json):
-    """Generate CSV report from request data."""
+
+def _generate_csv_report(request_json, compress):
+    """Generate CSV report from request data, gzipped when compress is set."""
     report_name = request_json.get('reportName', 'report')
     file_name = f'{report_name}.csv'
     template_vars = request_json.get('templateVars', {})
     if not template_vars.get('columns'):
         return None, file_name
-    report = CsvService.create_report(template_vars)
-    return report, file_name
+    report = CsvService.create_report(
+        template_vars,
+        block_size=current_app.config.get('CSV_BLOCK_SIZE_KB', 64) * 1024,
+        compress_level=current_app.config.get('CSV_GZIP_LEVEL', 6) if compress else 0,
+    )
+    return _start_csv_stream(report), file_name
+
+
+def _start_csv_stream(report):
+    """Read the first CSV block before the response starts, so rows that fail straight away are an error status.
+
+    Rows that fail later end the stream with an error record; see CsvService.
+    """
+    try:
+        first_block = next(report, None)
+    except RequestTooLargeError as e:
+        abort(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, str(e))
+    except (zlib.error, EOFError, ValueError, csv.Error) as e:
+        abort(HTTPStatus.BAD_REQUEST, f'Failed to read CSV rows: {str(e)}')
+    return itertools.chain(() if first_block is None else (first_block,), report)
+
+
+def _accepts_gzip():
+    """Return True when the client accepts a gzip response and CSV_GZIP_LEVEL enables it."""
+    return request.accept_encodings['gzip'] > 0 and current_app.config.get('CSV_GZIP_LEVEL', 6) > 0
 
 
 def _generate_pdf_report(request_json):
-    """Generate PDF report from request data."""
+    """Generate PDF report from request data, optimised when ?optimize= or PDF_OPTIMIZE_TEMPLATES asks."""
     report_name = request_json.get('reportName', 'report')
     file_name = f'{report_name}.pdf'
     template_vars = request_json['templateVars']
     populate_page_number = bool(request_json.get('populatePageNumber', None))
+    try:
+        optimize = optimize_options(request_json.get('templateName'), request.args.get('optimize'))
+    except ValueError as e:
+        abort(HTTPStatus.BAD_REQUEST, str(e))
 
     if 'templateName' in request_json:
         template_name = request_json['templateName']
@@ -69,22 +153,67 @@ def _generate_pdf_report(request_json):
         except ValueError as e:
             abort(HTTPStatus.BAD_REQUEST, str(e))
     elif 'template' in request_json:
-        report = ReportService.create_report_from_template(
-            request_json['template'], template_vars, populate_page_number
-        )
+        try:
+            report = ReportService.create_report_from_template(
+                request_json['template'], template_vars, populate_page_number
+            )
+        except ReportRenderTimeoutError as e:
+            abort(HTTPStatus.GATEWAY_TIMEOUT, str(e))
     else:
         report = None
 
+    if report is not None and optimize is not None:
+        report = _optimize_report(report, optimize)
     return report, file_name
 
 
-def _create_response(report, file_name, content_type):
+def _optimize_report(report, options):
+    """Optimise a rendered PDF, keeping spooled reports spooled, and log its size before and after."""
+    optimized, result = optimize_pdf(report, options, new_spooled_pdf() if is_spooled(report) else None)
+    if optimized is not report and is_spooled(report):
+        report.close()
+    current_app.logger.info(
+        'report optimized: bytes_before=%s bytes_after=%s streams_deduplicated=%s images_downsampled=%s',
+        result.bytes_before, result.bytes_after, result.streams_deduplicated, result.images_downsampled,
+    )
+    return optimized
+
+
+def _spooled_pdf_response(report, content_disposition, started, mimetype='application/pdf'):
+    """Send a spooled PDF or archive with its length, through the server's file wrapper (sendfile once on disk)."""
+    size = pdf_size(report)
+    report.seek(0)
+    response = Response(
+        wrap_file(request.environ, report),
+        mimetype=mimetype,
+        direct_passthrough=True,
+        headers={
+            'Content-Disposition': content_disposition,
+            'Content-Length': str(size),
+        }
+    )
+    # The body starts as soon as the response is returned, so time to first byte is the render time;
+    # total also covers sending the file
+    logger = current_app.logger
+    ttfb = time.perf_counter() - started
+
+    def log_timing():
+        logger.info('report sent: bytes=%s ttfb=%.2fs total=%.2fs', size, ttfb, time.perf_counter() - started)
+
+    response.call_on_close(log_timing)
+    return response
+
+
+def _create_response(report, file_name, content_type, started=None, content_encoding=None):
     """Create streaming HTTP response with report data."""
     if report is None:
         abort(HTTPStatus.BAD_REQUEST, 'Report cannot be generated')
 
     content_disposition = f'attachment; filename="{file_name}"'  # noqa: E702
 
+    if content_type != 'text/csv' and is_spooled(report):
+        return _spooled_pdf_response(report, content_disposition, started or time.perf_counter())
+
     if content_type == 'text/csv':
         response_data = stream_with_context(report)
     else:
@@ -92,12 +221,17 @@ def _create_response(report, file_name, content_type):
             yield report
         response_data = stream_with_context(pdf_generator())
 
+    headers = {
+        'Content-Disposition': content_disposition
+    }
+    if content_type == 'text/csv':
+        headers['Vary'] = 'Accept-Encoding'
+    if content_encoding:
+        headers['Content-Encoding'] = content_encoding
     return Response(
         response_data,
         mimetype=content_type,
-        headers={
-            'Content-Disposition': content_disposition
-        }
+        headers=headers
     )
 
 
@@ -114,10 +248,121 @@ class Report(Resource):
     @_jwt.requires_auth
     def post():
         """Create a report."""
+        started = time.perf_counter()
         request_json = _parse_request_json()
         response_content_type = request.headers.get('Accept', 'application/pdf')
         if response_content_type == 'text/csv':
-            report, file_name = _generate_csv_report(request_json)
-        else:
+            compress = _accepts_gzip()
+            report, file_name = _generate_csv_report(request_json, compress)
+            return _create_response(
+                report, file_name, response_content_type, content_encoding='gzip' if compress else None
+            )
+        if request.mimetype == 'application/x-ndjson':
+            abort(HTTPStatus.BAD_REQUEST, 'NDJSON requests are only supported for text/csv reports')
+        trace, token = start_trace()
+        try:
             report, file_name = _generate_pdf_report(request_json)
-        return _create_response(report, file_name, response_content_type)
+        finally:
+            end_trace(token)
+        response = _create_response(report, file_name, response_content_type, started)
+        if current_app.config.get('RENDER_SERVER_TIMING', False):
+            response.headers['Server-Timing'] = trace.server_timing()
+        return response
+
+
+@API.route('/batch')
+class ReportBatch(Resource):
+    """Many small PDF reports rendered in one request."""
+
+    @staticmethod
+    @_jwt.requires_auth
+    def post():
+        """Render a batch of items into a zip archive, or one PDF bookmarked per item with Accept: application/pdf.
+
+        Failed items are listed in the Report-Batch-Errors header, and in manifest.json inside the archive.
+        """
+        started = time.perf_counter()
+        request_json = _parse_request_json()
+        items = request_json.get('items') if isinstance(request_json, dict) else request_json
+        merge = request.headers.get('Accept') == 'application/pdf'
+        try:
+            results = ReportBatchService.get().submit(items, request.url_root)
+        except ValueError as e:
+            abort(HTTPStatus.BAD_REQUEST, str(e))
+
+        output = new_spooled_pdf()
+        try:
+            manifest = (write_merged_pdf if merge else write_zip)(results, output)
+        except Exception:  # noqa: B902
+            output.close()
+            raise
+        errors = [{key: entry[key] for key in ('index', 'reportName', 'error')} for entry in manifest if entry['error']]
+        if len(errors) == len(manifest):
+            output.close()
+            body = {'message': 'No report in the batch could be generated', 'items': manifest}
+            return body, HTTPStatus.UNPROCESSABLE_ENTITY
+
+        report_name = (request_json.get('reportName') if isinstance(request_json, dict) else None) or 'reports'
+        file_name = f'{report_name}.pdf' if merge else f'{report_name}.zip'
+        response = _spooled_pdf_response(output, f'attachment; filename="{file_name}"', started,
+                                         mimetype='application/pdf' if merge else 'application/zip')
+        if errors:
+            response.headers['Report-Batch-Errors'] = json.dumps(errors)
+        return response
+
+
+@API.route('/jobs')
+class ReportJobs(Resource):
+    """Asynchronous report jobs."""
+
+    @staticmethod
+    @_jwt.requires_auth
+    def post():
+        """Queue a PDF report; poll the returned job or pass callbackUrl to be notified."""
+        request_json = _parse_request_json()
+        try:
+            state = ReportJobService.get().submit(request_json, request.url_root)
+        except TemplateNotFound:
+            abort(HTTPStatus.NOT_FOUND, 'Template not found')
+        except ValueError as e:
+            abort(HTTPStatus.BAD_REQUEST, str(e))
+        except ReportJobQueueFullError as e:
+            abort(HTTPStatus.SERVICE_UNAVAILABLE, str(e))
+        status_url = url_for('API.Reports_report_job', job_id=state['jobId'])
+        return job_response(state), HTTPStatus.ACCEPTED, {'Location': status_url}
+
+
+@API.route('/jobs/<string:job_id>')
+class ReportJob(Resource):
+    """Status of an asynchronous report job."""
+
+    @staticmethod
+    @_jwt.requires_auth
+    def get(job_id):
+        """Return the job's status."""
+        state = ReportJobService.get().status(job_id)
+        if state is None:
+            abort(HTTPStatus.NOT_FOUND, 'Report job not found')
+        return job_response(state), HTTPStatus.OK
+
+
+@API.route('/jobs/<string:job_id>/result')
+class ReportJobResult(Resource):
+    """PDF produced by an asynchronous report job."""
+
+    @staticmethod
+    @_jwt.requires_auth
+    def get(job_id):
+        """Return the finished PDF."""
+        service = ReportJobService.get()
+        state = service.status(job_id)
+        if state is None:
+            abort(HTTPStatus.NOT_FOUND, 'Report job not found')
+        if state['status'] != 'completed':
+            abort(HTTPStatus.CONFLICT, f'Report job is {state["status"]}')
+        return send_file(
+            service.spool.result_path(job_id),
+            mimetype='application/pdf',
+            as_attachment=True,
+            download_name=state['fileName'],
+        )
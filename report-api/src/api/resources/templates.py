@@ -14,7 +14,7 @@
 """Endpoints to check and manage payments."""
 from http import HTTPStatus
 
-from flask import Response, abort, request
+from flask import Response, abort, jsonify, request
 from flask_restx import Namespace, Resource
 from jinja2 import TemplateNotFound
 
@@ -33,11 +33,11 @@ class Templates(Resource):
         """Return all report-templates or returns specific html of a template."""
         template_name = request.args.get('name')
         if template_name is None:
-            templates = TemplateService.find_all_templates()
-            response = {'report-templates': templates}
+            templates, etag = TemplateService.find_all_templates_with_etag()
+            response = jsonify({'report-templates': templates})
         else:
             try:
-                html = TemplateService.get_stored_template(request.args.get('name'))
+                html, etag = TemplateService.get_stored_template_with_etag(request.args.get('name'))
                 response = Response(html, HTTPStatus.OK)
                 response.headers.set('Content-Disposition', 'attachment', filename={request.args.get('name')})
                 response.headers.set('Content-Type', 'application/html')
@@ -45,4 +45,7 @@ class Templates(Resource):
                 abort(HTTPStatus.NOT_FOUND, 'Template not found')
             except ValueError as e:
                 abort(HTTPStatus.BAD_REQUEST, str(e))
-        return response
+        # Clients revalidate with If-None-Match and get a 304 until a template changes on disk
+        response.set_etag(etag)
+        response.cache_control.no_cache = True
+        return response.make_conditional(request)
@@ -13,7 +13,7 @@
 # limitations under the License.
 """Exposes all of the Services used in the API."""
 
-from .csv_service import CsvService
+from .csv_service import CsvService, CsvStreamError
 from .report_service import ReportService
 from .template_service import TemplateService
 from .chunk_report_service import ChunkReportService
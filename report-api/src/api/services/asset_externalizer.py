@@ -0,0 +1,111 @@
+# Copyright © 2025 Province of British Columbia
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Move inline fonts, images and style blocks out of rendered HTML into Gotenberg asset files.
+
+Templates inline their fonts and images as base64 data URIs and their CSS as style blocks, so every
+chunk and footer batch repeats them. Each one is replaced by a relative URL to a file named after a
+hash of it, which Gotenberg serves to Chromium next to index.html. Only data URIs in src and
+href attributes and CSS url() references are moved, so text from the template vars is left alone, as
+is any data URI that is not valid base64. Decoded assets are cached by a digest of their base64 text,
+so a template's assets are only decoded once per process.
+"""
+import base64
+import binascii
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+
+
+DATA_URI_MIN_SIZE = 1024
+DATA_URI_CACHE_ENTRIES = 256
+STYLE_BLOCK_MIN_SIZE = 2048
+
+_DATA_URI = re.compile(
+    r'(?P<prefix>(?:\b(?:src|href|xlink:href)\s*=\s*|\burl\(\s*)["\']?)'
+    r'data:(?P<mime>[\w.+-]+/[\w.+-]+)(?:;[\w.+-]+=[\w.+-]+)*;base64,(?P<data>[A-Za-z0-9+/=]+)',
+    re.IGNORECASE,
+)
+_STYLE_BLOCK = re.compile(r'<style(?P<attrs>[^>]*)>(?P<css>.*?)</style>', re.DOTALL | re.IGNORECASE)
+_EXTENSIONS = {
+    'application/font-woff': 'woff',
+    'font/woff': 'woff',
+    'font/woff2': 'woff2',
+    'font/ttf': 'ttf',
+    'image/png': 'png',
+    'image/jpeg': 'jpg',
+    'image/gif': 'gif',
+    'image/svg+xml': 'svg',
+}
+
+
+def _asset_name(content: bytes, extension: str) -> str:
+    return f'{hashlib.sha256(content).hexdigest()[:20]}.{extension}'
+
+
+_decoded: 'OrderedDict[str, Tuple[str, bytes]]' = OrderedDict()
+_decoded_lock = threading.Lock()
+
+
+def _data_uri_asset(mime: str, data: str) -> Optional[Tuple[str, bytes]]:
+    """Decode a data URI's base64 once per process; None when it is not valid base64."""
+    digest = hashlib.sha256(data.encode('ascii')).hexdigest()
+    with _decoded_lock:
+        if digest in _decoded:
+            _decoded.move_to_end(digest)
+            return _decoded[digest]
+    try:
+        content = base64.b64decode(data, validate=True)
+    except binascii.Error:
+        return None
+    asset = f'{digest[:20]}.{_EXTENSIONS.get(mime, "bin")}', content
+    with _decoded_lock:
+        _decoded[digest] = asset
+        while len(_decoded) > DATA_URI_CACHE_ENTRIES:
+            _decoded.popitem(last=False)
+    return asset
+
+
+@lru_cache(maxsize=256)
+def _style_asset(css: str) -> Tuple[str, bytes]:
+    content = css.encode('utf-8')
+    return _asset_name(content, 'css'), content
+
+
+def externalize_assets(html_out: str) -> Tuple[str, Dict[str, bytes]]:
+    """Return html_out with large data URIs and style blocks replaced by asset files, and those files."""
+    assets: Dict[str, bytes] = {}
+
+    def replace_data_uri(match) -> str:
+        if len(match.group('data')) < DATA_URI_MIN_SIZE:
+            return match.group(0)
+        asset = _data_uri_asset(match.group('mime'), match.group('data'))
+        if asset is None:
+            return match.group(0)
+        name, content = asset
+        assets[name] = content
+        return match.group('prefix') + name
+
+    def replace_style_block(match) -> str:
+        if len(match.group('css')) < STYLE_BLOCK_MIN_SIZE:
+            return match.group(0)
+        name, content = _style_asset(match.group('css'))
+        assets[name] = content
+        return f'<link rel="stylesheet" href="{name}"{match.group("attrs")}>'
+
+    html_out = _DATA_URI.sub(replace_data_uri, html_out)
+    html_out = _STYLE_BLOCK.sub(replace_style_block, html_out)
+    return html_out, assets
@@ -0,0 +1,94 @@
+# Copyright © 2025 Province of British Columbia
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Pick the transaction rows per chunk for chunked statements from measured render cost.
+
+Each finished chunked report records its rows, HTML bytes and Gotenberg conversion seconds against its
+template. The planner aims for CHUNK_TARGET_PER_SLOT chunks per Gotenberg slot a report may use, but
+never below CHUNK_MIN_SECONDS of conversion work per chunk, so the fixed cost of each conversion stays
+small, and never above CHUNK_MAX_HTML_MB of HTML per chunk. Until a template has history, which is kept
+per worker process, statements are split into as few chunks of at most CHUNK_DEFAULT_ROWS rows as they
+fit in, so a short statement stays one conversion.
+"""
+import math
+import threading
+from typing import Dict, Optional, Tuple
+
+from flask import current_app
+
+
+MIN_CHUNK_ROWS = 20
+HISTORY_WEIGHT = 0.3  # weight of the newest report in the moving averages
+
+
+class RenderCostHistory:
+    """Moving averages of rows per conversion second and HTML bytes per row, per template."""
+
+    def __init__(self):
+        """Start with no history."""
+        self._costs: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, template_name: str, rows: int, html_bytes: int, convert_seconds: float):
+        """Fold one report's totals into the template's averages."""
+        if rows <= 0 or html_bytes <= 0 or convert_seconds <= 0:
+            return
+        rows_per_second, bytes_per_row = rows / convert_seconds, html_bytes / rows
+        with self._lock:
+            previous = self._costs.get(template_name)
+            if previous is not None:
+                rows_per_second = previous[0] + HISTORY_WEIGHT * (rows_per_second - previous[0])
+                bytes_per_row = previous[1] + HISTORY_WEIGHT * (bytes_per_row - previous[1])
+            self._costs[template_name] = (rows_per_second, bytes_per_row)
+
+    def estimate(self, template_name: str) -> Optional[Tuple[float, float]]:
+        """Return (rows per second, bytes per row) for the template, or None without history."""
+        with self._lock:
+            return self._costs.get(template_name)
+
+    def clear(self):
+        """Forget every template's history."""
+        with self._lock:
+            self._costs.clear()
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """Return the current averages per template."""
+        with self._lock:
+            return {
+                name: {'rows_per_second': rows_per_second, 'bytes_per_row': bytes_per_row}
+                for name, (rows_per_second, bytes_per_row) in self._costs.items()
+            }
+
+
+render_cost_history = RenderCostHistory()  # pylint: disable=invalid-name; lower case like the template registry
+
+
+def plan_chunk_rows(template_name: str, total_rows: int) -> int:
+    """Return the rows per chunk that split total_rows into roughly equal chunks for the template."""
+    if total_rows <= 0:
+        return 1
+    config = current_app.config
+    estimate = render_cost_history.estimate(template_name)
+    if estimate is None:
+        rows = min(total_rows, max(1, config.get('CHUNK_DEFAULT_ROWS', 500)))
+    else:
+        slots = max(1, config.get('GOTENBERG_MAX_IN_FLIGHT_PER_REQUEST', 4))
+        target_chunks = max(1, slots * config.get('CHUNK_TARGET_PER_SLOT', 2))
+        rows_per_second, bytes_per_row = estimate
+        lower = max(MIN_CHUNK_ROWS, int(rows_per_second * config.get('CHUNK_MIN_SECONDS', 1.0)))
+        upper = int(config.get('CHUNK_MAX_HTML_MB', 4) * 1024 * 1024 / bytes_per_row)
+        rows = min(max(math.ceil(total_rows / target_chunks), lower), max(lower, upper))
+
+    # Even out the chunks so the last one is not a small remainder
+    chunks = math.ceil(total_rows / rows)
+    return math.ceil(total_rows / chunks)
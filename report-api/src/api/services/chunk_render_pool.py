@@ -0,0 +1,94 @@
+# Copyright © 2025 Province of British Columbia
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Process pool that renders report templates away from the request worker."""
+import asyncio
+import functools
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+from flask import current_app
+
+from api.services.render_metrics import stage
+from api.services.template_registry import template_registry
+
+
+def _init_worker():
+    """Compile the templates once when a pool process starts."""
+    template_registry.precompile()
+
+
+def render_template(name: str, *args, **kwargs) -> str:
+    """Render a stored template in a pool process; arguments must be picklable."""
+    return template_registry.render(name, *args, **kwargs)
+
+
+class ChunkRenderPool:
+    """Worker processes shared by every request in a worker, used to render statement chunks.
+
+    Processes are spawned rather than forked so they never inherit the Gotenberg client's loop thread
+    or gevent state. Anything request bound, such as url_for values, must be resolved by the caller.
+    """
+
+    _instance: Optional['ChunkRenderPool'] = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, processes: int):
+        """Create a pool of processes; they start on first use."""
+        self.processes = max(1, processes)
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.processes,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+        )
+
+    @classmethod
+    def get(cls) -> Optional['ChunkRenderPool']:
+        """Return the process wide pool, or None when CHUNK_RENDER_PROCESSES turns it off."""
+        processes = current_app.config.get('CHUNK_RENDER_PROCESSES', 2)
+        if processes <= 0:
+            return None
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls(processes)
+            return cls._instance
+
+    @classmethod
+    def reset(cls, instance: Optional['ChunkRenderPool'] = None):
+        """Shut the process wide pool down so the next call to get builds a fresh one."""
+        with cls._instance_lock:
+            if cls._instance is not None and instance in (None, cls._instance):
+                cls._instance.close()
+                cls._instance = None
+
+    def close(self):
+        """Stop the pool processes, dropping renders that have not started."""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    async def render(self, name: str, *args, **kwargs) -> str:
+        """Render a stored template in a pool process without blocking the calling loop."""
+        loop = asyncio.get_running_loop()
+        try:
+            with stage('template_render') as record:
+                html_out = await loop.run_in_executor(
+                    self._executor, functools.partial(render_template, name, *args, **kwargs)
+                )
+                record.bytes_out = len(html_out)
+            return html_out
+        except BrokenProcessPool:
+            # A pool process died (e.g. OOM killed); replace the pool for later requests
+            ChunkRenderPool.reset(self)
+            raise
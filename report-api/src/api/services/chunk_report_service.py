@@ -14,29 +14,30 @@
 
 
 """Service for generating large reports using chunk approach."""
-import asyncio
+import functools
 import io
-import os
-import tempfile
 import time
 from dataclasses import asdict, dataclass
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple
 
 from flask import current_app, url_for
-from jinja2 import Environment, FileSystemLoader
 
+from api.services.chunk_planner import plan_chunk_rows, render_cost_history
+from api.services.chunk_render_pool import ChunkRenderPool
 from api.services.footer_service import add_page_numbers_to_pdf
-from api.services.gotenberg_service import GotenbergService
+from api.services.gotenberg_service import GotenbergService, HtmlSource
+from api.services.pdf_spool import PdfSource, is_spooled, new_spooled_pdf, save_pdf
+from api.services.render_metrics import nested_trace, stage
+from api.services.template_registry import template_registry
 from api.utils.util import TEMPLATE_FOLDER_PATH, sanitize_template_name
 
 
+ChunkPart = Tuple[Dict[str, Any], 'ChunkReportService.ChunkInfo']
+
+
 class ChunkReportService:  # pylint:disable=too-few-public-methods
     """Service for generating large reports using chunk approach."""
 
-    _TEMPLATE_ENV = Environment(
-        loader=FileSystemLoader('.'), autoescape=True
-    )
-
     @dataclass
     class ChunkInfo:
         """Chunk info for chunk report."""
@@ -47,89 +48,158 @@ class ChunkReportService:  # pylint:disable=too-few-public-methods
         slice_start: int = 0
         slice_end: int = 0
         invoice_chunks: Optional[int] = None
+        invoice_rows: int = 0
 
     @staticmethod
-    def _cleanup_temp_files(temp_files: List[str]):
-        """Clean up temporary files."""
-        for temp_file in temp_files:
-            if os.path.exists(temp_file):
-                os.unlink(temp_file)
+    def _append_pdf_bytes(pdf_content: bytes, out_pdf) -> None:
+        """Append every page of a rendered chunk to the output document."""
+        # Lazy import to avoid heavy module import in worker processes
+        from pikepdf import Pdf  # pylint:disable=import-outside-toplevel
+
+        with stage('merge', len(pdf_content)) as record, Pdf.open(io.BytesIO(pdf_content)) as src:
+            out_pdf.pages.extend(src.pages)
+            record.pages = len(src.pages)
 
     @staticmethod
-    def _merge_pdf_files(temp_files: List[str]) -> bytes:
-        """Merge multiple PDF files into one."""
-        # Lazy import to avoid heavy module import in worker processes
+    def _render_and_merge(
+        tasks: List[Tuple[int, HtmlSource]], window: int, output: Optional[BinaryIO] = None
+    ) -> PdfSource:
+        """Render chunks and append each one to the merged document as soon as it is next in order."""
         from pikepdf import Pdf  # pylint:disable=import-outside-toplevel
 
         with Pdf.new() as out_pdf:
-            for path in temp_files:
-                with Pdf.open(path) as src:
-                    out_pdf.pages.extend(src.pages)
-            buf = io.BytesIO()
-            out_pdf.save(buf)
-            return buf.getvalue()
+            for pdf_content in GotenbergService.iter_tasks_in_order(tasks, window):
+                ChunkReportService._append_pdf_bytes(pdf_content, out_pdf)
+            return save_pdf(out_pdf, output)
 
     @staticmethod
-    def _append_pdf_bytes(pdf_content: bytes, temp_files: List[str]) -> None:
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as temp_file:
-            temp_file.write(pdf_content)
-            temp_files.append(temp_file.name)
+    def _chunk_template(template_name: str) -> Tuple[str, Dict[str, str]]:
+        """Return the template path and the url_for values it needs, resolved in the request context."""
+        sanitized_name = sanitize_template_name(template_name)
+        urls = {
+            'bclogoUrl': url_for('static', filename='images/bcgov-logo-vert.jpg'),
+            'registriesurl': url_for('static', filename='images/reg_logo.png'),
+        }
+        return f'{TEMPLATE_FOLDER_PATH}/{sanitized_name}.html', urls
 
     @staticmethod
-    def _build_chunk_html(
-        template_name: str,
-        template_vars: Dict[str, Any],
-        invoice_copy: Dict[str, Any],
-        chunk_info: 'ChunkReportService.ChunkInfo',
-    ) -> str:
+    def _chunk_vars(template_vars: Dict[str, Any], parts: List[ChunkPart]) -> Dict[str, Any]:
+        """Return the template vars for one chunk; _chunk_info describes its first slice and lists every slice."""
         chunk_vars = template_vars.copy()
-        chunk_vars['grouped_invoices'] = [invoice_copy]
-        chunk_vars['_chunk_info'] = asdict(chunk_info)
+        chunk_vars['grouped_invoices'] = [invoice_copy for invoice_copy, _ in parts]
+        chunk_vars['_chunk_info'] = {**asdict(parts[0][1]), 'parts': [asdict(chunk_info) for _, chunk_info in parts]}
+        return chunk_vars
 
-        sanitized_name = sanitize_template_name(template_name)
-        template = ChunkReportService._TEMPLATE_ENV.get_template(
-            f'{TEMPLATE_FOLDER_PATH}/{sanitized_name}.html'
-        )
-        bc_logo_url = url_for('static', filename='images/bcgov-logo-vert.jpg')
-        registries_url = url_for('static', filename='images/reg_logo.png')
-        return template.render(
-            chunk_vars, bclogoUrl=bc_logo_url, registriesurl=registries_url
-        )
+    @staticmethod
+    def _build_chunk_html(template_name: str, template_vars: Dict[str, Any], parts: List[ChunkPart]) -> str:
+        template_path, urls = ChunkReportService._chunk_template(template_name)
+        with stage('template_render') as record:
+            html_out = template_registry.render(
+                template_path, ChunkReportService._chunk_vars(template_vars, parts), **urls
+            )
+            record.bytes_out = len(html_out)
+        return html_out
 
     @staticmethod
-    def _prepare_chunk_tasks(
-        template_name: str,
-        template_vars: Dict[str, Any],
-        grouped_invoices: List[Dict[str, Any]],
-        chunk_size: int,
-    ) -> List[Tuple[int, str]]:
-        """Prepare (order_id, html_out) tasks for all invoice transaction slices."""
-        tasks: List[Tuple[int, str]] = []
-        order_id = 0
+    def _plan_chunks(
+        grouped_invoices: List[Dict[str, Any]], chunk_size: int, pack: bool = True
+    ) -> List[List[ChunkPart]]:
+        """Split the invoices' transactions into chunks of chunk_size rows, in output order.
+
+        A chunk carries on into the next invoice when it has room, so each chunk is a list of invoice
+        slices. When pack is set, an invoice that fits in one chunk is never split: it starts a new chunk
+        if the current one is too full. Slices in a chunk holding several invoices are marked 'packed',
+        and every invoice copy carries its own _chunk_info.
+        """
+        chunk_size = max(1, chunk_size)
+        chunks: List[List[ChunkPart]] = []
+        current: List[ChunkPart] = []
+        room = chunk_size
         for invoice_index, original in enumerate(grouped_invoices, start=1):
             txns = original.get('transactions') or []
-            if not txns:
-                continue
+            if pack and current and room < len(txns) <= chunk_size:
+                chunks.append(current)
+                current, room = [], chunk_size
+            slices = []
             start = 0
             while start < len(txns):
-                end = min(start + chunk_size, len(txns))
+                end = min(start + room, len(txns))
                 invoice_copy = dict(original)
                 invoice_copy['transactions'] = txns[start:end]
-                html_out = ChunkReportService._build_chunk_html(
-                    template_name,
-                    template_vars,
-                    invoice_copy,
-                    ChunkReportService.ChunkInfo(
-                        invoice_index=invoice_index,
-                        current_chunk=(start // max(1, chunk_size)) + 1,
-                        slice_start=start + 1,
-                        slice_end=end,
-                    ),
+                chunk_info = ChunkReportService.ChunkInfo(
+                    invoice_index=invoice_index,
+                    current_chunk=len(slices) + 1,
+                    slice_start=start + 1,
+                    slice_end=end,
+                    invoice_rows=len(txns),
                 )
-                tasks.append((order_id, html_out))
-                order_id += 1
+                slices.append(chunk_info)
+                current.append((invoice_copy, chunk_info))
+                room -= end - start
                 start = end
-        return tasks
+                if room == 0:
+                    chunks.append(current)
+                    current, room = [], chunk_size
+            for chunk_info in slices:
+                chunk_info.invoice_chunks = len(slices)
+        if current:
+            chunks.append(current)
+
+        for parts in chunks:
+            for invoice_copy, chunk_info in parts:
+                if len(parts) > 1:
+                    chunk_info.mode = 'packed'
+                invoice_copy['_chunk_info'] = asdict(chunk_info)
+        return chunks
+
+    @staticmethod
+    def _prepare_chunk_tasks(
+        template_name: str,
+        template_vars: Dict[str, Any],
+        grouped_invoices: List[Dict[str, Any]],
+        chunk_size: int,
+        pack: bool = True,
+    ) -> List[Tuple[int, str]]:
+        """Prepare (order_id, html_out) tasks for every chunk of invoice transaction slices."""
+        return [
+            (order_id, ChunkReportService._build_chunk_html(template_name, template_vars, parts))
+            for order_id, parts in enumerate(ChunkReportService._plan_chunks(grouped_invoices, chunk_size, pack))
+        ]
+
+    @staticmethod
+    def _prepare_deferred_chunk_tasks(  # pylint: disable=too-many-arguments
+        template_name: str,
+        template_vars: Dict[str, Any],
+        grouped_invoices: List[Dict[str, Any]],
+        chunk_size: int,
+        pool: ChunkRenderPool,
+        *,
+        pack: bool = True,
+    ) -> List[Tuple[int, HtmlSource]]:
+        """Prepare (order_id, deferred html) tasks that render each chunk in the pool when scheduled."""
+        template_path, urls = ChunkReportService._chunk_template(template_name)
+        return [
+            (order_id, functools.partial(
+                pool.render, template_path, ChunkReportService._chunk_vars(template_vars, parts), **urls
+            ))
+            for order_id, parts in enumerate(ChunkReportService._plan_chunks(grouped_invoices, chunk_size, pack))
+        ]
+
+    @staticmethod
+    def _prepare_tasks(
+        template_name: str,
+        template_vars: Dict[str, Any],
+        grouped_invoices: List[Dict[str, Any]],
+        chunk_size: int,
+    ) -> List[Tuple[int, HtmlSource]]:
+        """Prepare tasks that render in the pool as the Gotenberg window reaches them, or up front without a pool."""
+        pack = current_app.config.get('CHUNK_PACK_INVOICES', True)
+        pool = ChunkRenderPool.get()
+        if pool is not None:
+            return ChunkReportService._prepare_deferred_chunk_tasks(
+                template_name, template_vars, grouped_invoices, chunk_size, pool, pack=pack
+            )
+        return ChunkReportService._prepare_chunk_tasks(template_name, template_vars, grouped_invoices, chunk_size, pack)
 
     @staticmethod
     def create_chunk_report(
@@ -137,38 +207,48 @@ class ChunkReportService:  # pylint:disable=too-few-public-methods
         template_vars: Dict[str, Any],
         generate_page_number: bool = False,
         chunk_size: Optional[int] = None,
-    ) -> bytes:
-        """Create large reports using chunking approach."""
+    ) -> PdfSource:
+        """Create large reports using chunking approach; returns a spooled file unless SPOOL_CHUNKED_REPORTS is off."""
         overall_start_time = time.time()
 
-        if chunk_size is None:
-            chunk_size = 500  # the optimal chunk size is 500 after testing
-
         grouped_invoices = template_vars.get('grouped_invoices', [])
-        temp_files: List[str] = []
-
-        # Build all chunk HTMLs ahead of time (keep order id)
-        tasks = ChunkReportService._prepare_chunk_tasks(
-            template_name, template_vars, grouped_invoices, chunk_size
-        )
-
-        base_url = current_app.root_path
-
-        # First pass: render all chunks to PDF bytes in parallel (no footers)
-        pdf_chunks = asyncio.run(
-            GotenbergService.render_tasks_parallel_async(tasks, base_url)
-        )
-
-        for pdf_content in pdf_chunks:
-            ChunkReportService._append_pdf_bytes(pdf_content, temp_files)
-
-        merged_pdf_without_footers = ChunkReportService._merge_pdf_files(temp_files)
-
-        ChunkReportService._cleanup_temp_files(temp_files)
-
-        result = add_page_numbers_to_pdf(template_vars, merged_pdf_without_footers, generate_page_number)
-
+        total_rows = sum(len(invoice.get('transactions') or []) for invoice in grouped_invoices)
+        if chunk_size is None:
+            chunk_size = plan_chunk_rows(template_name, total_rows)
+
+        # Large statements go through spooled files so the finished PDF is never one bytes object
+        spool_output = current_app.config.get('SPOOL_CHUNKED_REPORTS', True)
+
+        # First pass: render chunks in parallel (no footers), merging them in order as they arrive. The chunk
+        # stages are totalled on their own, so the cost history sees only this report's chunks.
+        with nested_trace() as chunk_trace:
+            tasks = ChunkReportService._prepare_tasks(template_name, template_vars, grouped_invoices, chunk_size)
+            merged_pdf_without_footers = ChunkReportService._render_and_merge(
+                tasks, current_app.config.get('CHUNK_REORDER_WINDOW', 8), new_spooled_pdf() if spool_output else None
+            )
+        try:
+            result = add_page_numbers_to_pdf(
+                template_vars, merged_pdf_without_footers, generate_page_number,
+                new_spooled_pdf() if spool_output else None,
+            )
+        finally:
+            if is_spooled(merged_pdf_without_footers):
+                merged_pdf_without_footers.close()
+
+        budget_stats = GotenbergService.memory_budget_stats()
+        html_bytes = chunk_trace.totals('template_render')['bytes_out']
+        convert = chunk_trace.totals('gotenberg_convert')
+        render_cost_history.record(template_name, total_rows, html_bytes, convert['seconds'])
         current_app.logger.info(
-            'chunk_report done: chunks=%s elapsed=%.1fs', len(tasks), time.time() - overall_start_time
+            'chunk_report done: chunks=%s rows_per_chunk=%s elapsed=%.1fs peak_in_flight=%.1fMB avg_in_flight=%.1fMB '
+            'html=%.1fMB sent=%.1fMB avg_convert=%.2fs',
+            len(tasks),
+            chunk_size,
+            time.time() - overall_start_time,
+            budget_stats['peak_in_flight_bytes'] / 1024 / 1024,
+            budget_stats['average_in_flight_bytes'] / 1024 / 1024,
+            html_bytes / 1024 / 1024,
+            convert['bytes_in'] / 1024 / 1024,
+            convert['seconds'] / max(1, convert['count']),
         )
         return result
@@ -12,34 +12,93 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-"""Service to  manage report-templates."""
+"""Service to  manage report-templates.
 
+CSV reports are streamed in blocks of about CSV_BLOCK_SIZE_KB rather than one chunk per row, and can be
+gzip compressed on the fly. Rows may come from a list or from any iterator, such as an NDJSON request body.
+
+Rows that fail to read before any CSV has been produced raise as they are, so the caller can still answer
+with an error status. Once the CSV has started, the stream ends with an ERROR_RECORD row giving the reason,
+still gzipped when compressing, and then raises CsvStreamError so the server drops the connection.
+"""
+
+import contextlib
 import csv
 import io
-from typing import Dict, Iterator
+import itertools
+import zlib
+from typing import Dict, Iterable, Iterator, List
+
+
+DEFAULT_BLOCK_SIZE = 64 * 1024
+ROWS_PER_WRITE = 256
+ERROR_RECORD = '#ERROR'
+
+
+class CsvStreamError(Exception):
+    """Raised after a streaming CSV has been ended with an error record."""
 
 
 class CsvService:  # pylint: disable=too-few-public-methods
     """Service for all template related operations."""
 
     @classmethod
-    def create_report(cls, payload: Dict) -> Iterator[bytes]:
-        """Create a streaming CSV report generator from the input parameters."""
+    def create_report(cls, payload: Dict, block_size: int = DEFAULT_BLOCK_SIZE, compress_level: int = 0
+                      ) -> Iterator[bytes]:
+        """Create a streaming CSV report generator from the input parameters.
+
+        Rows are written in blocks of about block_size bytes; a compress_level of 1-9 gzips the stream.
+        """
         columns = payload.get('columns', None)
         values = payload.get('values', None)
         if not columns:
             return
+        blocks = cls._csv_blocks(columns, values or (), block_size)
+        if compress_level:
+            blocks = cls._gzip_blocks(blocks, compress_level)
+        yield from blocks
 
+    @staticmethod
+    def _csv_blocks(columns: Iterable, values: Iterable, block_size: int) -> Iterator[bytes]:
         buffer = io.StringIO()
         writer = csv.writer(buffer)
-
         writer.writerow(columns)
-        yield buffer.getvalue().encode('utf-8')
-        buffer.seek(0)
-        buffer.truncate(0)
-
-        for row in values:
-            writer.writerow(row)
+        started = False
+        batch: List = []
+        try:
+            rows = iter(values)
+            # extend keeps the rows read before one fails, so they still make it into the CSV
+            batch.extend(itertools.islice(rows, ROWS_PER_WRITE))
+            while batch:
+                pending, batch = batch, []
+                writer.writerows(pending)
+                if buffer.tell() >= block_size:
+                    started = True
+                    yield buffer.getvalue().encode('utf-8')
+                    buffer.seek(0)
+                    buffer.truncate(0)
+                batch.extend(itertools.islice(rows, ROWS_PER_WRITE))
+        except Exception as err:  # noqa: B902 pylint: disable=broad-exception-caught
+            if not started:
+                raise
+            with contextlib.suppress(csv.Error):
+                writer.writerows(batch)
+            writer.writerow([ERROR_RECORD, f'Report ended early: {err}'])
             yield buffer.getvalue().encode('utf-8')
-            buffer.seek(0)
-            buffer.truncate(0)
+            raise CsvStreamError(str(err)) from err
+        if buffer.tell():
+            yield buffer.getvalue().encode('utf-8')
+
+    @staticmethod
+    def _gzip_blocks(blocks: Iterator[bytes], compress_level: int) -> Iterator[bytes]:
+        compressor = zlib.compressobj(compress_level, zlib.DEFLATED, 31)  # 31 selects the gzip container
+        try:
+            for block in blocks:
+                compressed = compressor.compress(block)
+                if compressed:
+                    yield compressed
+        except CsvStreamError:
+            # Close the gzip stream so the client can still read the error record
+            yield compressor.flush()
+            raise
+        yield compressor.flush()
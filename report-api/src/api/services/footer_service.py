@@ -13,28 +13,26 @@
 # limitations under the License.
 """Shared helpers for rendering footer in PDF documents."""
 
-import asyncio
 import io
-from io import BytesIO
-from typing import Any, Dict, List, Tuple
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple
 
 import pikepdf
 from flask import current_app
-from jinja2 import Environment, FileSystemLoader
 
+from api.services.footer_stamper import PAGE_NUMBER_SENTINEL_CSS_COLOR, PageNumberSlotNotFoundError, stamp_footer
 from api.services.gotenberg_service import GotenbergService
+from api.services.pdf_spool import PdfSource, copy_pdf, open_pdf, pdf_size, save_pdf
+from api.services.render_metrics import stage
+from api.services.template_registry import template_registry
 from api.utils.util import TEMPLATE_FOLDER_PATH
 
-_TEMPLATE_ENV = Environment(
-    loader=FileSystemLoader('.'), autoescape=True
-)
 
-
-def get_pdf_page_count(pdf_content: bytes) -> int:
+def get_pdf_page_count(pdf_content: PdfSource) -> int:
     """Extract total page count from PDF content."""
     try:
-        with pikepdf.Pdf.open(BytesIO(pdf_content)) as pdf:
-            return len(pdf.pages)
+        with stage('page_count', pdf_size(pdf_content)) as record, open_pdf(pdf_content) as pdf:
+            record.pages = len(pdf.pages)
+            return record.pages
     except Exception as e:  # noqa: B902 pylint: disable=broad-exception-caught
         current_app.logger.warning(f'Failed to get PDF page count: {e}')
         return 1
@@ -42,92 +40,107 @@ def get_pdf_page_count(pdf_content: bytes) -> int:
 
 def add_page_numbers_to_pdf(
     template_vars: Dict[str, Any],
-    merged_pdf_without_footers: bytes,
-    generate_page_number: bool
-) -> bytes:
-    """Add page numbers to PDF using footer generation logic."""
+    merged_pdf_without_footers: PdfSource,
+    generate_page_number: bool,
+    output: Optional[BinaryIO] = None,
+) -> PdfSource:
+    """Add page numbers to PDF using footer generation logic.
+
+    The PDF may be bytes or a file; the result is written to output when one is given, else returned as bytes.
+    """
     template_vars['generate_page_number'] = generate_page_number
     total_pages = get_pdf_page_count(merged_pdf_without_footers)
 
-    if total_pages > 500:
-        return _add_footer_to_first_page_only(template_vars, merged_pdf_without_footers, total_pages)
-
-    batch_tasks = _prepare_footer_batch_tasks(
-        template_vars, total_pages, batch_size=200
-    )
-    footer_multi_page_pdfs = asyncio.run(
-        GotenbergService.render_tasks_parallel_async(
-            batch_tasks, current_app.root_path
+    # Rendering a footer page per page through Gotenberg does not scale, so large documents are stamped natively.
+    native_threshold = current_app.config.get('FOOTER_NATIVE_PAGE_THRESHOLD', 500)
+    if current_app.config.get('FOOTER_STAMPING_MODE') == 'native' or total_pages > native_threshold:
+        try:
+            return _stamp_footer_natively(template_vars, merged_pdf_without_footers, total_pages, output)
+        except PageNumberSlotNotFoundError as e:
+            current_app.logger.warning(f'Page numbers not found in the footer template, rendering every footer: {e}')
+
+    with stage('footer_render') as record:
+        batch_tasks = _prepare_footer_batch_tasks(
+            template_vars, total_pages, batch_size=200
         )
-    )
-    footer_pdfs: List[bytes] = []
-    for pdf in footer_multi_page_pdfs:
-        footer_pdfs.extend(_split_pdf_pages(pdf))
+        record.bytes_out = sum(len(batch_html) for _, batch_html in batch_tasks)
+        record.pages = total_pages
+    footer_batch_pdfs = GotenbergService.render_tasks_parallel(batch_tasks, current_app.root_path)
 
-    result = _overlay_footer_pdfs_on_main_pdf(
-        merged_pdf_without_footers, footer_pdfs
-    )
+    return _overlay_footer_batches_on_main_pdf(merged_pdf_without_footers, footer_batch_pdfs, output)
 
-    return result
 
+def _stamp_footer_natively(
+    template_vars: Dict[str, Any], main_pdf: PdfSource, total_pages: int, output: Optional[BinaryIO] = None
+) -> PdfSource:
+    """Render the footer once and stamp it, with per page numbers, onto every page in one pass.
 
-def _add_footer_to_first_page_only(template_vars: Dict[str, Any], main_pdf_bytes: bytes, total_pages: int) -> bytes:
-    """Add footer only to the first page for large documents."""
-    batch_tasks = _prepare_footer_batch_tasks(template_vars, total_pages, batch_size=1, first_page_only=True)
+    Raises PageNumberSlotNotFoundError when the page numbers cannot be placed, so the caller can fall back.
+    """
+    sentinel_style = (
+        '<style>.statement-footer .footer-info span.page-number, .footer .footer-info span.page-number '
+        f'{{ color: {PAGE_NUMBER_SENTINEL_CSS_COLOR} !important; }}</style>'
+    )
+    with stage('footer_render') as record:
+        template_html = _build_footer_html(template_vars, [total_pages], total_pages, extra_style=sentinel_style)
+        record.bytes_out = len(template_html)
+    template_pdf = GotenbergService.convert_html_to_pdf_sync(template_html)
+    try:
+        with stage('footer_stamp', pdf_size(main_pdf)) as record:
+            record.pages = total_pages
+            return stamp_footer(main_pdf, template_pdf, bool(template_vars.get('generate_page_number')), output)
+    except PageNumberSlotNotFoundError:
+        raise
+    except Exception as e:  # noqa: B902 pylint: disable=broad-exception-caught
+        current_app.logger.error(f'Error stamping footer: {e}')
+        return copy_pdf(main_pdf, output)
 
-    footer_multi_page_pdfs = asyncio.run(
-        GotenbergService.render_tasks_parallel_async(
-            batch_tasks, current_app.root_path
-        )
+
+def _build_footer_html(
+    template_args: dict,
+    page_numbers,
+    total_pages: int,
+    extra_style: str = ''
+) -> str:
+    """Build one HTML document with a full page footer for each of page_numbers."""
+    footer_template = template_registry.get_template(
+        f'{TEMPLATE_FOLDER_PATH}/generic_footer.html'
     )
+    overlay_style = template_registry.render(
+        f'{TEMPLATE_FOLDER_PATH}/styles/footer_overlay.html'
+    )
+
+    html_parts = ['<!DOCTYPE html><html><head>']
 
-    if not footer_multi_page_pdfs:
-        return main_pdf_bytes
+    html_parts.append(overlay_style)
+    html_parts.append(extra_style)
+    html_parts.append('</head><body>')
 
-    first_page_footer = _split_pdf_pages(footer_multi_page_pdfs[0])[0]
+    for page_num in page_numbers:
+        page_args = template_args.copy()
+        page_args['current_page'] = page_num
+        page_args['total_pages'] = total_pages
 
-    footer_pdfs = [first_page_footer]
+        html_parts.append(
+            f'<div class="footer-page" id="footer-page-{page_num}">'
+            f'<div class="footer-anchor">{footer_template.render(page_args)}</div></div>'
+        )
 
-    return _overlay_footer_pdfs_on_main_pdf(main_pdf_bytes, footer_pdfs)
+    html_parts.append('</body></html>')
+    return ''.join(html_parts)
 
 
 def _prepare_footer_batch_tasks(
     template_args: dict,
     total_pages: int,
-    batch_size: int = 200,
-    first_page_only: bool = False
+    batch_size: int = 200
 ) -> List[Tuple[int, str]]:
     """Prepare footer batch tasks."""
-    footer_template = _TEMPLATE_ENV.get_template(
-        f'{TEMPLATE_FOLDER_PATH}/generic_footer.html'
-    )
-    overlay_style = _TEMPLATE_ENV.get_template(
-        f'{TEMPLATE_FOLDER_PATH}/styles/footer_overlay.html'
-    ).render()
-
     tasks: List[Tuple[int, str]] = []
     batch_id = 0
-    total_pages_to_process = 1 if first_page_only else total_pages
-    for batch_start in range(1, total_pages_to_process + 1, batch_size):
-        batch_end = min(batch_start + batch_size, total_pages_to_process + 1)
-
-        batch_html_parts = ['<!DOCTYPE html><html><head>']
-
-        batch_html_parts.append(overlay_style)
-        batch_html_parts.append('</head><body>')
-
-        for page_num in range(batch_start, batch_end):
-            page_args = template_args.copy()
-            page_args['current_page'] = page_num
-            page_args['total_pages'] = total_pages
-
-            batch_html_parts.append(
-                f'<div class="footer-page" id="footer-page-{page_num}">'
-                f'<div class="footer-anchor">{footer_template.render(page_args)}</div></div>'
-            )
-
-        batch_html_parts.append('</body></html>')
-        batch_html = ''.join(batch_html_parts)
+    for batch_start in range(1, total_pages + 1, batch_size):
+        batch_end = min(batch_start + batch_size, total_pages + 1)
+        batch_html = _build_footer_html(template_args, range(batch_start, batch_end), total_pages)
 
         tasks.append((batch_id, batch_html))
         batch_id += 1
@@ -135,54 +148,36 @@ def _prepare_footer_batch_tasks(
     return tasks
 
 
-def _split_pdf_pages(pdf_bytes: bytes) -> List[bytes]:
-    """Split a multi-page PDF into individual page PDFs."""
-    individual_pdfs = []
-
-    try:
-        with pikepdf.Pdf.open(io.BytesIO(pdf_bytes)) as pdf:
-            for page in pdf.pages:
-                single_page_pdf = pikepdf.Pdf.new()
-                single_page_pdf.pages.append(page)
-
-                output_buffer = io.BytesIO()
-                single_page_pdf.save(output_buffer)
-                individual_pdfs.append(output_buffer.getvalue())
-
-    except Exception as e:  # noqa: B902
-        current_app.logger.error(f'Error splitting PDF pages: {e}')
-        raise
-
-    return individual_pdfs
+def _overlay_footer_batches_on_main_pdf(
+    main_pdf_source: PdfSource, footer_batch_pdfs: List[bytes], output: Optional[BinaryIO] = None
+) -> PdfSource:
+    """Overlay footer pages onto the main PDF, reading them straight from the open batch documents.
 
-
-def _overlay_footer_pdfs_on_main_pdf(
-    main_pdf_bytes: bytes, footer_pdfs: list
-) -> bytes:
-    """Overlay footer PDFs onto each page of the main PDF."""
+    Footer page n of the concatenated batches is overlaid on main page n; no page is split out and
+    re-parsed on its own.
+    """
     try:
-        with pikepdf.Pdf.open(io.BytesIO(main_pdf_bytes)) as main_pdf:
-            result_pdf = pikepdf.Pdf.new()
-
-            for i, main_page in enumerate(main_pdf.pages):
-                result_pdf.pages.append(main_page)
-                new_page = result_pdf.pages[-1]  # Get the newly added page
-
-                has_footer_pdf = i < len(footer_pdfs)
-                if has_footer_pdf:
-                    with pikepdf.Pdf.open(io.BytesIO(footer_pdfs[i])) as footer_pdf:
-                        if len(footer_pdf.pages) > 0:
-                            footer_page = footer_pdf.pages[0]
-                            page_width, band_height = _prepare_footer_page_for_overlay(footer_page, new_page)
-                            _overlay_page_content(new_page, footer_page, page_width=page_width, band_height=band_height)
-
-            output_buffer = io.BytesIO()
-            result_pdf.save(output_buffer)
-            return output_buffer.getvalue()
+        with stage('overlay', pdf_size(main_pdf_source) + sum(map(len, footer_batch_pdfs))) as record, \
+                open_pdf(main_pdf_source) as main_pdf:
+            record.pages = len(main_pdf.pages)
+            footer_docs = []
+            try:
+                for batch_pdf in footer_batch_pdfs:
+                    footer_docs.append(pikepdf.Pdf.open(io.BytesIO(batch_pdf)))
+                footer_pages = (page for footer_doc in footer_docs for page in footer_doc.pages)
+
+                for main_page, footer_page in zip(main_pdf.pages, footer_pages):
+                    page_width, band_height = _prepare_footer_page_for_overlay(footer_page, main_page)
+                    _overlay_page_content(main_page, footer_page, page_width=page_width, band_height=band_height)
+
+                return save_pdf(main_pdf, output)
+            finally:
+                for footer_doc in footer_docs:
+                    footer_doc.close()
 
     except Exception as e:  # noqa: B902 pylint: disable=broad-exception-caught
         current_app.logger.error(f'Error overlaying footer PDFs: {e}')
-        return main_pdf_bytes
+        return copy_pdf(main_pdf_source, output)
 
 
 def _prepare_footer_page_for_overlay(footer_page, base_page) -> tuple:
@@ -0,0 +1,264 @@
+# Copyright © 2025 Province of British Columbia
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Native footer stamping from a single rendered footer template.
+
+The footer template is rendered once with its page number drawn in a sentinel colour. That text is
+located in the content stream, removed, and the rest of the page becomes a Form XObject shared by
+every page. Page numbers are then drawn per page with an embedded BCSans subset, right aligned to
+where the template put them.
+"""
+import io
+import logging
+import math
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import BinaryIO, Dict, List, Optional, Tuple
+
+import pikepdf
+
+from api.services.pdf_spool import PdfSource, copy_pdf, open_pdf, save_pdf
+from api.utils.util import TEMPLATE_FOLDER_PATH
+
+
+FOOTER_BAND_HEIGHT = 90.0  # footer band; spacious for logo + page number
+FOOTER_FONT_PATH = f'{TEMPLATE_FOLDER_PATH}fonts/BCSans/BCSans-Regular.woff'
+PAGE_NUMBER_CHARS = 'Page of0123456789'
+PAGE_NUMBER_COLOR = (0x23 / 255, 0x40 / 255, 0x75 / 255)  # matches .footer-info span:last-child
+# The footer template draws its page number in this colour so it can be found in the content stream.
+PAGE_NUMBER_SENTINEL_CSS_COLOR = 'rgb(1, 2, 3)'
+PAGE_NUMBER_SENTINEL_COLOR = (1 / 255, 2 / 255, 3 / 255)
+
+_IDENTITY = (1.0, 0.0, 0.0, 1.0, 0.0, 0.0)
+_TEXT_SHOWING_OPERATORS = ('Tj', 'TJ', "'", '"')
+# Helvetica widths, used only when the BCSans font cannot be loaded
+_HELVETICA_WIDTHS = {'P': 667, 'a': 556, 'g': 556, 'e': 556, ' ': 278, 'o': 556, 'f': 278, **{
+    str(digit): 556 for digit in range(10)
+}}
+
+
+class PageNumberSlotNotFoundError(Exception):
+    """Raised when page numbers are wanted but the footer template has no sentinel coloured page number."""
+
+
+@dataclass
+class PageNumberSlot:
+    """Where the footer template draws its page number, in page space."""
+
+    right_edge: float
+    baseline: float
+    font_size: float
+    color: Tuple[float, float, float] = PAGE_NUMBER_COLOR
+
+
+@dataclass
+class FooterFont:
+    """Metrics and font program for the page number text."""
+
+    base_font: str
+    widths: Dict[str, float]
+    font_file: Optional[bytes] = None
+    bbox: List[float] = field(default_factory=lambda: [0, -200, 1000, 900])
+    ascent: float = 900
+    descent: float = -200
+    cap_height: float = 700
+
+    def text_width(self, text: str, font_size: float) -> float:
+        """Return the advance width of text at font_size, in points."""
+        return sum(self.widths.get(char, 556) for char in text) * font_size / 1000
+
+
+@lru_cache(maxsize=1)
+def load_footer_font() -> FooterFont:
+    """Subset BCSans to the page number characters once per process; fall back to Helvetica."""
+    try:
+        from fontTools import subset  # pylint: disable=import-outside-toplevel
+        from fontTools.ttLib import TTFont  # pylint: disable=import-outside-toplevel
+
+        logging.getLogger('fontTools').setLevel(logging.WARNING)
+        font = TTFont(FOOTER_FONT_PATH)
+        subsetter = subset.Subsetter(subset.Options())
+        subsetter.populate(text=PAGE_NUMBER_CHARS)
+        subsetter.subset(font)
+        font.flavor = None
+        buf = io.BytesIO()
+        font.save(buf)
+
+        scale = 1000 / font['head'].unitsPerEm
+        cmap = font.getBestCmap()
+        widths = {char: font['hmtx'][cmap[ord(char)]][0] * scale for char in PAGE_NUMBER_CHARS if ord(char) in cmap}
+        head = font['head']
+        return FooterFont(
+            base_font='RPTFTR+BCSans-Regular',
+            widths=widths,
+            font_file=buf.getvalue(),
+            bbox=[head.xMin * scale, head.yMin * scale, head.xMax * scale, head.yMax * scale],
+            ascent=font['hhea'].ascent * scale,
+            descent=font['hhea'].descent * scale,
+            cap_height=getattr(font['OS/2'], 'sCapHeight', 700) * scale,
+        )
+    except Exception:  # noqa: B902 pylint: disable=broad-exception-caught
+        return FooterFont(base_font='Helvetica', widths=_HELVETICA_WIDTHS)
+
+
+def _multiply(first, second) -> Tuple[float, ...]:
+    """Multiply two PDF matrices [a b c d e f]."""
+    a1, b1, c1, d1, e1, f1 = first
+    a2, b2, c2, d2, e2, f2 = second
+    return (
+        a1 * a2 + b1 * c2, a1 * b2 + b1 * d2,
+        c1 * a2 + d1 * c2, c1 * b2 + d1 * d2,
+        e1 * a2 + f1 * c2 + e2, e1 * b2 + f1 * d2 + f2,
+    )
+
+
+def _fill_color(operands) -> Optional[Tuple[float, ...]]:
+    values = [float(operand) for operand in operands if not isinstance(operand, pikepdf.Name)]
+    if len(values) == 1:
+        return (values[0],) * 3
+    if len(values) == 3:
+        return tuple(values)
+    return None
+
+
+def _is_sentinel(color) -> bool:
+    return color is not None and all(
+        abs(value - expected) < 0.002 for value, expected in zip(color, PAGE_NUMBER_SENTINEL_COLOR)
+    )
+
+
+def extract_page_number_slot(  # pylint: disable=too-many-locals
+    pdf: pikepdf.Pdf, page: pikepdf.Page, sentinel_text: str, font: FooterFont
+) -> Optional[PageNumberSlot]:
+    """Remove the sentinel coloured page number text from page and return where it was drawn."""
+    instructions = pikepdf.parse_content_stream(page)
+    ctm, ctm_stack = _IDENTITY, []
+    text_matrix = line_matrix = _IDENTITY
+    fill, font_size = None, 0.0
+    slot_x, slot_y, slot_size = math.inf, 0.0, 0.0
+    kept = []
+
+    for operands, operator in instructions:
+        name = str(operator)
+        if name == 'q':
+            ctm_stack.append(ctm)
+        elif name == 'Q':
+            ctm = ctm_stack.pop() if ctm_stack else _IDENTITY
+        elif name == 'cm':
+            ctm = _multiply([float(value) for value in operands], ctm)
+        elif name in ('rg', 'g', 'sc', 'scn'):
+            fill = _fill_color(operands)
+        elif name == 'BT':
+            text_matrix = line_matrix = _IDENTITY
+        elif name == 'Tf':
+            font_size = float(operands[1])
+        elif name == 'Tm':
+            text_matrix = line_matrix = tuple(float(value) for value in operands)
+        elif name in ('Td', 'TD'):
+            line_matrix = _multiply((1, 0, 0, 1, float(operands[0]), float(operands[1])), line_matrix)
+            text_matrix = line_matrix
+        elif name in _TEXT_SHOWING_OPERATORS and _is_sentinel(fill):
+            rendering = _multiply(text_matrix, ctm)
+            if rendering[4] < slot_x:
+                slot_x, slot_y = rendering[4], rendering[5]
+                slot_size = font_size * math.sqrt(abs(rendering[0] * rendering[3] - rendering[1] * rendering[2]))
+            continue
+        kept.append((operands, operator))
+
+    if slot_x == math.inf:
+        return None
+
+    page.Contents = pdf.make_stream(pikepdf.unparse_content_stream(kept))
+    return PageNumberSlot(
+        right_edge=slot_x + font.text_width(sentinel_text, slot_size),
+        baseline=slot_y,
+        font_size=slot_size,
+    )
+
+
+def _make_font_dict(pdf: pikepdf.Pdf, font: FooterFont) -> pikepdf.Object:
+    """Add the page number font to pdf once and return its indirect dictionary."""
+    if font.font_file is None:
+        return pdf.make_indirect(pikepdf.Dictionary(
+            Type=pikepdf.Name.Font, Subtype=pikepdf.Name.Type1,
+            BaseFont=pikepdf.Name('/' + font.base_font), Encoding=pikepdf.Name.WinAnsiEncoding,
+        ))
+    first_char, last_char = 32, 126
+    widths = [font.widths.get(chr(code), 0) for code in range(first_char, last_char + 1)]
+    descriptor = pikepdf.Dictionary(
+        Type=pikepdf.Name.FontDescriptor,
+        FontName=pikepdf.Name('/' + font.base_font),
+        Flags=32,
+        FontBBox=font.bbox,
+        ItalicAngle=0,
+        Ascent=font.ascent,
+        Descent=font.descent,
+        CapHeight=font.cap_height,
+        StemV=80,
+        FontFile2=pdf.make_stream(font.font_file),
+    )
+    return pdf.make_indirect(pikepdf.Dictionary(
+        Type=pikepdf.Name.Font, Subtype=pikepdf.Name.TrueType,
+        BaseFont=pikepdf.Name('/' + font.base_font), Encoding=pikepdf.Name.WinAnsiEncoding,
+        FirstChar=first_char, LastChar=last_char, Widths=widths,
+        FontDescriptor=pdf.make_indirect(descriptor),
+    ))
+
+
+def _page_number_stream(font_name: str, slot: PageNumberSlot, font: FooterFont, text: str) -> bytes:
+    x = slot.right_edge - font.text_width(text, slot.font_size)
+    red, green, blue = slot.color
+    return (
+        f'q {red:.4f} {green:.4f} {blue:.4f} rg BT {font_name} {slot.font_size:.2f} Tf '
+        f'{x:.2f} {slot.baseline:.2f} Td ({text}) Tj ET Q'
+    ).encode('ascii')
+
+
+def stamp_footer(main_pdf_source: PdfSource, template_pdf_bytes: bytes,  # pylint: disable=too-many-locals
+                 generate_page_number: bool, output: Optional[BinaryIO] = None) -> PdfSource:
+    """Overlay the footer template and per page numbers on every page of the main PDF in one pass.
+
+    Each page gets the footer sized to its own media box. Raises PageNumberSlotNotFoundError when
+    page numbers are wanted but cannot be found in the template, rather than leaving them out.
+    The result is written to output when one is given, otherwise it is returned as bytes.
+    """
+    font = load_footer_font()
+    with open_pdf(main_pdf_source) as main_pdf, \
+            pikepdf.Pdf.open(io.BytesIO(template_pdf_bytes)) as template_pdf:
+        total_pages = len(main_pdf.pages)
+        if total_pages == 0 or len(template_pdf.pages) == 0:
+            return copy_pdf(main_pdf_source, output)
+
+        template_page = template_pdf.pages[0]
+        slot = None
+        if generate_page_number:
+            slot = extract_page_number_slot(template_pdf, template_page, f'Page {total_pages} of {total_pages}', font)
+            if slot is None:
+                raise PageNumberSlotNotFoundError('No sentinel coloured page number in the footer template')
+
+        footer_forms: Dict[Tuple[float, float], pikepdf.Object] = {}
+        font_dict = _make_font_dict(main_pdf, font) if slot else None
+
+        for page_number, page in enumerate(main_pdf.pages, start=1):
+            page_size = (float(page.mediabox[2]), float(page.mediabox[3]))
+            if page_size not in footer_forms:
+                template_page.MediaBox = pikepdf.Array([0, 0, *page_size])
+                template_page.CropBox = pikepdf.Array([0, 0, page_size[0], FOOTER_BAND_HEIGHT])
+                footer_forms[page_size] = main_pdf.copy_foreign(template_page.as_form_xobject())
+            page.add_overlay(footer_forms[page_size], rect=pikepdf.Rectangle(0, 0, page_size[0], FOOTER_BAND_HEIGHT))
+            if slot:
+                font_name = page.add_resource(font_dict, pikepdf.Name.Font, prefix='FtrPn')
+                text = f'Page {page_number} of {total_pages}'
+                page.contents_add(main_pdf.make_stream(_page_number_stream(font_name, slot, font, text)))
+
+        return save_pdf(main_pdf, output)
@@ -0,0 +1,313 @@
+# Copyright © 2025 Province of British Columbia
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Long-lived, bounded-concurrency client for the Gotenberg PDF service."""
+import asyncio
+import contextlib
+import random
+import threading
+import time
+from typing import AsyncIterator, Dict, Iterator, Optional
+
+import aiohttp
+from flask import current_app
+
+from api.services.asset_externalizer import externalize_assets
+from api.services.gotenberg_endpoints import GotenbergEndpoint, GotenbergEndpoints
+from api.services.memory_budget import MemoryBudget
+from api.services.render_metrics import record_stage, stage
+
+RETRYABLE_STATUSES = (429, 503)
+MAX_RETRY_DELAY = 30.0
+# Errors that say nothing about the document, so the conversion is tried again on another endpoint
+FAILOVER_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError)
+WARMUP_HTML = b'<!doctype html><html><body><p>warm-up</p></body></html>'
+
+
+class GotenbergClient:  # pylint: disable=too-many-instance-attributes
+    """Gotenberg client shared by every request in a worker process.
+
+    The client owns a background event loop holding one pooled aiohttp session, so connections are
+    reused across requests. A process wide semaphore caps the conversions in flight and callers can
+    add a per request cap on top of it; waiters on both are admitted in FIFO order.
+
+    url may list several Gotenberg endpoints, comma separated. Conversions are routed to the least loaded
+    one, failed conversions are tried again on another, and a background task probes each endpoint's
+    health and sends a warm-up conversion to any that starts or comes back cold.
+    """
+
+    _instance: Optional['GotenbergClient'] = None
+    _instance_lock = threading.Lock()
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        url: str,
+        *,
+        max_in_flight: int = 6,
+        max_in_flight_per_request: int = 4,
+        pool_size: int = 10,
+        max_retries: int = 3,
+        retry_backoff: float = 0.5,
+        timeout: int = 500,
+        memory_budget_bytes: int = 256 * 1024 * 1024,
+        externalize: bool = True,
+        health_interval: float = 0,
+        health_timeout: float = 2,
+        warmup: bool = False,
+        eject_failures: int = 3,
+        eject_seconds: float = 30.0,
+    ):
+        """Start the client loop; the session and semaphore are created lazily on that loop.
+
+        Health is probed every health_interval seconds (0 never probes), and with warmup each endpoint
+        gets a warm-up conversion before it is preferred for real ones.
+        """
+        self.endpoints = GotenbergEndpoints(url, eject_failures=eject_failures, eject_seconds=eject_seconds,
+                                            warmup=warmup)
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+        self.warmup = warmup
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_in_flight_per_request = max(1, max_in_flight_per_request)
+        self.pool_size = max(1, pool_size)
+        self.max_retries = max(0, max_retries)
+        self.retry_backoff = retry_backoff
+        self.timeout = timeout
+        self.memory_budget = MemoryBudget(memory_budget_bytes)
+        self.externalize = externalize
+        self._payload_stats = {'conversions': 0, 'html_bytes': 0, 'sent_bytes': 0, 'convert_seconds': 0.0}
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._limiter: Optional[asyncio.Semaphore] = None
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name='gotenberg-client', daemon=True)
+        self._thread.start()
+        self._health_task: Optional[asyncio.Task] = None
+        if health_interval > 0 or warmup:
+            self._health_task = self.run(self._start_health_checks())
+
+    @classmethod
+    def init_app(cls, app):
+        """Create the client at startup when GOTENBERG_WARMUP is set, so endpoints warm up before requests."""
+        if app.config.get('GOTENBERG_WARMUP', False):
+            with app.app_context():
+                cls.get()
+
+    @classmethod
+    def get(cls) -> 'GotenbergClient':
+        """Return the process wide client, creating it from the app config on first use."""
+        with cls._instance_lock:
+            if cls._instance is None:
+                config = current_app.config
+                cls._instance = cls(
+                    url=config.get('GOTENBERG_URL'),
+                    max_in_flight=config.get('GOTENBERG_MAX_IN_FLIGHT', 6),
+                    max_in_flight_per_request=config.get('GOTENBERG_MAX_IN_FLIGHT_PER_REQUEST', 4),
+                    pool_size=config.get('GOTENBERG_POOL_SIZE', 10),
+                    max_retries=config.get('GOTENBERG_MAX_RETRIES', 3),
+                    retry_backoff=config.get('GOTENBERG_RETRY_BACKOFF', 0.5),
+                    timeout=config.get('GOTENBERG_TIMEOUT', 500),
+                    memory_budget_bytes=config.get('RENDER_MEMORY_BUDGET_MB', 256) * 1024 * 1024,
+                    externalize=config.get('GOTENBERG_EXTERNALIZE_ASSETS', True),
+                    health_interval=config.get('GOTENBERG_HEALTH_INTERVAL', 10),
+                    health_timeout=config.get('GOTENBERG_HEALTH_TIMEOUT', 2),
+                    warmup=config.get('GOTENBERG_WARMUP', False),
+                    eject_failures=config.get('GOTENBERG_EJECT_FAILURES', 3),
+                    eject_seconds=config.get('GOTENBERG_EJECT_SECONDS', 30),
+                )
+            return cls._instance
+
+    @classmethod
+    def reset(cls):
+        """Close the process wide client so the next call to get builds a fresh one."""
+        with cls._instance_lock:
+            if cls._instance is not None:
+                cls._instance.close()
+                cls._instance = None
+
+    def close(self):
+        """Stop health checks, close the pooled session and stop the client loop."""
+        if self._health_task is not None:
+            self.run(self._stop_health_checks())
+        if self._session is not None:
+            self.run(self._session.close())
+            self._session = None
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+        self._loop.close()
+
+    def run(self, coro):
+        """Run a coroutine on the client loop and block the calling thread until it finishes."""
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    def iterate(self, agen: AsyncIterator) -> Iterator:
+        """Drive an async generator on the client loop, handing each item to the calling thread."""
+        try:
+            while True:
+                try:
+                    yield self.run(anext(agen))
+                except StopAsyncIteration:
+                    return
+        finally:
+            self.run(agen.aclose())
+
+    def request_limiter(self) -> asyncio.Semaphore:
+        """Return a semaphore enforcing the per request cap; call it from the client loop."""
+        return asyncio.Semaphore(self.max_in_flight_per_request)
+
+    async def convert_html(self, html_out: str, request_limiter: Optional[asyncio.Semaphore] = None) -> bytes:
+        """Convert an HTML document to PDF bytes, backing off and retrying while Gotenberg is busy.
+
+        Inline fonts, images and style blocks are sent as separate asset files when externalize is set.
+        """
+        html_bytes = len(html_out)
+        assets: Dict[str, bytes] = {}
+        if self.externalize:
+            html_out, assets = externalize_assets(html_out)
+        html_data = html_out.encode('utf-8')
+        sent_bytes = len(html_data) + sum(map(len, assets.values()))
+        attempt = 0
+        while True:
+            queued = time.perf_counter()
+            async with request_limiter or contextlib.nullcontext():
+                async with self._get_limiter():
+                    start = time.perf_counter()
+                    record_stage('gotenberg_queue', start - queued)
+                    with stage('gotenberg_convert', sent_bytes) as record:
+                        status, body, retry_after = await self._post_or_fail_over(html_data, assets, attempt)
+                        record.bytes_out = len(body)
+            if status == 200:
+                self._record_payload(html_bytes, sent_bytes, time.perf_counter() - start)
+                return body
+            if not self._should_retry(status, attempt):
+                raise Exception(  # pylint: disable=broad-exception-raised
+                    f'Gotenberg conversion failed with status {status}: '
+                    f'{body.decode("utf-8", errors="replace")}'
+                )
+            if status in RETRYABLE_STATUSES:
+                await asyncio.sleep(self._backoff_delay(attempt, retry_after))
+            attempt += 1
+
+    def payload_stats(self) -> Dict[str, float]:
+        """Return totals for successful conversions: HTML bytes rendered, bytes sent, seconds converting."""
+        return dict(self._payload_stats)
+
+    def _record_payload(self, html_bytes: int, sent_bytes: int, seconds: float):
+        self._payload_stats['conversions'] += 1
+        self._payload_stats['html_bytes'] += html_bytes
+        self._payload_stats['sent_bytes'] += sent_bytes
+        self._payload_stats['convert_seconds'] += seconds
+
+    def endpoint_stats(self):
+        """Return each endpoint's routing state and totals."""
+        return self.endpoints.stats()
+
+    async def _post_or_fail_over(self, html_data: bytes, assets: Dict[str, bytes], attempt: int):
+        """Post one conversion; with other endpoints to try, a connection error comes back as status None."""
+        try:
+            return await self._post(html_data, assets)
+        except FAILOVER_ERRORS as err:
+            if len(self.endpoints) < 2 or attempt >= self.max_retries:
+                raise
+            return None, str(err).encode('utf-8'), None
+
+    def _should_retry(self, status: Optional[int], attempt: int) -> bool:
+        """Retry while Gotenberg is busy, and on server errors when another endpoint can take the conversion."""
+        if attempt >= self.max_retries:
+            return False
+        return status in RETRYABLE_STATUSES or (len(self.endpoints) > 1 and (status is None or status >= 500))
+
+    async def _post(self, html_data: bytes, assets: Optional[Dict[str, bytes]] = None):
+        """Post one conversion to the endpoint routing picks and return (status, body, retry_after)."""
+        endpoint = self.endpoints.acquire()
+        ok = True
+        try:
+            status, body, retry_after = await self._post_to(endpoint, html_data, assets)
+            ok = status < 500 or status in RETRYABLE_STATUSES
+        except FAILOVER_ERRORS:
+            ok = False
+            raise
+        finally:
+            self.endpoints.release(endpoint, ok)
+        return status, body, retry_after
+
+    async def _post_to(self, endpoint: GotenbergEndpoint, html_data: bytes,
+                       assets: Optional[Dict[str, bytes]] = None):
+        data = aiohttp.FormData()
+        data.add_field('index.html', html_data, filename='index.html', content_type='text/html')
+        for name, content in (assets or {}).items():
+            data.add_field(name, content, filename=name)
+        async with self._get_session().post(
+            f'{endpoint.url}/forms/chromium/convert/html',
+            data=data,
+            timeout=aiohttp.ClientTimeout(total=self.timeout)
+        ) as response:
+            body = await response.read()
+            return response.status, body, (response.headers or {}).get('Retry-After')
+
+    async def _start_health_checks(self) -> asyncio.Task:
+        return asyncio.ensure_future(self._watch_health())
+
+    async def _stop_health_checks(self):
+        self._health_task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await self._health_task
+
+    async def _watch_health(self):
+        """Check every endpoint now, then every health_interval seconds when probing is on."""
+        while True:
+            await asyncio.gather(*(self._check_endpoint(endpoint) for endpoint in self.endpoints))
+            if self.health_interval <= 0:
+                return
+            await asyncio.sleep(self.health_interval)
+
+    async def _check_endpoint(self, endpoint: GotenbergEndpoint):
+        """Probe the endpoint and warm it up if it is healthy but cold; one that goes down comes back cold."""
+        endpoint.healthy = await self._probe(endpoint) if self.health_interval > 0 else True
+        if not endpoint.healthy:
+            endpoint.warm = not self.warmup
+        elif not endpoint.warm:
+            endpoint.warm = await self._warm_up(endpoint)
+
+    async def _probe(self, endpoint: GotenbergEndpoint) -> bool:
+        try:
+            async with self._get_session().get(
+                f'{endpoint.url}/health', timeout=aiohttp.ClientTimeout(total=self.health_timeout)
+            ) as response:
+                return response.status == 200
+        except FAILOVER_ERRORS:
+            return False
+
+    async def _warm_up(self, endpoint: GotenbergEndpoint) -> bool:
+        """Send a tiny conversion so the endpoint's Chromium is started before real work arrives."""
+        try:
+            status, _, _ = await self._post_to(endpoint, WARMUP_HTML)
+        except FAILOVER_ERRORS:
+            return False
+        return status == 200
+
+    def _backoff_delay(self, attempt: int, retry_after: Optional[str]) -> float:
+        """Return the delay before the next attempt, honouring Retry-After when Gotenberg sends one."""
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), MAX_RETRY_DELAY)
+        delay = self.retry_backoff * (2 ** attempt)
+        return min(delay * random.uniform(0.5, 1.5), MAX_RETRY_DELAY)
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None:
+            self._session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.pool_size))
+        return self._session
+
+    def _get_limiter(self) -> asyncio.Semaphore:
+        if self._limiter is None:
+            self._limiter = asyncio.Semaphore(self.max_in_flight)
+        return self._limiter
@@ -0,0 +1,106 @@
+# Copyright © 2025 Province of British Columbia
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Routing of conversions across Gotenberg endpoints.
+
+Each conversion goes to the endpoint with the fewest conversions outstanding, preferring endpoints that
+passed their last health probe and have been warmed up, so a slow or cold pod gets less work instead of
+stalling a statement. An endpoint whose conversions keep failing is ejected for a cool-down period.
+Only the client loop calls into this class, so it needs no locking.
+"""
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Dict, Iterable, List, Union
+
+
+@dataclass
+class GotenbergEndpoint:  # pylint: disable=too-many-instance-attributes
+    """One Gotenberg base URL and what routing knows about it."""
+
+    url: str
+    outstanding: int = 0
+    healthy: bool = True
+    warm: bool = True
+    consecutive_failures: int = 0
+    ejected_until: float = 0.0
+    last_picked: int = 0
+    conversions: int = 0
+    failures: int = 0
+    ejections: int = 0
+
+
+class GotenbergEndpoints:
+    """Pick the endpoint for each conversion and track its outcome."""
+
+    def __init__(self, urls: Union[str, Iterable[str]], *, eject_failures: int = 3, eject_seconds: float = 30.0,
+                 warmup: bool = False, clock: Callable[[], float] = time.monotonic):
+        """Route across urls, a list or a comma separated string; with warmup, endpoints start cold."""
+        if isinstance(urls, str):
+            urls = urls.split(',')
+        self.endpoints = [GotenbergEndpoint(url.strip().rstrip('/'), warm=not warmup) for url in urls if url.strip()]
+        if not self.endpoints:
+            raise ValueError('At least one Gotenberg URL is required')
+        self.eject_failures = max(1, eject_failures)
+        self.eject_seconds = eject_seconds
+        self._clock = clock
+        self._picks = 0
+
+    def __len__(self) -> int:
+        """Return the number of endpoints."""
+        return len(self.endpoints)
+
+    def __iter__(self):
+        """Iterate over the endpoints."""
+        return iter(self.endpoints)
+
+    def acquire(self) -> GotenbergEndpoint:
+        """Return the endpoint to send the next conversion to and count it as outstanding.
+
+        Endpoints in service come first, then the fewest outstanding, then the least recently picked. An
+        ejected, unhealthy or cold endpoint is only used when no better one is left.
+        """
+        now = self._clock()
+        endpoint = min(self.endpoints, key=lambda candidate: (
+            candidate.ejected_until > now, not candidate.healthy, not candidate.warm,
+            candidate.outstanding, candidate.last_picked,
+        ))
+        self._picks += 1
+        endpoint.last_picked = self._picks
+        endpoint.outstanding += 1
+        return endpoint
+
+    def release(self, endpoint: GotenbergEndpoint, ok: bool):
+        """Record the end of a conversion; enough failures in a row eject the endpoint."""
+        endpoint.outstanding -= 1
+        endpoint.conversions += 1
+        if ok:
+            endpoint.consecutive_failures = 0
+            return
+        endpoint.failures += 1
+        endpoint.consecutive_failures += 1
+        if endpoint.consecutive_failures >= self.eject_failures:
+            self.eject(endpoint)
+
+    def eject(self, endpoint: GotenbergEndpoint):
+        """Take the endpoint out of rotation for eject_seconds."""
+        endpoint.ejected_until = self._clock() + self.eject_seconds
+        endpoint.consecutive_failures = 0
+        endpoint.ejections += 1
+
+    def is_ejected(self, endpoint: GotenbergEndpoint) -> bool:
+        """Return True while the endpoint is cooling down."""
+        return endpoint.ejected_until > self._clock()
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """Return each endpoint's state and totals."""
+        return [{**asdict(endpoint), 'ejected': self.is_ejected(endpoint)} for endpoint in self.endpoints]
@@ -1,90 +1,142 @@
 """Service for Gotenberg PDF generation operations."""
 import asyncio
-import gc
-from typing import List, Tuple
+from typing import AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple, Union
 
-import aiohttp
-import requests
-from flask import current_app
+from api.services.gotenberg_client import GotenbergClient
+from api.services.memory_budget import MemoryBudget
+
+# Task HTML is either ready, or a callable returning an awaitable that renders it on demand
+HtmlSource = Union[str, Callable[[], Awaitable[str]]]
 
 
 class GotenbergService:
     """Service for interacting with Gotenberg PDF generation service."""
 
     @staticmethod
-    def _get_gotenberg_url() -> str:
-        """Get the Gotenberg service URL from configuration."""
-        return current_app.config.get('GOTENBERG_URL')
-
-    @staticmethod
-    async def _render_pdf_bytes_worker_gotenberg_with_session(
-        args: Tuple[str, str],
-        session: aiohttp.ClientSession
+    async def _render_pdf_bytes_worker(
+        html_out: HtmlSource,
+        client: GotenbergClient,
+        request_limiter: Optional[asyncio.Semaphore] = None,
     ) -> bytes:
-        """Worker used to render HTML string to PDF bytes using Gotenberg with shared session."""
-        html_out = args[0]
-        gc.collect()
-        gotenberg_url = GotenbergService._get_gotenberg_url()
-
-        html_data = html_out.encode('utf-8')
-
-        data = aiohttp.FormData()
-        data.add_field('index.html', html_data, filename='index.html', content_type='text/html')
-
-        async with session.post(
-            f'{gotenberg_url}/forms/chromium/convert/html',
-            data=data,
-            timeout=aiohttp.ClientTimeout(total=500)
-        ) as response:
-            if response.status == 200:
-                pdf_content = await response.read()
-                gc.collect()
-                return pdf_content
-            error_text = await response.text()
-            raise Exception(  # pylint: disable=broad-exception-raised
-                f'Gotenberg conversion failed with status {response.status}: '
-                f'{error_text}'
-            )
+        """Worker used to render HTML string to PDF bytes through the shared Gotenberg client.
+
+        The HTML is charged to the client's memory budget while it converts and the returned PDF is
+        then held in it until the caller has consumed it. Deferred HTML is
+        rendered first, so a task only holds its HTML once it is ready to convert.
+        """
+        if callable(html_out):
+            html_out = await html_out()
+        budget = client.memory_budget
+        html_bytes = len(html_out)
+        await budget.acquire(html_bytes)
+        try:
+            pdf_content = await client.convert_html(html_out, request_limiter)
+            budget.hold(len(pdf_content))
+        finally:
+            budget.release(html_bytes)
+        return pdf_content
 
     @staticmethod
     async def render_tasks_parallel_async(
         tasks: List[Tuple[int, str]],
-        base_url: str,
+        base_url: str,  # pylint: disable=unused-argument
+        client: GotenbergClient,
     ) -> List[bytes]:
-        """Render HTML tasks in parallel using shared session for better performance."""
-        results: List[Tuple[int, bytes]] = []
+        """Render HTML tasks in parallel, capped by the client's per request and global limits."""
+        request_limiter = client.request_limiter()
+        ordered = sorted(tasks, key=lambda task: task[0])
+        futures = [
+            asyncio.ensure_future(GotenbergService._render_pdf_bytes_worker(html_out, client, request_limiter))
+            for _, html_out in ordered
+        ]
+        try:
+            results = await asyncio.gather(*futures, return_exceptions=True)
+        finally:
+            # The caller holds the whole list from here on, so stop counting the PDFs as held now.
+            GotenbergService._release_finished(futures, client.memory_budget)
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+        return list(results)
 
-        async with aiohttp.ClientSession() as session:
-            async_tasks = []
-            order_ids = []
-            for oid, html_out in tasks:
-                task = GotenbergService._render_pdf_bytes_worker_gotenberg_with_session(
-                    (html_out, base_url), session
-                )
-                async_tasks.append(task)
-                order_ids.append(oid)
+    @staticmethod
+    async def render_tasks_in_order_async(
+        tasks: List[Tuple[int, HtmlSource]],
+        client: GotenbergClient,
+        window: int,
+    ) -> AsyncIterator[bytes]:
+        """Yield rendered PDFs in order id order as soon as each one and every earlier one has arrived.
+
+        At most ``window`` tasks are rendering or waiting in the reorder buffer at any time, so the
+        number of PDFs held in memory is bounded by the window rather than by the number of tasks.
+        Deferred HTML is rendered inside the window too, so rendering overlaps with conversion.
+        """
+        ordered = sorted(tasks, key=lambda task: task[0])
+        window = max(1, window)
+        budget = client.memory_budget
+        request_limiter = client.request_limiter()
+        in_flight: Dict[asyncio.Future, int] = {}
+        reorder_buffer: Dict[int, bytes] = {}
+        next_index = 0
+        launch_index = 0
+        try:
+            while next_index < len(ordered):
+                while launch_index < len(ordered) and launch_index - next_index < window:
+                    future = asyncio.ensure_future(
+                        GotenbergService._render_pdf_bytes_worker(ordered[launch_index][1], client, request_limiter)
+                    )
+                    in_flight[future] = launch_index
+                    launch_index += 1
+
+                done, _ = await asyncio.wait(in_flight.keys(), return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    reorder_buffer[in_flight.pop(future)] = future.result()
+
+                while next_index in reorder_buffer:
+                    pdf_content = reorder_buffer.pop(next_index)
+                    next_index += 1
+                    try:
+                        yield pdf_content
+                    finally:
+                        budget.release_held(len(pdf_content))
+        finally:
+            for pdf_content in reorder_buffer.values():
+                budget.release_held(len(pdf_content))
+            GotenbergService._release_finished(in_flight, budget)
 
-            pdf_contents = await asyncio.gather(*async_tasks)
+    @staticmethod
+    def _release_finished(futures: Iterable[asyncio.Future], budget: MemoryBudget):
+        """Stop holding the PDFs of finished renders and cancel the rest."""
+        for future in futures:
+            if future.done() and not future.cancelled() and future.exception() is None:
+                budget.release_held(len(future.result()))
+            else:
+                future.cancel()
 
-            for oid, pdf_content in zip(order_ids, pdf_contents):
-                results.append((oid, pdf_content))
+    @staticmethod
+    def render_tasks_parallel(tasks: List[Tuple[int, str]], base_url: str) -> List[bytes]:
+        """Render HTML tasks on the shared Gotenberg client and wait for all of them."""
+        client = GotenbergClient.get()
+        return client.run(GotenbergService.render_tasks_parallel_async(tasks, base_url, client))
 
-        return [pdf for _, pdf in sorted(results, key=lambda x: x[0])]
+    @staticmethod
+    def iter_tasks_in_order(tasks: List[Tuple[int, HtmlSource]], window: int):
+        """Render HTML tasks on the shared Gotenberg client, yielding PDFs in order as they are ready."""
+        client = GotenbergClient.get()
+        return client.iterate(GotenbergService.render_tasks_in_order_async(tasks, client, window))
+
+    @staticmethod
+    def memory_budget_stats() -> Dict[str, float]:
+        """Return in-flight byte metrics for this worker's renders."""
+        return GotenbergClient.get().memory_budget.stats()
+
+    @staticmethod
+    def payload_stats() -> Dict[str, float]:
+        """Return this worker's conversion payload and latency totals."""
+        return GotenbergClient.get().payload_stats()
 
     @staticmethod
-    def convert_html_to_pdf_sync(html_content: str, timeout: int = 500) -> requests.Response:
-        """Convert HTML content to PDF using Gotenberg synchronously."""
-        gotenberg_url = GotenbergService._get_gotenberg_url()
-        endpoint = f'{gotenberg_url}/forms/chromium/convert/html'
-
-        files = [('files', ('index.html', html_content, 'text/html'))]
-        data = {}
-
-        resp = requests.post(
-            endpoint,
-            files=files,
-            data=data,
-            timeout=timeout
-        )
-        resp.raise_for_status()
-        return resp
+    def convert_html_to_pdf_sync(html_content: str) -> bytes:
+        """Convert HTML content to PDF bytes using Gotenberg, blocking until it is done."""
+        client = GotenbergClient.get()
+        return client.run(client.convert_html(html_content))
@@ -0,0 +1,100 @@
+# Copyright © 2025 Province of British Columbia
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Memory budget scheduler for Gotenberg renders."""
+import asyncio
+import time
+from collections import deque
+from typing import Deque, Dict, Tuple
+
+
+class MemoryBudget:  # pylint: disable=too-many-instance-attributes
+    """Admit renders only while the bytes they hold stay under a budget.
+
+    A render is charged for its request HTML while it converts. The PDF it returns is held until the
+    caller has consumed it and counts towards the bytes in flight, but not towards admission: the
+    caller may need a render that is still waiting before it can consume the PDFs it holds, so
+    admitting against them could wait forever. Waiters are admitted in FIFO order, and a single render
+    larger than the whole budget is still admitted once nothing else is converting so it cannot wait
+    forever. Must only be used from one event loop.
+    """
+
+    def __init__(self, limit_bytes: int):
+        """Create a budget of limit_bytes."""
+        self.limit_bytes = max(1, limit_bytes)
+        self._converting = 0
+        self._held = 0
+        self._peak = 0
+        self._area = 0.0
+        self._started = time.monotonic()
+        self._last_change = self._started
+        self._waiters: Deque[Tuple[int, asyncio.Future]] = deque()
+
+    async def acquire(self, nbytes: int):
+        """Wait until nbytes fit in the budget, then charge them."""
+        if not self._waiters and self._fits(nbytes):
+            self._charge(converting=nbytes)
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append((nbytes, waiter))
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release(nbytes)
+            elif (nbytes, waiter) in self._waiters:
+                self._waiters.remove((nbytes, waiter))
+            raise
+
+    def release(self, nbytes: int):
+        """Give nbytes charged by acquire back to the budget and admit any waiters that now fit."""
+        self._charge(converting=-nbytes)
+        while self._waiters and self._fits(self._waiters[0][0]):
+            waiting_bytes, waiter = self._waiters.popleft()
+            if not waiter.done():
+                self._charge(converting=waiting_bytes)
+                waiter.set_result(None)
+
+    def hold(self, nbytes: int):
+        """Count a returned PDF as in flight until release_held, without charging it for admission."""
+        self._charge(held=nbytes)
+
+    def release_held(self, nbytes: int):
+        """Stop counting a PDF the caller has consumed."""
+        self._charge(held=-nbytes)
+
+    def stats(self) -> Dict[str, float]:
+        """Return the current, peak and time-weighted average bytes in flight, and the PDF bytes held."""
+        now = time.monotonic()
+        in_flight = self._converting + self._held
+        area = self._area + in_flight * (now - self._last_change)
+        elapsed = now - self._started
+        return {
+            'limit_bytes': self.limit_bytes,
+            'in_flight_bytes': in_flight,
+            'held_bytes': self._held,
+            'peak_in_flight_bytes': self._peak,
+            'average_in_flight_bytes': area / elapsed if elapsed > 0 else float(in_flight),
+            'waiting': len(self._waiters),
+        }
+
+    def _fits(self, nbytes: int) -> bool:
+        return self._converting == 0 or self._converting + nbytes <= self.limit_bytes
+
+    def _charge(self, converting: int = 0, held: int = 0):
+        now = time.monotonic()
+        self._area += (self._converting + self._held) * (now - self._last_change)
+        self._last_change = now
+        self._converting = max(0, self._converting + converting)
+        self._held = max(0, self._held + held)
+        self._peak = max(self._peak, self._converting + self._held)
@@ -0,0 +1,248 @@
+# Copyright © 2025 Province of British Columbia
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Render metrics of every worker process in the Prometheus text exposition format.
+
+Covers the render stages and the stats the services already keep: Gotenberg payloads and memory budget,
+the result cache, template compile and render times, the job queue and the chunk planner's cost history.
+Services that have not started in a worker are left out rather than started for a scrape.
+
+A scrape reaches whichever gunicorn worker answers, so with METRICS_MULTIPROC_DIR set each worker writes
+its metrics to that directory every METRICS_SNAPSHOT_SECONDS, and the answering worker merges them all.
+Counters and histograms are summed across workers, including workers that have exited, so they never go
+backwards. Gauges are kept per live worker with a pid label. Without the directory only the answering
+worker's metrics are exported, which is only meaningful with a single worker.
+"""
+import json
+import os
+import threading
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from api.services.chunk_planner import render_cost_history
+from api.services.gotenberg_client import GotenbergClient
+from api.services.render_metrics import render_metrics
+from api.services.report_cache import ReportCache
+from api.services.report_job_service import ReportJobService
+from api.services.template_registry import template_registry
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+Sample = Tuple[str, Dict[str, str], float]
+Family = Tuple[str, str, str, List[Sample]]
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _family(families: List[Family], name: str, kind: str, help_text: str, samples: Iterable[Sample]):
+    families.append((name, kind, help_text, list(samples)))
+
+
+def _render(families: Iterable[Family]) -> str:
+    lines = []
+    for name, kind, help_text, samples in families:
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        for sample_name, labels, value in samples:
+            label_text = ','.join(f'{key}="{_escape(str(label))}"' for key, label in labels.items())
+            lines.append(f'{sample_name}{{{label_text}}} {_format_value(value)}' if label_text
+                         else f'{sample_name} {_format_value(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+def _stage_families(families: List[Family]):
+    stages = render_metrics.stats()
+    histogram = []
+    bounds = (*render_metrics.buckets, float('inf'))
+    for name, stage_stats in stages.items():
+        for bound, count in zip(bounds, (*stage_stats['buckets'], stage_stats['count'])):
+            labels = {'stage': name, 'le': _format_value(bound)}
+            histogram.append(('report_stage_duration_seconds_bucket', labels, count))
+        histogram.append(('report_stage_duration_seconds_sum', {'stage': name}, stage_stats['seconds']))
+        histogram.append(('report_stage_duration_seconds_count', {'stage': name}, stage_stats['count']))
+    _family(families, 'report_stage_duration_seconds', 'histogram', 'Wall time of each render stage run.', histogram)
+    for key, help_text in (
+        ('bytes_in', 'Bytes each render stage read.'),
+        ('bytes_out', 'Bytes each render stage produced.'),
+        ('pages', 'PDF pages each render stage handled.'),
+    ):
+        metric = f'report_stage_{key}_total'
+        _family(families, metric, 'counter', help_text,
+                ((metric, {'stage': name}, stage_stats[key]) for name, stage_stats in stages.items()))
+
+
+def _gotenberg_families(families: List[Family]):
+    client = GotenbergClient._instance  # pylint: disable=protected-access; a scrape must not start the client
+    if client is None:
+        return
+    for key, value in client.payload_stats().items():
+        metric = f'gotenberg_{key}_total'
+        _family(families, metric, 'counter', f'Gotenberg {key.replace("_", " ")} for successful conversions.',
+                ((metric, {}, value),))
+    budget = client.memory_budget.stats()
+    _family(families, 'render_memory_budget_bytes', 'gauge', 'Render memory budget limit and bytes in flight.',
+            (('render_memory_budget_bytes', {'kind': key[:-len('_bytes')]}, value)
+             for key, value in budget.items() if key.endswith('_bytes')))
+    _family(families, 'render_memory_budget_waiting', 'gauge', 'Renders waiting for room in the memory budget.',
+            (('render_memory_budget_waiting', {}, budget['waiting']),))
+    endpoints = client.endpoint_stats()
+    for key, kind in (('outstanding', 'gauge'), ('healthy', 'gauge'), ('warm', 'gauge'), ('ejected', 'gauge'),
+                      ('conversions', 'counter'), ('failures', 'counter'), ('ejections', 'counter')):
+        metric = f'gotenberg_endpoint_{key}' + ('_total' if kind == 'counter' else '')
+        _family(families, metric, kind, f'Gotenberg {key} per endpoint.',
+                ((metric, {'endpoint': endpoint['url']}, int(endpoint[key])) for endpoint in endpoints))
+
+
+def _service_families(families: List[Family]):
+    cache = ReportCache._instance  # pylint: disable=protected-access; read outside any app context
+    if cache is not None and cache.backend is not None:
+        _family(families, 'report_cache_events_total', 'counter', 'Report cache lookups, stores and evictions.',
+                (('report_cache_events_total', {'event': event}, count) for event, count in cache.stats().items()))
+
+    templates = template_registry.stats()
+    for key in ('compiles', 'compile_seconds', 'renders', 'render_seconds'):
+        metric = f'report_template_{key}_total'
+        _family(families, metric, 'counter', f'Template {key.replace("_", " ")} per template.',
+                ((metric, {'template': name}, timings[key]) for name, timings in templates.items()))
+
+    jobs = ReportJobService._instance  # pylint: disable=protected-access; a scrape must not start the job pool
+    if jobs is not None:
+        for key, value in jobs.stats().items():
+            metric = f'report_jobs_{key}'
+            _family(families, metric, 'gauge', f'Report jobs {key.replace("_", " ")}.', ((metric, {}, value),))
+
+    costs = render_cost_history.stats()
+    for key in ('rows_per_second', 'bytes_per_row'):
+        metric = f'report_chunk_{key}'
+        _family(families, metric, 'gauge', f'Moving average of chunked statement {key.replace("_", " ")}.',
+                ((metric, {'template': name}, cost[key]) for name, cost in costs.items()))
+
+
+def collect() -> List[Family]:
+    """Return this worker's metric families."""
+    families: List[Family] = []
+    _stage_families(families)
+    _gotenberg_families(families)
+    _service_families(families)
+    return families
+
+
+def _is_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class WorkerSnapshots:
+    """Each worker's metric families, written to a directory shared by the workers and merged on a scrape."""
+
+    def __init__(self):
+        """Start with no directory; init_app turns snapshots on when METRICS_MULTIPROC_DIR is set."""
+        self.directory: Optional[str] = None
+        self._stop = threading.Event()
+        self._writer: Optional[threading.Thread] = None
+        self._logger = None
+
+    def init_app(self, app):
+        """Write this worker's snapshot every METRICS_SNAPSHOT_SECONDS when METRICS_MULTIPROC_DIR is set."""
+        directory = app.config.get('METRICS_MULTIPROC_DIR')
+        if not directory:
+            return
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self._logger = app.logger
+        self.write()
+        interval = app.config.get('METRICS_SNAPSHOT_SECONDS', 5)
+        if interval > 0 and self._writer is None:
+            self._stop.clear()
+            self._writer = threading.Thread(target=self._write_every, args=(interval,), name='metrics-snapshots',
+                                            daemon=True)
+            self._writer.start()
+
+    def close(self):
+        """Stop writing snapshots."""
+        if self._writer is not None:
+            self._stop.set()
+            self._writer.join(timeout=5)
+            self._writer = None
+        self.directory = None
+
+    def write(self, families: Optional[List[Family]] = None):
+        """Replace this worker's snapshot with families, or with freshly collected ones."""
+        path = os.path.join(self.directory, f'{os.getpid()}.json')
+        temp_path = f'{path}.{threading.get_ident()}.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as snapshot:
+            json.dump(families if families is not None else collect(), snapshot)
+        os.replace(temp_path, path)
+
+    def merged(self) -> List[Family]:
+        """Return the families of every worker's snapshot merged into one set of series."""
+        merged: Dict[str, Tuple[str, str, Dict[Any, Sample]]] = {}
+        for pid_text, alive, families in self._snapshots():
+            for name, kind, help_text, samples in families:
+                _, _, series = merged.setdefault(name, (kind, help_text, {}))
+                for sample_name, labels, value in samples:
+                    if kind == 'gauge':
+                        if not alive:
+                            continue
+                        labels = {**labels, 'pid': pid_text}
+                    key = (sample_name, tuple(labels.items()))
+                    previous = series.get(key, (sample_name, labels, 0))[2]
+                    series[key] = (sample_name, labels, previous + value)
+        return [(name, kind, help_text, list(series.values())) for name, (kind, help_text, series) in merged.items()]
+
+    def _snapshots(self) -> Iterator[Tuple[str, bool, List[Family]]]:
+        """Yield each snapshot's pid, whether that worker is alive, and its families."""
+        for entry in sorted(os.scandir(self.directory), key=lambda entry: entry.name):
+            pid_text, _, extension = entry.name.partition('.')
+            if extension != 'json' or not pid_text.isdigit():
+                continue
+            try:
+                with open(entry.path, encoding='utf-8') as snapshot:
+                    families = json.load(snapshot)
+            except (OSError, ValueError):
+                continue
+            yield pid_text, int(pid_text) == os.getpid() or _is_alive(int(pid_text)), families
+
+    def _write_every(self, interval: float):
+        while not self._stop.wait(interval):
+            try:
+                self.write()
+            except Exception as err:  # noqa: B902 pylint: disable=broad-exception-caught
+                # The last snapshot stays in place; the next interval tries again
+                if self._logger:
+                    self._logger.warning('Metrics snapshot failed: %s', err)
+
+
+worker_snapshots = WorkerSnapshots()  # pylint: disable=invalid-name; lower case like the template catalogue
+
+
+def prometheus_text() -> str:
+    """Return every metric family as Prometheus exposition text, merged across workers when snapshots are on."""
+    families = collect()
+    if worker_snapshots.directory:
+        worker_snapshots.write(families)
+        families = worker_snapshots.merged()
+    return _render(families)
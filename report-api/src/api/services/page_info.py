@@ -1,38 +1,83 @@
-"""Shared helpers for populating page numbers in WeasyPrint documents, get rid of the cyclic dependency."""
+"""Shared helpers for populating page numbers in WeasyPrint documents, get rid of the cyclic dependency.
+
+The pageinfo boxes of a laid out document are found once and indexed by page, then patched directly.
+Given the parsed HTML, the walk only enters boxes of the pageinfo elements and their ancestors (and
+anonymous boxes without an element), so tables and other content around the page numbers are skipped.
+Templates that only need page numbers in the page margins can use counter(page) and counter(pages) in
+@page rules instead, which WeasyPrint fills in itself.
+"""
+from typing import List, Optional, Set
 
 from weasyprint.formatting_structure.boxes import InlineBox
 
 
-def populate_page_info(document):
+PAGE_INFO_TAG = 'pageinfo'
+
+
+def page_info_elements(root_element) -> Set:
+    """Return the pageinfo elements of a parsed HTML tree with their ancestors, plus None for anonymous boxes."""
+    elements = {None}
+    if next(root_element.iter(PAGE_INFO_TAG), None) is None:
+        return elements
+    elements.add(root_element)
+    stack = [root_element]
+    while stack:
+        # Element.iter runs in C, so finding which children hold a pageinfo is far cheaper than a parent map
+        for child in stack.pop():
+            if next(child.iter(PAGE_INFO_TAG), None) is not None:
+                elements.add(child)
+                stack.append(child)
+    return elements
+
+
+def find_page_info_boxes(box, elements: Optional[Set] = None) -> list:
+    """Return the pageinfo boxes in a box tree, only entering boxes of elements when it is given."""
+    found = []
+    level = [box]
+    while level:
+        found += [box for box in level if getattr(box, 'element_tag', None) == PAGE_INFO_TAG]
+        level = [
+            child for box in level for child in getattr(box, 'children', None) or ()
+            if elements is None or getattr(child, 'element', None) in elements
+        ]
+    return found
+
+
+def index_page_info(document, elements: Optional[Set] = None) -> List[list]:
+    """Return the pageinfo boxes of each page of the document."""
+    return [
+        find_page_info_boxes(page._page_box, elements)  # pylint: disable=protected-access
+        for page in document.pages
+    ]
+
+
+def populate_page_info(document, elements: Optional[Set] = None):
     """Iterate through pages and populate page number info."""
-    total_pages = len(document.pages)
-    count = 1
-    for page in document.pages:
-        populate_page_count(page._page_box, count, total_pages)  # pylint: disable=protected-access
-        count += 1
-    return document
+    return populate_page_info_with_offset(document, 1, len(document.pages), index_page_info(document, elements))
 
 
 def populate_page_count(box, count, total):
     """Populate page info under pageinfo tag for a single box tree."""
-    if getattr(box, 'element_tag', None):
-        if box.element_tag == 'pageinfo':
-            page_info_text = f'Page {count} of {total}'
-            if isinstance(box, InlineBox):
-                box.children[0].text = page_info_text
-                # pango_layout may not exist in some cases; guard access
-                if hasattr(box.children[0], 'pango_layout'):
-                    box.children[0].pango_layout.text = page_info_text
-            box.text = page_info_text
-    if hasattr(box, 'all_children') and box.all_children():
-        for child in box.children:
-            populate_page_count(child, count, total)
-
-
-def populate_page_info_with_offset(document, start_index: int, total_pages: int):
-    """Populate page numbers starting from a given index (1-based)."""
+    _write_page_info(find_page_info_boxes(box), f'Page {count} of {total}')
+
+
+def populate_page_info_with_offset(document, start_index: int, total_pages: int, index: List[list] = None):
+    """Populate page numbers starting from a given index (1-based), reusing an index when one is given."""
+    if index is None:
+        index = index_page_info(document)
     count = max(1, int(start_index))
-    for page in document.pages:
-        populate_page_count(page._page_box, count, total_pages)  # pylint: disable=protected-access
+    for boxes in index:
+        if boxes:
+            _write_page_info(boxes, f'Page {count} of {total_pages}')
         count += 1
     return document
+
+
+def _write_page_info(boxes: list, page_info_text: str):
+    for box in boxes:
+        if isinstance(box, InlineBox):
+            box.children[0].text = page_info_text
+            # pango_layout may not exist in some cases; guard access
+            if hasattr(box.children[0], 'pango_layout'):
+                box.children[0].pango_layout.text = page_info_text
+        box.text = page_info_text
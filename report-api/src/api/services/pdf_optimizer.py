@@ -0,0 +1,206 @@
+# Copyright © 2025 Province of British Columbia
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Optional size optimisation of finished PDFs.
+
+Statements merged from many Chromium chunks carry a copy of every font file and image per chunk. The
+optimiser points every reference at one copy of each identical stream, optionally downsamples oversized
+images, and writes the objects into compressed object streams, linearized for fast web view if asked.
+"""
+import hashlib
+import io
+import zlib
+from dataclasses import dataclass
+from typing import BinaryIO, Dict, Optional, Set, Tuple
+
+import pikepdf
+from flask import current_app
+from pikepdf.models.image import PdfImage, UnsupportedImageTypeError
+
+from api.services.pdf_spool import PdfSource, is_spooled, open_pdf, pdf_size, save_pdf
+from api.services.render_metrics import stage
+
+
+TRUE_VALUES = ('1', 'true', 'yes', 'on')
+FALSE_VALUES = ('0', 'false', 'no', 'off')
+JPEG_QUALITY = 85
+
+
+@dataclass
+class OptimizeOptions:
+    """What the optimiser does to a PDF."""
+
+    linearize: bool = False
+    max_image_px: int = 0
+
+
+@dataclass
+class OptimizeResult:
+    """Sizes of a PDF before and after optimisation, and what was shared or shrunk."""
+
+    bytes_before: int
+    bytes_after: int
+    streams_deduplicated: int = 0
+    images_downsampled: int = 0
+
+
+def optimize_options(template_name: Optional[str], requested: Optional[str]) -> Optional[OptimizeOptions]:
+    """Return the options for a report, or None to leave it as rendered.
+
+    requested is the optimize request parameter: true or false, or linearize for true with linearization.
+    Without it, templates listed in PDF_OPTIMIZE_TEMPLATES ('*' for all) are optimised.
+    """
+    config = current_app.config
+    requested = (requested or '').strip().lower()
+    if requested in FALSE_VALUES:
+        return None
+    if requested not in TRUE_VALUES and requested != 'linearize':
+        if requested:
+            raise ValueError('optimize must be true, false or linearize')
+        templates = {name.strip() for name in config.get('PDF_OPTIMIZE_TEMPLATES', '').split(',') if name.strip()}
+        if '*' not in templates and (template_name or '') not in templates:
+            return None
+    return OptimizeOptions(
+        linearize=requested == 'linearize' or config.get('PDF_OPTIMIZE_LINEARIZE', False),
+        max_image_px=config.get('PDF_OPTIMIZE_MAX_IMAGE_PX', 0),
+    )
+
+
+def optimize_pdf(source: PdfSource, options: OptimizeOptions,
+                 output: Optional[BinaryIO] = None) -> Tuple[PdfSource, OptimizeResult]:
+    """Return the optimised PDF, written into output when given, or source itself when that is not smaller."""
+    bytes_before = pdf_size(source)
+    with stage('optimize', bytes_before) as record, open_pdf(source) as pdf:
+        result = OptimizeResult(bytes_before, bytes_before)
+        result.streams_deduplicated = deduplicate_streams(pdf)
+        if options.max_image_px > 0:
+            result.images_downsampled = downsample_images(pdf, options.max_image_px)
+        optimized = save_pdf(
+            pdf, output, object_stream_mode=pikepdf.ObjectStreamMode.generate, compress_streams=True,
+            linearize=options.linearize,
+        )
+        record.pages = len(pdf.pages)
+    result.bytes_after = pdf_size(optimized)
+    record.bytes_out = result.bytes_after
+    if result.bytes_after >= bytes_before and not options.linearize:
+        if is_spooled(optimized) and optimized is not source:
+            optimized.close()
+        result.bytes_after = bytes_before
+        return source, result
+    return optimized, result
+
+
+def deduplicate_streams(pdf: pikepdf.Pdf) -> int:
+    """Point every reference to a stream at the first identical copy and return how many copies were dropped.
+
+    Streams are identical when their encoded data and dictionaries match; a dictionary referring to other
+    streams (an image's soft mask) matches once those have been merged, so merging repeats until it settles.
+    """
+    canonical: Dict[Tuple[int, int], pikepdf.Object] = {}
+    page_contents = _page_content_objgens(pdf)
+    while True:
+        seen: Dict[Tuple, pikepdf.Object] = {}
+        merged = 0
+        for obj in pdf.objects:
+            if not isinstance(obj, pikepdf.Stream) or obj.objgen in canonical or obj.objgen in page_contents:
+                continue
+            key = _stream_key(obj, canonical)
+            first = seen.setdefault(key, obj)
+            if first is not obj:
+                canonical[obj.objgen] = first
+                merged += 1
+        if not merged:
+            break
+        for obj in pdf.objects:
+            if isinstance(obj, (pikepdf.Dictionary, pikepdf.Array, pikepdf.Stream)):
+                _replace_references(obj, canonical)
+    return len(canonical)
+
+
+def _page_content_objgens(pdf: pikepdf.Pdf) -> Set[Tuple[int, int]]:
+    """Return the page content streams, which are unique per page and not worth hashing."""
+    objgens = set()
+    for page in pdf.pages:
+        contents = page.obj.get('/Contents')
+        for content in (contents if isinstance(contents, pikepdf.Array) else [contents]):
+            if content is not None and content.is_indirect:
+                objgens.add(content.objgen)
+    return objgens
+
+
+def _stream_key(obj: pikepdf.Stream, canonical: Dict[Tuple[int, int], pikepdf.Object]) -> Tuple:
+    entries = []
+    for key in sorted(obj.stream_dict.keys()):
+        if key == '/Length':
+            continue
+        value = obj.stream_dict.get(key)
+        if _is_reference(value):
+            entries.append((key, canonical[value.objgen].objgen if value.objgen in canonical else value.objgen))
+        else:
+            entries.append((key, value.unparse() if isinstance(value, pikepdf.Object) else repr(value)))
+    return hashlib.sha256(obj.read_raw_bytes()).digest(), tuple(entries)
+
+
+def _is_reference(value) -> bool:
+    # Numbers and booleans come back as Python values
+    return isinstance(value, pikepdf.Object) and value.is_indirect
+
+
+def _replace_references(container: pikepdf.Object, canonical: Dict[Tuple[int, int], pikepdf.Object]):
+    """Swap references to merged streams for the copy kept, descending into direct dictionaries and arrays."""
+    if isinstance(container, pikepdf.Array):
+        items = enumerate(list(container))
+    else:
+        items = [(key, container.get(key)) for key in container.keys()]
+    for key, value in items:
+        if _is_reference(value):
+            if value.objgen in canonical:
+                container[key] = canonical[value.objgen]
+        elif isinstance(value, (pikepdf.Dictionary, pikepdf.Array)):
+            _replace_references(value, canonical)
+
+
+def downsample_images(pdf: pikepdf.Pdf, max_image_px: int) -> int:
+    """Shrink 8 bit RGB and grey page images longer than max_image_px on a side and return how many shrank.
+
+    Images with masks, other colour spaces or bit depths are left alone.
+    """
+    downsampled = 0
+    seen = set()
+    for obj in (image for page in pdf.pages for image in page.images.values()):
+        if obj.objgen in seen:
+            continue
+        seen.add(obj.objgen)
+        if max(int(obj.get('/Width', 0)), int(obj.get('/Height', 0))) <= max_image_px:
+            continue
+        if obj.get('/ColorSpace') not in (pikepdf.Name.DeviceRGB, pikepdf.Name.DeviceGray) \
+                or obj.get('/BitsPerComponent') != 8 or '/SMask' in obj or '/Mask' in obj \
+                or obj.get('/ImageMask', False):
+            continue
+        try:
+            image = PdfImage(obj).as_pil_image()
+        except (UnsupportedImageTypeError, NotImplementedError, pikepdf.PdfError, OSError, ValueError):
+            continue
+        image.thumbnail((max_image_px, max_image_px))
+        if obj.get('/Filter') == pikepdf.Name.DCTDecode:
+            buf = io.BytesIO()
+            image.save(buf, format='JPEG', quality=JPEG_QUALITY, optimize=True)
+            obj.write(buf.getvalue(), filter=pikepdf.Name.DCTDecode)
+        else:
+            obj.write(zlib.compress(image.tobytes()), filter=pikepdf.Name.FlateDecode)
+        obj.Width, obj.Height = image.size
+        for key in ('/DecodeParms', '/Decode'):
+            if key in obj:
+                del obj[key]
+        downsampled += 1
+    return downsampled
@@ -0,0 +1,104 @@
+# Copyright © 2025 Province of British Columbia
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Helpers for PDFs that are passed around either as bytes or as spooled files.
+
+Large reports are written to a SpooledTemporaryFile, which stays in memory up to PDF_SPOOL_MEMORY_MB
+and then moves to disk, so the finished document never has to exist as one bytes object.
+"""
+import io
+import shutil
+import tempfile
+from typing import BinaryIO, Optional, Union
+
+import pikepdf
+from flask import current_app
+
+from api.services.render_metrics import stage
+
+
+PdfSource = Union[bytes, BinaryIO]
+
+
+def new_spooled_pdf() -> BinaryIO:
+    """Return an empty spooled file for a PDF, kept in memory up to PDF_SPOOL_MEMORY_MB."""
+    max_size = current_app.config.get('PDF_SPOOL_MEMORY_MB', 16) * 1024 * 1024
+    return tempfile.SpooledTemporaryFile(max_size=max_size, mode='w+b')  # pylint: disable=consider-using-with
+
+
+def is_spooled(report) -> bool:
+    """Return True when report is a file rather than bytes."""
+    return not isinstance(report, (bytes, bytearray))
+
+
+def open_pdf(source: PdfSource) -> pikepdf.Pdf:
+    """Open a PDF from bytes or from the start of a file."""
+    if not is_spooled(source):
+        return pikepdf.Pdf.open(io.BytesIO(source))
+    source.seek(0)
+    return pikepdf.Pdf.open(source)
+
+
+def save_pdf(pdf: pikepdf.Pdf, output: Optional[BinaryIO] = None, **save_options) -> PdfSource:
+    """Save pdf into output and return it, or return the bytes when there is no output.
+
+    save_options are passed on to pikepdf's save.
+    """
+    with stage('pdf_write') as record:
+        record.pages = len(pdf.pages)
+        if output is None:
+            buf = io.BytesIO()
+            pdf.save(buf, **save_options)
+            record.bytes_out = buf.tell()
+            return buf.getvalue()
+        output.seek(0)
+        output.truncate()
+        pdf.save(output, **save_options)
+        record.bytes_out = output.tell()
+        output.seek(0)
+        return output
+
+
+def copy_pdf(source: PdfSource, output: Optional[BinaryIO] = None) -> PdfSource:
+    """Return source unchanged, or copy it into output when one is given."""
+    if output is None or source is output:
+        return source
+    output.seek(0)
+    output.truncate()
+    if is_spooled(source):
+        source.seek(0)
+        shutil.copyfileobj(source, output)
+    else:
+        output.write(source)
+    output.seek(0)
+    return output
+
+
+def pdf_size(report: PdfSource) -> int:
+    """Return the size of a PDF held as bytes or as a file."""
+    if not is_spooled(report):
+        return len(report)
+    position = report.tell()
+    size = report.seek(0, io.SEEK_END)
+    report.seek(position)
+    return size
+
+
+def pdf_bytes(report: PdfSource) -> bytes:
+    """Return the whole PDF as bytes."""
+    if not is_spooled(report):
+        return report
+    report.seek(0)
+    content = report.read()
+    report.seek(0)
+    return content
@@ -0,0 +1,174 @@
+# Copyright © 2025 Province of British Columbia
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Wall time, bytes and pages for each stage of the render pipeline.
+
+A stage records into the process wide render_metrics and into the trace of the current request, when
+one has been started. The trace is held in a context variable; asyncio copies the caller's context into
+the tasks it starts on the Gotenberg client loop, so each conversion counts against the request that
+sent it. A nested trace totals one part of a request on its own and passes every stage up to the
+request's trace as well. Stages that overlap, such as parallel conversions, add up to more than the request's wall time.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+@dataclass
+class StageRecord:
+    """Sizes a stage fills in while it runs."""
+
+    bytes_in: int = 0
+    bytes_out: int = 0
+    pages: int = 0
+
+
+def _new_totals() -> Dict[str, float]:
+    return {'count': 0, 'seconds': 0.0, 'bytes_in': 0, 'bytes_out': 0, 'pages': 0}
+
+
+def _add(totals: Dict[str, float], seconds: float, record: StageRecord):
+    totals['count'] += 1
+    totals['seconds'] += seconds
+    totals['bytes_in'] += record.bytes_in
+    totals['bytes_out'] += record.bytes_out
+    totals['pages'] += record.pages
+
+
+class RenderTrace:
+    """Stage totals for one request, or for one part of it when nested in the request's trace."""
+
+    def __init__(self, parent: Optional['RenderTrace'] = None):
+        """Start the trace's clock; stages are also recorded into parent."""
+        self.started = time.perf_counter()
+        self.parent = parent
+        self._stages: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, name: str, seconds: float, record: StageRecord):
+        """Add one run of a stage."""
+        with self._lock:
+            _add(self._stages.setdefault(name, _new_totals()), seconds, record)
+        if self.parent is not None:
+            self.parent.record(name, seconds, record)
+
+    def stages(self) -> Dict[str, Dict[str, float]]:
+        """Return the totals per stage, in the order the stages first ran."""
+        with self._lock:
+            return {name: dict(totals) for name, totals in self._stages.items()}
+
+    def totals(self, name: str) -> Dict[str, float]:
+        """Return one stage's totals, all zero when it has not run."""
+        with self._lock:
+            return dict(self._stages.get(name) or _new_totals())
+
+    def server_timing(self) -> str:
+        """Return a Server-Timing header value with each stage's total and the request's elapsed time."""
+        entries = [
+            f'{name};dur={totals["seconds"] * 1000:.1f};desc="{totals["count"]}x"'
+            for name, totals in self.stages().items()
+        ]
+        entries.append(f'total;dur={(time.perf_counter() - self.started) * 1000:.1f}')
+        return ', '.join(entries)
+
+
+class RenderMetrics:
+    """Process wide stage totals, with a histogram of each stage's durations."""
+
+    def __init__(self, buckets: Tuple[float, ...] = STAGE_BUCKETS):
+        """Start with no stages recorded."""
+        self.buckets = buckets
+        self._stages: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, name: str, seconds: float, record: StageRecord):
+        """Add one run of a stage."""
+        with self._lock:
+            stage_stats = self._stages.get(name)
+            if stage_stats is None:
+                stage_stats = self._stages[name] = {**_new_totals(), 'buckets': [0] * len(self.buckets)}
+            _add(stage_stats, seconds, record)
+            for index, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    stage_stats['buckets'][index] += 1
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Return the totals per stage; buckets hold cumulative counts for each bound in self.buckets."""
+        with self._lock:
+            return {
+                name: {**stage_stats, 'buckets': list(stage_stats['buckets'])}
+                for name, stage_stats in self._stages.items()
+            }
+
+    def clear(self):
+        """Forget every stage."""
+        with self._lock:
+            self._stages.clear()
+
+
+render_metrics = RenderMetrics()  # pylint: disable=invalid-name; lower case like the template registry
+
+_current_trace: ContextVar[Optional[RenderTrace]] = ContextVar('render_trace', default=None)
+
+
+def start_trace() -> Tuple[RenderTrace, Token]:
+    """Start a trace for the current request; pass the token to end_trace."""
+    trace = RenderTrace()
+    return trace, _current_trace.set(trace)
+
+
+def end_trace(token: Token):
+    """Stop recording into the trace started with token."""
+    _current_trace.reset(token)
+
+
+def current_trace() -> Optional[RenderTrace]:
+    """Return the current request's trace, or None outside a traced request."""
+    return _current_trace.get()
+
+
+@contextmanager
+def nested_trace() -> Iterator[RenderTrace]:
+    """Trace the block on its own, still recording its stages into the current request's trace."""
+    trace = RenderTrace(_current_trace.get())
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+def record_stage(name: str, seconds: float, record: Optional[StageRecord] = None):
+    """Record one run of the named stage that was timed by the caller."""
+    record = record or StageRecord()
+    render_metrics.record(name, seconds, record)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.record(name, seconds, record)
+
+
+@contextmanager
+def stage(name: str, bytes_in: int = 0) -> Iterator[StageRecord]:
+    """Time the block as one run of the named stage; set bytes_out and pages on the yielded record."""
+    record = StageRecord(bytes_in=bytes_in)
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record_stage(name, time.perf_counter() - start, record)
@@ -0,0 +1,222 @@
+# Copyright © 2025 Province of British Columbia
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Batches of small reports rendered concurrently and sent back as one zip archive or one merged PDF.
+
+Items render on a worker pool shared by every batch in the process, so concurrent batches queue behind
+each other instead of multiplying the load on Gotenberg. Results are written out in item order as they
+finish; an item that fails is reported in the manifest and the rest of the batch still completes.
+"""
+import json
+import re
+import shutil
+import threading
+import zipfile
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List, Optional
+
+from flask import current_app
+from jinja2 import TemplateNotFound
+
+from api.services.pdf_spool import PdfSource, is_spooled, open_pdf, pdf_size, save_pdf
+from api.services.report_service import ReportService
+from api.services.weasyprint_pool import ReportRenderTimeoutError
+
+
+MANIFEST_NAME = 'manifest.json'
+UNSAFE_FILE_NAME_CHARS = re.compile(r'[\\/:*?"<>|\x00-\x1f]')
+
+
+@dataclass
+class BatchItemResult:
+    """Outcome of one batch item: its PDF, or the error that stopped it."""
+
+    index: int
+    report_name: str
+    file_name: str
+    report: Optional[PdfSource] = None
+    error: Optional[str] = None
+
+    def manifest_entry(self) -> Dict[str, Any]:
+        """Return the item as listed in the batch manifest."""
+        return {
+            'index': self.index,
+            'reportName': self.report_name,
+            'fileName': self.file_name if self.error is None else None,
+            'status': 'failed' if self.error else 'completed',
+            'error': self.error,
+            'size': pdf_size(self.report) if self.report is not None else None,
+        }
+
+    def close(self):
+        """Release the item's PDF once it has been written out."""
+        if self.report is not None and is_spooled(self.report):
+            self.report.close()
+
+
+class ReportBatchService:
+    """Render the items of report batches on a process wide worker pool."""
+
+    _instance: Optional['ReportBatchService'] = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, app, workers: int = 4, max_items: int = 100):
+        """Create the worker pool; app is the Flask app items render under."""
+        self.app = app
+        self.max_items = max(1, max_items)
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='report-batch')
+
+    @classmethod
+    def get(cls) -> 'ReportBatchService':
+        """Return the process wide batch service, creating it from the app config on first use."""
+        with cls._instance_lock:
+            if cls._instance is None:
+                app = current_app._get_current_object()  # pylint: disable=protected-access
+                cls._instance = cls(
+                    app,
+                    workers=app.config.get('REPORT_BATCH_WORKERS', 4),
+                    max_items=app.config.get('REPORT_BATCH_MAX_ITEMS', 100),
+                )
+            return cls._instance
+
+    @classmethod
+    def reset(cls):
+        """Close the process wide service so the next call to get builds a fresh one."""
+        with cls._instance_lock:
+            instance, cls._instance = cls._instance, None
+        if instance is not None:
+            instance.close()
+
+    def close(self):
+        """Wait for rendering items, then stop the worker pool."""
+        self._executor.shutdown(wait=True)
+
+    def submit(self, items: List[Dict[str, Any]], base_url: str) -> Iterator[BatchItemResult]:
+        """Queue every item and return their results in item order, each as soon as it is ready."""
+        if not isinstance(items, list) or not items:
+            raise ValueError('items must be a non empty array')
+        if len(items) > self.max_items:
+            raise ValueError(f'A batch holds at most {self.max_items} items')
+        if not all(isinstance(item, dict) for item in items):
+            raise ValueError('Each item must be an object')
+
+        file_names = set()
+        futures: List[Future] = []
+        for index, item in enumerate(items):
+            report_name = str(item.get('reportName') or f'report-{index + 1}')
+            file_name = _unique_file_name(report_name, file_names)
+            futures.append(self._executor.submit(self._render, index, report_name, file_name, item, base_url))
+        return (future.result() for future in futures)
+
+    def _render(self, index: int, report_name: str, file_name: str, item: Dict[str, Any],
+                base_url: str) -> BatchItemResult:
+        result = BatchItemResult(index, report_name, file_name)
+        with self.app.test_request_context(base_url=base_url):
+            try:
+                result.report = self._render_item(item)
+            except TemplateNotFound:
+                result.error = 'Template not found'
+            except (ValueError, ReportRenderTimeoutError) as err:
+                result.error = str(err)
+            except Exception as err:  # noqa: B902 pylint: disable=broad-exception-caught
+                current_app.logger.error('Report batch item %s failed: %s', index, err)
+                result.error = 'Report failed'
+        return result
+
+    @staticmethod
+    def _render_item(item: Dict[str, Any]) -> PdfSource:
+        template_vars = item.get('templateVars')
+        if template_vars is None:
+            raise ValueError('templateVars is required')
+        populate_page_number = bool(item.get('populatePageNumber', None))
+        if 'templateName' in item:
+            return ReportService.create_report_from_stored_template(
+                item['templateName'], template_vars, populate_page_number
+            )
+        if 'template' in item:
+            return ReportService.create_report_from_template(item['template'], template_vars, populate_page_number)
+        raise ValueError('templateName or template is required')
+
+
+def _unique_file_name(report_name: str, taken: set) -> str:
+    """Return report_name as a PDF file name safe for an archive, numbered if already taken."""
+    stem = UNSAFE_FILE_NAME_CHARS.sub('_', report_name).strip(' .') or 'report'
+    file_name, number = f'{stem}.pdf', 1
+    while file_name in taken:
+        number += 1
+        file_name = f'{stem} ({number}).pdf'
+    taken.add(file_name)
+    return file_name
+
+
+def write_zip(results: Iterable[BatchItemResult], output: BinaryIO) -> List[Dict[str, Any]]:
+    """Write each completed PDF and a manifest of every item into a zip archive, returning the manifest."""
+    manifest = []
+    # PDFs are compressed already, so the archive stores them as they are
+    with zipfile.ZipFile(output, 'w', zipfile.ZIP_STORED) as archive:
+        for result in results:
+            entry = result.manifest_entry()
+            if result.report is not None:
+                try:
+                    with archive.open(result.file_name, 'w', force_zip64=True) as item:
+                        if is_spooled(result.report):
+                            result.report.seek(0)
+                            shutil.copyfileobj(result.report, item)
+                        else:
+                            item.write(result.report)
+                except Exception as err:  # noqa: B902 pylint: disable=broad-exception-caught
+                    entry = _write_failed(result, 'archived', err)
+                finally:
+                    result.close()
+            manifest.append(entry)
+        archive.writestr(MANIFEST_NAME, json.dumps({'items': manifest}, indent=2))
+    output.seek(0)
+    return manifest
+
+
+def write_merged_pdf(results: Iterable[BatchItemResult], output: BinaryIO) -> List[Dict[str, Any]]:
+    """Merge each completed PDF into one document with a bookmark per item, returning the manifest.
+
+    Nothing is written when no item completed.
+    """
+    from pikepdf import OutlineItem, Pdf  # pylint:disable=import-outside-toplevel
+
+    manifest = []
+    with Pdf.new() as out_pdf:
+        with out_pdf.open_outline() as outline:
+            for result in results:
+                entry = result.manifest_entry()
+                if result.report is not None:
+                    first_page = len(out_pdf.pages) + 1
+                    try:
+                        with open_pdf(result.report) as src:
+                            out_pdf.pages.extend(src.pages)
+                        outline.root.append(OutlineItem(result.report_name, first_page - 1))
+                        entry['firstPage'] = first_page
+                    except Exception as err:  # noqa: B902 pylint: disable=broad-exception-caught
+                        del out_pdf.pages[first_page - 1:]
+                        entry = _write_failed(result, 'merged', err)
+                    finally:
+                        result.close()
+                manifest.append(entry)
+        if len(out_pdf.pages):
+            save_pdf(out_pdf, output)
+    return manifest
+
+
+def _write_failed(result: BatchItemResult, action: str, err: Exception) -> Dict[str, Any]:
+    """Mark an item whose PDF rendered but could not be written out as failed, returning its manifest entry."""
+    current_app.logger.error('Report batch item %s could not be %s: %s', result.index, action, err)
+    result.error = f'Report could not be {action}'
+    return result.manifest_entry()
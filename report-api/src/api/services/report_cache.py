@@ -0,0 +1,263 @@
+# Copyright © 2025 Province of British Columbia
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Content addressed cache of PDFs generated from stored templates.
+
+A cached PDF is keyed by the template name, a hash of the template and everything it includes, a hash
+of the canonical JSON form of the template variables and the page number flag, so editing a template or
+changing any variable is a miss. Backends are an in-process LRU, a local directory or a Redis-compatible
+server, each with a TTL and a size limit.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from flask import current_app
+
+from api.services.pdf_spool import PdfSource, pdf_bytes, pdf_size
+from api.services.template_registry import template_registry
+from api.utils.util import TEMPLATE_FOLDER_PATH
+
+
+class MemoryCacheBackend:
+    """Least recently used cache held in the worker process, bounded by total bytes."""
+
+    def __init__(self, max_bytes: int):
+        """Create an empty cache holding at most max_bytes of PDFs."""
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        self._entries: 'OrderedDict[str, Tuple[bytes, float]]' = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Return the value for key, or None when it is missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] < time.time():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key: str, value: bytes, ttl: int):
+        """Store value for ttl seconds, evicting the least recently used entries to stay in budget."""
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, time.time() + ttl)
+            self._size += len(value)
+            while self._size > self.max_bytes and self._entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key: str):
+        value, _ = self._entries.pop(key)
+        self._size -= len(value)
+
+
+class DiskCacheBackend:
+    """Cache stored as files in a local directory, bounded by total bytes."""
+
+    def __init__(self, directory: str, max_bytes: int):
+        """Use directory for cached PDFs, creating it if needed."""
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Return the value for key, or None when it is missing or expired."""
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as cached:
+                expires_at = float(cached.readline())
+                if expires_at < time.time():
+                    os.remove(path)
+                    return None
+                value = cached.read()
+        except (FileNotFoundError, ValueError):
+            return None
+        os.utime(path)  # the mtime orders eviction, so a hit counts as a use
+        return value
+
+    def set(self, key: str, value: bytes, ttl: int):
+        """Store value for ttl seconds, then evict the least recently used files beyond the budget."""
+        path = self._path(key)
+        temp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temp_path, 'wb') as cached:
+            cached.write(f'{time.time() + ttl}\n'.encode('ascii'))
+            cached.write(value)
+        os.replace(temp_path, path)
+        self._evict()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f'{key}.pdf')
+
+    def _evict(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.pdf'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            self.evictions += 1
+
+
+class RedisCacheBackend:
+    """Cache in a Redis-compatible server; size eviction is left to the server's maxmemory policy."""
+
+    def __init__(self, url: str, prefix: str = 'report-api:pdf:'):
+        """Connect to the server at url; requires the optional redis package."""
+        import redis  # pylint: disable=import-outside-toplevel,import-error
+
+        self.prefix = prefix
+        self.evictions = 0
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Return the value for key, or None when it is missing or expired."""
+        return self._client.get(self.prefix + key)
+
+    def set(self, key: str, value: bytes, ttl: int):
+        """Store value for ttl seconds."""
+        self._client.set(self.prefix + key, value, ex=ttl)
+
+
+class ReportCache:
+    """Result cache for stored template reports, with hit and miss counts."""
+
+    _instance: Optional['ReportCache'] = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, backend, ttl: int = 600, max_entry_bytes: int = 8 * 1024 * 1024):
+        """Cache PDFs up to max_entry_bytes in backend for ttl seconds."""
+        self.backend = backend
+        self.ttl = ttl
+        self.max_entry_bytes = max_entry_bytes
+        self._counts = {'hits': 0, 'misses': 0, 'stores': 0, 'skipped': 0, 'errors': 0}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def init_app(cls, app):
+        """Start the configured cache with the app; REPORT_CACHE_BACKEND=redis without redis installed is refused."""
+        backend_name = (app.config.get('REPORT_CACHE_BACKEND') or '').lower()
+        if not backend_name:
+            return
+        if backend_name == 'redis':
+            try:
+                import redis  # noqa: F401 pylint: disable=import-outside-toplevel,import-error,unused-import
+            except ImportError as err:
+                raise RuntimeError(
+                    'REPORT_CACHE_BACKEND=redis needs the redis package, which is not installed; '
+                    'install it or use the memory or disk backend'
+                ) from err
+        with app.app_context():
+            cls.get()
+
+    @classmethod
+    def get(cls) -> Optional['ReportCache']:
+        """Return the process wide cache, or None when REPORT_CACHE_BACKEND is not set or cannot start."""
+        config = current_app.config
+        backend_name = (config.get('REPORT_CACHE_BACKEND') or '').lower()
+        if not backend_name:
+            return None
+        with cls._instance_lock:
+            if cls._instance is None:
+                try:
+                    backend = cls._create_backend(backend_name, config)
+                except Exception as err:  # noqa: B902 pylint: disable=broad-exception-caught
+                    # A cache that cannot start must not fail reports; it stays off until reset
+                    current_app.logger.error('Report cache %s disabled: %s', backend_name, err)
+                    backend = None
+                cls._instance = cls(
+                    backend,
+                    ttl=config.get('REPORT_CACHE_TTL', 600),
+                    max_entry_bytes=config.get('REPORT_CACHE_MAX_ENTRY_MB', 8) * 1024 * 1024,
+                )
+            return cls._instance if cls._instance.backend is not None else None
+
+    @classmethod
+    def reset(cls):
+        """Drop the process wide cache so the next call to get builds a fresh one."""
+        with cls._instance_lock:
+            cls._instance = None
+
+    @staticmethod
+    def _create_backend(backend_name: str, config):
+        max_bytes = config.get('REPORT_CACHE_MAX_MB', 64) * 1024 * 1024
+        if backend_name == 'memory':
+            return MemoryCacheBackend(max_bytes)
+        if backend_name == 'disk':
+            return DiskCacheBackend(config.get('REPORT_CACHE_DIR'), max_bytes)
+        if backend_name == 'redis':
+            return RedisCacheBackend(config.get('REPORT_CACHE_REDIS_URL'))
+        raise ValueError(f'unknown backend {backend_name!r}')
+
+    @staticmethod
+    def key(template_name: str, template_vars: object, generate_page_number: bool) -> str:
+        """Return the cache key for a stored template report."""
+        template_hash = template_registry.source_hash(f'{TEMPLATE_FOLDER_PATH}/{template_name}.html')
+        vars_json = json.dumps(template_vars, sort_keys=True, separators=(',', ':'), ensure_ascii=False, default=str)
+        vars_hash = hashlib.sha256(vars_json.encode('utf-8')).hexdigest()
+        return hashlib.sha256(
+            f'{template_name}\0{template_hash}\0{vars_hash}\0{bool(generate_page_number)}'.encode('utf-8')
+        ).hexdigest()
+
+    def lookup(self, key: str) -> Optional[bytes]:
+        """Return the cached PDF for key, or None; backend failures count as misses."""
+        try:
+            value = self.backend.get(key)
+        except Exception as err:  # noqa: B902 pylint: disable=broad-exception-caught
+            current_app.logger.warning('Report cache lookup failed: %s', err)
+            self._count('errors')
+            value = None
+        self._count('hits' if value is not None else 'misses')
+        return value
+
+    def store(self, key: str, value: PdfSource):
+        """Cache value under key unless it is larger than max_entry_bytes; backend failures are logged."""
+        if pdf_size(value) > self.max_entry_bytes:
+            self._count('skipped')
+            return
+        try:
+            self.backend.set(key, pdf_bytes(value), self.ttl)
+            self._count('stores')
+        except Exception as err:  # noqa: B902 pylint: disable=broad-exception-caught
+            current_app.logger.warning('Report cache store failed: %s', err)
+            self._count('errors')
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit, miss, store, skipped, error and eviction counts."""
+        with self._lock:
+            counts = dict(self._counts)
+        counts['evictions'] = self.backend.evictions
+        return counts
+
+    def _count(self, name: str):
+        with self._lock:
+            self._counts[name] += 1
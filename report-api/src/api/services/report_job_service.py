@@ -0,0 +1,316 @@
+# Copyright © 2025 Province of British Columbia
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Asynchronous report jobs, rendered by a worker pool and held in a file spool until they expire.
+
+Job state and finished PDFs live in the spool directory rather than in memory, so any worker process
+sharing the directory can answer a status poll or serve the result.
+"""
+import ipaddress
+import json
+import os
+import re
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional, Sequence
+from urllib.parse import urlparse
+
+import requests
+from flask import current_app
+from jinja2 import TemplateNotFound
+
+from api.services.pdf_spool import PdfSource, copy_pdf, is_spooled, pdf_size
+from api.services.report_service import ReportService
+from api.services.template_registry import template_registry
+from api.utils.util import TEMPLATE_FOLDER_PATH, sanitize_template_name
+
+
+JOB_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+
+class ReportJobQueueFullError(Exception):
+    """Raised when a job is submitted while the queue is at its limit."""
+
+
+def _now_iso(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).isoformat()
+
+
+class ReportSpool:
+    """Directory of job state files and finished PDFs, bounded by age and total bytes."""
+
+    def __init__(self, directory: str, ttl: int, max_bytes: int):
+        """Use directory for the spool, creating it if needed."""
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def state_path(self, job_id: str) -> str:
+        """Return the path of the job's state file."""
+        return os.path.join(self.directory, f'{job_id}.json')
+
+    def result_path(self, job_id: str) -> str:
+        """Return the path of the job's PDF."""
+        return os.path.join(self.directory, f'{job_id}.pdf')
+
+    def read_state(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Return the job's state, or None if the job is unknown or finished and past its expiry."""
+        if not JOB_ID_PATTERN.match(job_id or ''):
+            return None
+        try:
+            with open(self.state_path(job_id), encoding='utf-8') as state_file:
+                state = json.load(state_file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        # Jobs still queued or running never expire, however long they wait
+        if state['expiresAt'] is not None and state['expiresAt'] < time.time():
+            self.remove(job_id)
+            return None
+        return state
+
+    def write_state(self, state: Dict[str, Any]):
+        """Replace the job's state file atomically."""
+        path = self.state_path(state['jobId'])
+        self._write(path, json.dumps(state).encode('utf-8'))
+
+    def write_result(self, job_id: str, report: PdfSource):
+        """Store the job's PDF, given as bytes or a spooled file, atomically."""
+        self._write(self.result_path(job_id), report)
+
+    def remove(self, job_id: str):
+        """Delete everything spooled for the job."""
+        for path in (self.result_path(job_id), self.state_path(job_id)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def purge(self):
+        """Remove expired jobs, then the oldest finished results until the spool fits its byte budget."""
+        now = time.time()
+        results = []
+        for entry in os.scandir(self.directory):
+            job_id, extension = os.path.splitext(entry.name)
+            if extension == '.json':
+                state = self.read_state(job_id)
+                if state and state['status'] in ('completed', 'failed') and state.get('size'):
+                    results.append((state['completedAt'], state['size'], job_id))
+            elif extension == '.tmp' and entry.stat().st_mtime < now - self.ttl:
+                os.remove(entry.path)
+        total = sum(size for _, size, _ in results)
+        for _, size, job_id in sorted(results):
+            if total <= self.max_bytes:
+                break
+            self.remove(job_id)
+            total -= size
+
+    @staticmethod
+    def _write(path: str, content: PdfSource):
+        temp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temp_path, 'wb') as spool_file:
+            copy_pdf(content, spool_file)
+        os.replace(temp_path, path)
+
+
+class ReportJobService:  # pylint: disable=too-many-instance-attributes
+    """Queue PDF reports for background rendering and track them through the spool."""
+
+    _instance: Optional['ReportJobService'] = None
+    _instance_lock = threading.Lock()
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        app,
+        spool: ReportSpool,
+        *,
+        workers: int = 2,
+        max_queued: int = 20,
+        callback_hosts: Sequence[str] = (),
+        callback_timeout: int = 10,
+    ):
+        """Create the worker pool; app is the Flask app jobs run under."""
+        self.app = app
+        self.spool = spool
+        self.max_queued = max(1, max_queued)
+        self.callback_hosts = tuple(host.lower() for host in callback_hosts if host)
+        self.callback_timeout = callback_timeout
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='report-job')
+        self._outstanding = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def get(cls) -> 'ReportJobService':
+        """Return the process wide job service, creating it from the app config on first use."""
+        with cls._instance_lock:
+            if cls._instance is None:
+                config = current_app.config
+                cls._instance = cls(
+                    current_app._get_current_object(),  # pylint: disable=protected-access
+                    ReportSpool(
+                        config.get('REPORT_JOB_SPOOL_DIR'),
+                        ttl=config.get('REPORT_JOB_TTL', 3600),
+                        max_bytes=config.get('REPORT_JOB_SPOOL_MAX_MB', 1024) * 1024 * 1024,
+                    ),
+                    workers=config.get('REPORT_JOB_WORKERS', 2),
+                    max_queued=config.get('REPORT_JOB_MAX_QUEUED', 20),
+                    callback_hosts=[host.strip() for host in config.get('REPORT_JOB_CALLBACK_HOSTS', '').split(',')],
+                )
+            return cls._instance
+
+    @classmethod
+    def reset(cls):
+        """Wait for running jobs, then drop the process wide service."""
+        with cls._instance_lock:
+            if cls._instance is not None:
+                cls._instance._executor.shutdown(wait=True)  # pylint: disable=protected-access
+                cls._instance = None
+
+    def submit(self, request_json: Dict[str, Any], base_url: str) -> Dict[str, Any]:
+        """Validate and queue a PDF report request, returning the new job's state."""
+        template_vars = request_json.get('templateVars')
+        if template_vars is None:
+            raise ValueError('templateVars is required')
+        if 'templateName' in request_json:
+            sanitized_name = sanitize_template_name(request_json['templateName'])
+            template_registry.get_template(f'{TEMPLATE_FOLDER_PATH}/{sanitized_name}.html')
+        elif 'template' not in request_json:
+            raise ValueError('templateName or template is required')
+        callback_url = request_json.get('callbackUrl')
+        if callback_url:
+            self._check_callback_url(callback_url)
+
+        with self._lock:
+            if self._outstanding >= self.max_queued:
+                raise ReportJobQueueFullError('Too many report jobs queued')
+            self._outstanding += 1
+
+        try:
+            self.spool.purge()
+            created = time.time()
+            state = {
+                'jobId': uuid.uuid4().hex,
+                'status': 'queued',
+                'fileName': f'{request_json.get("reportName", "report")}.pdf',
+                'createdAt': created,
+                'completedAt': None,
+                'expiresAt': None,
+                'size': None,
+                'error': None,
+            }
+            self.spool.write_state(state)
+            self._executor.submit(self._run, state, request_json, base_url, callback_url)
+        except Exception:  # noqa: B902
+            with self._lock:
+                self._outstanding -= 1
+            raise
+        return state
+
+    def stats(self) -> Dict[str, int]:
+        """Return the jobs queued or running and the queue limit."""
+        with self._lock:
+            return {'outstanding': self._outstanding, 'max_queued': self.max_queued}
+
+    def status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Return the job's state, or None if it is unknown or expired."""
+        return self.spool.read_state(job_id)
+
+    def _run(self, state: Dict[str, Any], request_json: Dict[str, Any], base_url: str, callback_url: Optional[str]):
+        try:
+            with self.app.test_request_context(base_url=base_url):
+                state['status'] = 'running'
+                self.spool.write_state(state)
+                try:
+                    report = self._render(request_json)
+                    self.spool.write_result(state['jobId'], report)
+                    state.update(status='completed', size=pdf_size(report))
+                    if is_spooled(report):
+                        report.close()
+                except TemplateNotFound:
+                    state.update(status='failed', error='Template not found')
+                except Exception as err:  # noqa: B902 pylint: disable=broad-exception-caught
+                    current_app.logger.error('Report job %s failed: %s', state['jobId'], err)
+                    state.update(status='failed', error=str(err) if isinstance(err, ValueError) else 'Report failed')
+                state['completedAt'] = time.time()
+                state['expiresAt'] = state['completedAt'] + self.spool.ttl
+                self.spool.write_state(state)
+                if callback_url:
+                    self._notify(callback_url, state)
+        finally:
+            with self._lock:
+                self._outstanding -= 1
+
+    @staticmethod
+    def _render(request_json: Dict[str, Any]) -> PdfSource:
+        template_vars = request_json['templateVars']
+        populate_page_number = bool(request_json.get('populatePageNumber', None))
+        if 'templateName' in request_json:
+            return ReportService.create_report_from_stored_template(
+                request_json['templateName'], template_vars, populate_page_number
+            )
+        return ReportService.create_report_from_template(request_json['template'], template_vars, populate_page_number)
+
+    def _check_callback_url(self, callback_url: str):
+        """Reject a callback URL off the allowlist or resolving to a loopback, private or link-local address."""
+        if not self.callback_hosts:
+            raise ValueError('callbackUrl is not enabled')
+        parsed = urlparse(callback_url)
+        if parsed.scheme not in ('http', 'https') or not parsed.hostname:
+            raise ValueError('callbackUrl must be an http or https URL')
+        if parsed.hostname.lower() not in self.callback_hosts:
+            raise ValueError('callbackUrl host is not allowed')
+        try:
+            addresses = socket.getaddrinfo(parsed.hostname, parsed.port or parsed.scheme, proto=socket.IPPROTO_TCP)
+        except (socket.gaierror, ValueError) as err:
+            raise ValueError('callbackUrl host does not resolve') from err
+        if any(_is_internal_address(address[4][0]) for address in addresses):
+            raise ValueError('callbackUrl host is not allowed')
+
+    def _notify(self, callback_url: str, state: Dict[str, Any]):
+        payload = {
+            'jobId': state['jobId'],
+            'status': state['status'],
+            'error': state['error'],
+            'completedAt': _now_iso(state['completedAt']),
+            'expiresAt': _now_iso(state['expiresAt']),
+        }
+        try:
+            # Checked again, as the host may resolve differently by the time the job finishes
+            self._check_callback_url(callback_url)
+            requests.post(callback_url, json=payload, timeout=self.callback_timeout, allow_redirects=False)
+        except (ValueError, requests.RequestException) as err:
+            current_app.logger.warning('Report job %s callback failed: %s', state['jobId'], err)
+
+
+def _is_internal_address(address: str) -> bool:
+    """Return True for loopback, private, link-local and other addresses not reachable on the internet."""
+    ip_address = ipaddress.ip_address(address.split('%')[0])
+    return not ip_address.is_global or ip_address.is_multicast
+
+
+def job_response(state: Dict[str, Any]) -> Dict[str, Any]:
+    """Return the public view of a job's state."""
+    return {
+        'jobId': state['jobId'],
+        'status': state['status'],
+        'fileName': state['fileName'],
+        'error': state['error'],
+        'size': state['size'],
+        'createdAt': _now_iso(state['createdAt']),
+        'completedAt': _now_iso(state['completedAt']) if state['completedAt'] else None,
+        'expiresAt': _now_iso(state['expiresAt']) if state['expiresAt'] else None,
+    }
@@ -16,59 +16,41 @@
 
 import base64
 
-from dateutil import parser
 from flask import url_for
-from jinja2 import Environment, FileSystemLoader
-from jinja2.sandbox import SandboxedEnvironment
-from weasyprint import HTML
 
 from api.services.chunk_report_service import ChunkReportService
 from api.services.footer_service import add_page_numbers_to_pdf
 from api.services.gotenberg_service import GotenbergService
 from api.services.page_info import populate_page_count, populate_page_info
+from api.services.pdf_spool import PdfSource
+from api.services.render_metrics import stage
+from api.services.report_cache import ReportCache
+from api.services.template_registry import template_registry
+from api.services.weasyprint_pool import WeasyPrintPool, render_template_pdf, write_pdf
 from api.utils.util import TEMPLATE_FOLDER_PATH, sanitize_template_name
 
 
-def format_datetime(value, format='short'):  # pylint: disable=redefined-builtin
-    """Filter to format datetime globally."""
-    dt_format = '%m-%d-%Y'
-    if format == 'full':
-        dt_format = '%m-%d-%Y %I:%M %p'
-    elif format == 'short':
-        dt_format = '%m-%d-%Y'
-    elif format == 'month':
-        dt_format = '%B'
-    elif format == 'yyyy-mm-dd':
-        dt_format = '%Y-%m-%d'
-    elif format == 'mmm dd,yyyy':
-        dt_format = '%B %e, %Y'
-    elif format == 'detail':
-        dt_format = '%B %d, %Y at %I:%M %p Pacific Time'
-    elif format == 'unix':
-        return int(parser.parse(value).timestamp())
-
-    return parser.parse(value).strftime(dt_format)
-
-
-ENV = Environment(loader=FileSystemLoader('.'), autoescape=True)
-ENV.filters['format_datetime'] = format_datetime
-
-
 class ReportService:
     """Service for all template related operations."""
 
+    @staticmethod
+    def _is_chunked(template_name: str, template_args: object) -> bool:
+        """Return True for a statement_report with grouped_invoices, which renders chunk by chunk."""
+        is_statement = 'statement_report' in (template_name or '')
+        return is_statement and bool((template_args or {}).get('grouped_invoices'))
+
     @staticmethod
     def _finalize_pdf(
         template_name: str,
         template_args: object,
         html_out: str,
         generate_page_number: bool,
-    ) -> bytes:
-        """Route to chunk only when statement_report has grouped_invoices; else render directly."""
-        is_statement = 'statement_report' in (template_name or '')
-        has_grouped_invoices = bool((template_args or {}).get('grouped_invoices'))
+    ) -> PdfSource:
+        """Route to chunk only when statement_report has grouped_invoices; else render directly.
 
-        if is_statement and has_grouped_invoices:
+        Chunked statements come back as a spooled file, everything else as bytes.
+        """
+        if ReportService._is_chunked(template_name, template_args):
             return ChunkReportService.create_chunk_report(
                 template_name,
                 template_args,
@@ -84,7 +66,7 @@ class ReportService:
         template_args: dict = None
     ):
         """Generate pdf out of the html using Gotenberg."""
-        main_pdf_bytes = GotenbergService.convert_html_to_pdf_sync(html_out).content
+        main_pdf_bytes = GotenbergService.convert_html_to_pdf_sync(html_out)
 
         footer_args = dict(template_args or {})
         footer_args['current_template'] = template_name
@@ -97,44 +79,58 @@ class ReportService:
         template_args: object,
         generate_page_number: bool = False,
     ):
-        """Create a report from a stored template."""
+        """Create a report from a stored template, reusing a cached PDF when the result cache is on."""
         sanitized_name = sanitize_template_name(template_name)
-        template = ENV.get_template(f'{TEMPLATE_FOLDER_PATH}/{sanitized_name}.html')
+        if ReportService._is_chunked(template_name, template_args):
+            # Each chunk renders its own slice, so the whole statement is never rendered here. Chunked
+            # statements are far over any cache entry limit, so they skip the cache and its key hashing.
+            return ChunkReportService.create_chunk_report(template_name, template_args, generate_page_number)
+
+        cache = ReportCache.get()
+        cache_key = None
+        if cache is not None:
+            cache_key = cache.key(sanitized_name, template_args, generate_page_number)
+            cached_report = cache.lookup(cache_key)
+            if cached_report is not None:
+                return cached_report
+
         bc_logo_url = url_for('static', filename='images/bcgov-logo-vert.jpg')
         registries_url = url_for('static', filename='images/reg_logo.png')
-        html_out = template.render(
-            template_args, bclogoUrl=bc_logo_url, registriesurl=registries_url
-        )
+        with stage('template_render') as record:
+            html_out = template_registry.render(
+                f'{TEMPLATE_FOLDER_PATH}/{sanitized_name}.html',
+                template_args, bclogoUrl=bc_logo_url, registriesurl=registries_url
+            )
+            record.bytes_out = len(html_out)
 
-        # Finalize via shared helper (chunk when name contains 'statement_report')
-        return ReportService._finalize_pdf(
+        report = ReportService._finalize_pdf(
             template_name,
             template_args,
             html_out,
             generate_page_number,
         )
+        if cache_key is not None:
+            cache.store(cache_key, report)
+        return report
 
     @classmethod
     def create_report_from_template(cls, template_string: str, template_args: object,
                                     generate_page_number: bool = False):
-        """Create a report from a json template."""
+        """Create a report from a json template, rendered in the sandbox by the warm WeasyPrint pool."""
         template_decoded = base64.b64decode(template_string).decode('utf-8')
-        # Use a sandboxed environment for user-supplied templates
-        sandbox_env = SandboxedEnvironment(autoescape=True)
-        sandbox_env.filters['format_datetime'] = format_datetime
-        template_ = sandbox_env.from_string(template_decoded)
-        html_out = template_.render(template_args)
-
-        return ReportService.generate_pdf_weasyprint(html_out, generate_page_number)
+        with stage('weasyprint_render', len(template_decoded)) as record:
+            pool = WeasyPrintPool.get()
+            if pool is not None:
+                report = pool.render(template_decoded, template_args, generate_page_number)
+            else:
+                report = render_template_pdf(template_decoded, template_args, generate_page_number)
+            record.bytes_out = len(report)
+        return report
 
     @staticmethod
     def generate_pdf_weasyprint(html_out, generate_page_number: bool = False):
         """Generate pdf out of the html."""
-        html = HTML(string=html_out).render(optimize_size=('fonts', 'images',))
-        if generate_page_number:
-            html = populate_page_info(html)
-
-        return html.write_pdf()
+        return write_pdf(html_out, generate_page_number)
 
     @staticmethod
     def populate_page_info(
@@ -0,0 +1,165 @@
+# Copyright © 2025 Province of British Columbia
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""In memory catalogue of the stored report-templates.
+
+The catalogue is built at startup with each template's size, content hash and mtime, and a background
+thread polls the template folder for changes. Listing templates and fetching a stored template are served
+from it, with ETags so clients can revalidate without the template being listed or rendered again.
+"""
+import hashlib
+import os
+import posixpath
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from jinja2 import TemplateNotFound
+
+from api.services.template_registry import template_registry
+from api.utils.util import TEMPLATE_FOLDER_PATH
+
+
+@dataclass(frozen=True)
+class TemplateEntry:
+    """One template file: its loader path, size, mtime and a hash of its content."""
+
+    path: str
+    size: int
+    mtime_ns: int
+    content_hash: str
+
+
+class TemplateCatalogue:  # pylint: disable=too-many-instance-attributes
+    """Template files under a folder, kept current by polling, with their rendered HTML cached."""
+
+    def __init__(self, folder: str = TEMPLATE_FOLDER_PATH):
+        """Create an empty catalogue of folder; it is built on first use or by init_app."""
+        self.folder = posixpath.normpath(folder)
+        self._entries: Optional[Dict[str, TemplateEntry]] = None
+        self._names: List[str] = []
+        self._etag = ''
+        self._rendered: Dict[str, Tuple[str, str]] = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._watcher: Optional[threading.Thread] = None
+        self._logger = None
+
+    def init_app(self, app):
+        """Build the catalogue and poll for changes every TEMPLATE_WATCH_SECONDS (0 checks only at startup)."""
+        self._logger = app.logger
+        self.refresh()
+        interval = app.config.get('TEMPLATE_WATCH_SECONDS', 5)
+        if interval > 0:
+            self.start_watcher(interval)
+
+    def refresh(self) -> bool:
+        """Rescan the folder, rehashing only files whose size or mtime changed; return whether anything did."""
+        previous = self._entries or {}
+        entries = {}
+        for root, _, files in os.walk(self.folder):
+            for filename in files:
+                if not filename.endswith('.html'):
+                    continue
+                path = posixpath.join(root.replace(os.sep, '/'), filename)
+                try:
+                    stat = os.stat(path)
+                    entry = previous.get(path)
+                    if entry is None or (entry.size, entry.mtime_ns) != (stat.st_size, stat.st_mtime_ns):
+                        with open(path, 'rb') as template_file:
+                            content_hash = hashlib.sha256(template_file.read()).hexdigest()
+                        entry = TemplateEntry(path, stat.st_size, stat.st_mtime_ns, content_hash)
+                except OSError:
+                    # Removed between the walk and the stat; the next scan no longer sees it
+                    continue
+                entries[path] = entry
+
+        if entries == self._entries:
+            return False
+        prefix = f'{self.folder}/'
+        names = sorted(posixpath.splitext(path[len(prefix):])[0] for path in entries
+                       if posixpath.dirname(path) == self.folder)
+        digest = hashlib.sha256()
+        for path in sorted(entries):
+            digest.update(f'{path}\0{entries[path].content_hash}\0'.encode('utf-8'))
+        with self._lock:
+            changed = self._entries is not None
+            self._entries, self._names, self._etag = entries, names, digest.hexdigest()[:32]
+            self._rendered.clear()
+            self._generation += 1
+        if changed and self._logger:
+            self._logger.info('Report templates changed on disk, %s templates catalogued', len(names))
+        return True
+
+    def entries(self) -> Dict[str, TemplateEntry]:
+        """Return every template file by loader path, includes and styles as well."""
+        self._ensure_built()
+        return dict(self._entries)
+
+    def listing(self) -> Tuple[List[str], str]:
+        """Return the names of the top level templates and an ETag that changes when any template does."""
+        self._ensure_built()
+        with self._lock:
+            return list(self._names), self._etag
+
+    def rendered(self, name: str) -> Tuple[str, str]:
+        """Return the stored template rendered without variables, and an ETag of that HTML."""
+        self._ensure_built()
+        path = f'{self.folder}/{name}.html'
+        with self._lock:
+            if path not in self._entries:
+                raise TemplateNotFound(name)
+            cached = self._rendered.get(name)
+            generation = self._generation
+        if cached:
+            return cached
+        html = template_registry.render(path)
+        cached = (html, hashlib.sha256(html.encode('utf-8')).hexdigest()[:32])
+        with self._lock:
+            # A change picked up while rendering may have made this HTML stale
+            if generation == self._generation:
+                self._rendered[name] = cached
+        return cached
+
+    def start_watcher(self, interval: float):
+        """Start the thread that refreshes the catalogue every interval seconds."""
+        if self._watcher is not None:
+            return
+        self._stop.clear()
+        self._watcher = threading.Thread(target=self._watch, args=(interval,), name='template-watcher',
+                                         daemon=True)
+        self._watcher.start()
+
+    def stop_watcher(self):
+        """Stop the watcher thread."""
+        if self._watcher is not None:
+            self._stop.set()
+            self._watcher.join(timeout=5)
+            self._watcher = None
+
+    def _watch(self, interval: float):
+        while not self._stop.wait(interval):
+            try:
+                self.refresh()
+            except Exception as err:  # noqa: B902 pylint: disable=broad-exception-caught
+                # Keep serving the last good catalogue; the next poll tries again
+                if self._logger:
+                    self._logger.warning('Report template scan failed: %s', err)
+
+    def _ensure_built(self):
+        if self._entries is None:
+            self.refresh()
+
+
+template_catalogue = TemplateCatalogue()  # pylint: disable=invalid-name; lower case like the template registry
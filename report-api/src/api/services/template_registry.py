@@ -0,0 +1,144 @@
+# Copyright © 2025 Province of British Columbia
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Process wide registry of the compiled report-templates.
+
+Every service renders stored templates through the one Jinja environment held here, so each template
+and its includes are compiled once per worker process. Templates are recompiled when their mtime
+changes, and compile and render timings are kept per template.
+"""
+import hashlib
+import os
+import posixpath
+import threading
+import time
+from typing import Dict, List, Tuple
+
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, Template, meta
+
+from api.utils.util import TEMPLATE_FOLDER_PATH, format_datetime
+
+
+class _TimedFileSystemLoader(FileSystemLoader):
+    """File system loader that reports how long each template took to load and compile."""
+
+    def __init__(self, registry: 'TemplateRegistry', searchpath: str):
+        """Create a loader reporting to registry."""
+        super().__init__(searchpath)
+        self._registry = registry
+
+    def load(self, environment, name, globals=None):  # pylint: disable=redefined-builtin
+        """Load and compile name, recording the time it took."""
+        start = time.perf_counter()
+        template = super().load(environment, name, globals)
+        self._registry.record(name, 'compile', time.perf_counter() - start)
+        return template
+
+
+class TemplateRegistry:
+    """Shared Jinja environment for the stored report-templates."""
+
+    def __init__(self):
+        """Create the environment; call init_app to apply the app config and precompile."""
+        self.env = Environment(loader=_TimedFileSystemLoader(self, '.'), autoescape=True, auto_reload=True)
+        self.env.filters['format_datetime'] = format_datetime
+        self._timings: Dict[str, Dict[str, float]] = {}
+        self._source_hashes: Dict[str, Tuple[List[Tuple[str, float]], str]] = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """Configure the bytecode cache and reloading from app config, then precompile every template."""
+        self.env.auto_reload = app.config.get('TEMPLATE_AUTO_RELOAD', True)
+        cache_dir = app.config.get('TEMPLATE_BYTECODE_CACHE_DIR')
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            self.env.bytecode_cache = FileSystemBytecodeCache(cache_dir)
+        if app.config.get('TEMPLATE_PRECOMPILE', True):
+            start = time.perf_counter()
+            compiled = self.precompile()
+            app.logger.info('Precompiled %s report templates in %.2fs', compiled, time.perf_counter() - start)
+
+    def precompile(self) -> int:
+        """Compile every template under the template folder and return how many compiled."""
+        compiled = 0
+        for name in self.template_names():
+            try:
+                self.env.get_template(name)
+                compiled += 1
+            except Exception:  # noqa: B902 pylint: disable=broad-exception-caught
+                # A broken template must not stop the worker booting; it fails again when requested
+                continue
+        return compiled
+
+    @staticmethod
+    def template_names() -> List[str]:
+        """Return the loader names of every .html file under the template folder."""
+        names = []
+        for root, _, files in os.walk(TEMPLATE_FOLDER_PATH):
+            for filename in files:
+                if filename.endswith('.html'):
+                    names.append(posixpath.normpath(posixpath.join(root.replace(os.sep, '/'), filename)))
+        return sorted(names)
+
+    def get_template(self, name: str) -> Template:
+        """Return the compiled template, recompiling it first if the file changed on disk."""
+        return self.env.get_template(posixpath.normpath(name))
+
+    def source_hash(self, name: str) -> str:
+        """Return a hash of the template source and everything it includes, refreshed when any file changes."""
+        name = posixpath.normpath(name)
+        cached = self._source_hashes.get(name)
+        if cached and all(os.path.getmtime(filename) == mtime for filename, mtime in cached[0]):
+            return cached[1]
+
+        digest = hashlib.sha256()
+        files = []
+        pending, seen = [name], set()
+        while pending:
+            template_name = pending.pop()
+            if template_name in seen:
+                continue
+            seen.add(template_name)
+            source, filename, _ = self.env.loader.get_source(self.env, template_name)
+            files.append((filename, os.path.getmtime(filename)))
+            digest.update(template_name.encode('utf-8'))
+            digest.update(source.encode('utf-8'))
+            pending.extend(ref for ref in meta.find_referenced_templates(self.env.parse(source)) if ref)
+
+        self._source_hashes[name] = (files, digest.hexdigest())
+        return digest.hexdigest()
+
+    def render(self, name: str, *args, **kwargs) -> str:
+        """Render the named template, recording the time it took."""
+        template = self.get_template(name)
+        start = time.perf_counter()
+        html_out = template.render(*args, **kwargs)
+        self.record(template.name, 'render', time.perf_counter() - start)
+        return html_out
+
+    def record(self, name: str, kind: str, seconds: float):
+        """Add one compile or render timing for name."""
+        with self._lock:
+            timings = self._timings.setdefault(name, {
+                'compiles': 0, 'compile_seconds': 0.0, 'renders': 0, 'render_seconds': 0.0,
+            })
+            timings[f'{kind}s'] += 1
+            timings[f'{kind}_seconds'] += seconds
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """Return compile and render counts and total seconds per template."""
+        with self._lock:
+            return {name: dict(timings) for name, timings in self._timings.items()}
+
+
+template_registry = TemplateRegistry()  # pylint: disable=invalid-name; lower case like the jwt manager
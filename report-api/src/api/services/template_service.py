@@ -14,34 +14,31 @@
 
 """Service to  manage report-templates."""
 
-import fnmatch
-import os
+from typing import List, Tuple
 
-from jinja2 import Environment, FileSystemLoader
-
-from api.utils.util import TEMPLATE_FOLDER_PATH, sanitize_template_name
-
-
-ENV = Environment(loader=FileSystemLoader('.'))
+from api.services.template_catalogue import template_catalogue
+from api.utils.util import sanitize_template_name
 
 
 class TemplateService:
     """Service for all template related operations."""
 
     @staticmethod
-    def find_all_templates():
+    def find_all_templates() -> List[str]:
         """Get all templates."""
-        template_names = []
-        list_of_files = os.listdir(TEMPLATE_FOLDER_PATH)
-        for filename in list_of_files:
-            if fnmatch.fnmatch(filename, '*.html'):
-                template_names.append(os.path.splitext(filename)[0])
-        return template_names
+        return template_catalogue.listing()[0]
+
+    @staticmethod
+    def find_all_templates_with_etag() -> Tuple[List[str], str]:
+        """Get all templates and an ETag of the listing."""
+        return template_catalogue.listing()
 
     @classmethod
     def get_stored_template(cls, templatename: str, ):
         """Get a stored template."""
-        sanitized_name = sanitize_template_name(templatename)
-        template = ENV.get_template(f'{TEMPLATE_FOLDER_PATH}/{sanitized_name}.html')
-        html_template = template.render()
-        return html_template
+        return cls.get_stored_template_with_etag(templatename)[0]
+
+    @staticmethod
+    def get_stored_template_with_etag(templatename: str) -> Tuple[str, str]:
+        """Get a stored template and an ETag of its HTML."""
+        return template_catalogue.rendered(sanitize_template_name(templatename))
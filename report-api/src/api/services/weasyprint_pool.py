@@ -0,0 +1,221 @@
+# Copyright © 2025 Province of British Columbia
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Warm WeasyPrint rendering for reports built from inline templates.
+
+Every process keeps one FontConfiguration, one image cache and one sandboxed Jinja environment with
+its compiled templates, instead of building them per request. Renders run in a pool of spawned
+processes, started with the app, that render a small document when they start, so font discovery
+and the user agent stylesheets are loaded before the first report. Each process takes one render at
+a time, so a render that takes longer than WEASYPRINT_RENDER_TIMEOUT seconds from when its process
+picks it up fails, and only that process is killed and replaced.
+"""
+import functools
+import multiprocessing
+import pickle
+import queue
+import threading
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing.connection import Connection
+from typing import Any, Dict, Optional
+
+from flask import current_app
+from jinja2 import Template
+from jinja2.sandbox import SandboxedEnvironment
+from weasyprint import HTML
+from weasyprint.text.fonts import FontConfiguration
+
+from api.services.page_info import page_info_elements, populate_page_info
+from api.utils.util import format_datetime
+
+
+IMAGE_CACHE_MAX_ENTRIES = 256
+
+_sandbox_env = SandboxedEnvironment(autoescape=True)
+_sandbox_env.filters['format_datetime'] = format_datetime
+_image_cache: Dict[str, Any] = {}
+
+
+class ReportRenderTimeoutError(Exception):
+    """Raised when a WeasyPrint render does not finish within its timeout."""
+
+
+@functools.lru_cache(maxsize=1)
+def _font_config() -> FontConfiguration:
+    return FontConfiguration()
+
+
+@functools.lru_cache(maxsize=64)
+def _compile(template_source: str) -> Template:
+    return _sandbox_env.from_string(template_source)
+
+
+def write_pdf(html_out: str, generate_page_number: bool = False) -> bytes:
+    """Render HTML to PDF with this process's shared font configuration and image cache."""
+    if len(_image_cache) > IMAGE_CACHE_MAX_ENTRIES:
+        _image_cache.clear()
+    html = HTML(string=html_out)
+    document = html.render(font_config=_font_config(), cache=_image_cache, optimize_size=('fonts', 'images',))
+    if generate_page_number:
+        document = populate_page_info(document, page_info_elements(html.etree_element))
+    return document.write_pdf()
+
+
+def render_template_pdf(template_source: str, template_args: object, generate_page_number: bool = False) -> bytes:
+    """Render an inline template in the sandbox and convert it to PDF; arguments must be picklable."""
+    return write_pdf(_compile(template_source).render(template_args), generate_page_number)
+
+
+def _init_worker():
+    """Load fonts and the user agent stylesheets once when a pool process starts."""
+    write_pdf('<html><body><p>Warm up</p></body></html>')
+
+
+def _render_result(task: tuple) -> tuple:
+    """Render task, returning (True, pdf) or (False, the exception) in a form the pipe can carry."""
+    try:
+        return True, render_template_pdf(*task)
+    except Exception as err:  # noqa: B902 pylint: disable=broad-exception-caught
+        try:
+            pickle.dumps(err)
+        except Exception:  # noqa: B902 pylint: disable=broad-exception-caught
+            err = RuntimeError(repr(err))
+        return False, err
+
+
+def _serve(conn: Connection):
+    """Warm up, say so, then answer each render sent on conn until the pool stops it or goes away."""
+    _init_worker()
+    try:
+        conn.send(None)
+        for task in iter(conn.recv, None):
+            conn.send(_render_result(task))
+    except (EOFError, OSError):
+        pass  # the pool closed the pipe
+
+
+class _RenderProcess:
+    """One spawned render process and the pipe it takes renders on."""
+
+    def __init__(self, context):
+        """Spawn the process; it warms up before taking its first render."""
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_serve, args=(child_conn,), name='weasyprint-render', daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.ready = False
+
+    def wait_ready(self):
+        """Wait for the process to finish warming up; raises EOFError if it died doing so."""
+        if not self.ready:
+            self.conn.recv()
+            self.ready = True
+
+    def stop(self):
+        """Ask the process to exit once it is idle."""
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.conn.close()
+
+    def kill(self):
+        """Kill the process, whatever it is doing."""
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+
+class WeasyPrintPool:
+    """Worker processes shared by every request in a worker, used to render inline-template reports."""
+
+    _instance: Optional['WeasyPrintPool'] = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, processes: int, timeout: float):
+        """Create a pool of processes that start warming up straight away."""
+        self.processes = max(1, processes)
+        self.timeout = timeout
+        self._context = multiprocessing.get_context('spawn')
+        self._idle: 'queue.Queue[_RenderProcess]' = queue.Queue()
+        self._lock = threading.Lock()
+        self._closed = False
+        for _ in range(self.processes):
+            self._idle.put(_RenderProcess(self._context))
+
+    @classmethod
+    def get(cls) -> Optional['WeasyPrintPool']:
+        """Return the process wide pool, or None when WEASYPRINT_RENDER_PROCESSES turns it off."""
+        processes = current_app.config.get('WEASYPRINT_RENDER_PROCESSES', 2)
+        if processes <= 0:
+            return None
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls(processes, current_app.config.get('WEASYPRINT_RENDER_TIMEOUT', 60))
+            return cls._instance
+
+    @classmethod
+    def init_app(cls, app):
+        """Create the pool at startup, so its processes warm up before the first inline-template report."""
+        with app.app_context():
+            cls.get()
+
+    @classmethod
+    def reset(cls, instance: Optional['WeasyPrintPool'] = None):
+        """Shut the process wide pool down so the next call to get builds a fresh one."""
+        with cls._instance_lock:
+            if cls._instance is not None and instance in (None, cls._instance):
+                cls._instance.close()
+                cls._instance = None
+
+    def close(self):
+        """Stop the pool processes once their current render, if any, is done."""
+        with self._lock:
+            self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().stop()
+            except queue.Empty:
+                return
+
+    def render(self, template_source: str, template_args: object, generate_page_number: bool = False) -> bytes:
+        """Render an inline template to PDF in a pool process, waiting at most the pool's timeout once it starts."""
+        worker = self._idle.get()
+        try:
+            worker.wait_ready()
+            worker.conn.send((template_source, template_args, generate_page_number))
+            if not worker.conn.poll(self.timeout):
+                # A stuck render cannot be cancelled, so its process alone is killed and replaced
+                worker = self._replace(worker)
+                raise ReportRenderTimeoutError(f'Report did not render within {self.timeout} seconds')
+            ok, result = worker.conn.recv()
+        except (EOFError, OSError) as err:
+            # The process died (e.g. OOM killed); replace it for later renders
+            worker = self._replace(worker)
+            raise BrokenProcessPool('A WeasyPrint render process exited unexpectedly') from err
+        finally:
+            self._release(worker)
+        if not ok:
+            raise result
+        return result
+
+    def _replace(self, worker: _RenderProcess) -> _RenderProcess:
+        worker.kill()
+        return _RenderProcess(self._context)
+
+    def _release(self, worker: _RenderProcess):
+        with self._lock:
+            if not self._closed:
+                self._idle.put(worker)
+                return
+        worker.stop()
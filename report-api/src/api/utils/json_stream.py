@@ -0,0 +1,224 @@
+# Copyright © 2025 Province of British Columbia
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Incremental decoding of large, optionally gzipped, JSON request bodies.
+
+The body is read and decompressed in blocks, with size limits checked as it goes, and decoded while it
+arrives. Containers on the streamed paths, such as every invoice's transactions, are walked one element
+at a time and each element is decoded by the C JSON scanner, so neither the compressed body, the
+decompressed bytes nor the decoded text ever exist in full; memory stays near the size of the result.
+"""
+import codecs
+import json
+import re
+import zlib
+from typing import Any, Dict, Iterable, Iterator, Optional, Sequence, Tuple
+
+
+BLOCK_SIZE = 64 * 1024
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+
+class RequestTooLargeError(ValueError):
+    """Raised when a request body or its decompressed JSON is over its size limit."""
+
+
+def read_body(
+    stream,
+    compressed: bool = False,
+    max_body_bytes: Optional[int] = None,
+    max_json_bytes: Optional[int] = None,
+) -> Iterator[bytes]:
+    """Yield the body of stream in blocks, gunzipping it when compressed, and enforce both size limits."""
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS) if compressed else None
+    body_bytes = json_bytes = 0
+    while True:
+        block = stream.read(BLOCK_SIZE)
+        if not block:
+            break
+        body_bytes += len(block)
+        if max_body_bytes is not None and body_bytes > max_body_bytes:
+            raise RequestTooLargeError(f'Request body is larger than {max_body_bytes} bytes')
+        while block:
+            if decompressor is None:
+                out, block = block, b''
+            else:
+                out = decompressor.decompress(block, BLOCK_SIZE)  # bounded output, so a gzip bomb is caught early
+                block = decompressor.unconsumed_tail
+                if decompressor.eof:
+                    # Concatenated gzip members decompress to the concatenation of their contents
+                    block = decompressor.unused_data + block
+                    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS) if block else decompressor
+            json_bytes += len(out)
+            if max_json_bytes is not None and json_bytes > max_json_bytes:
+                raise RequestTooLargeError(f'Request JSON is larger than {max_json_bytes} bytes')
+            if out:
+                yield out
+    if decompressor is not None and not decompressor.eof:
+        raise EOFError('Compressed request ended before the end-of-stream marker was reached')
+
+
+def iter_lines(blocks: Iterable[bytes]) -> Iterator[bytes]:
+    """Yield the lines of a body arriving as blocks, without their line endings."""
+    pending = b''
+    for block in blocks:
+        lines = (pending + block).split(b'\n')
+        pending = lines.pop()
+        yield from lines
+    if pending:
+        yield pending
+
+
+class _StreamParser:  # pylint: disable=too-few-public-methods,too-many-instance-attributes
+    """Recursive descent over the containers on the streamed paths, raw_decode for everything else."""
+
+    def __init__(self, blocks: Iterable[bytes], streamed_paths: Sequence[Tuple[str, ...]]):
+        self._blocks = iter(blocks)
+        self._text_decoder = codecs.getincrementaldecoder('utf-8')()
+        self._json_decoder = json.JSONDecoder()
+        self._streamed_paths = [tuple(path) for path in streamed_paths]
+        self._descend_cache: Dict[Tuple[str, ...], bool] = {}
+        # Each raw_decode call has its own key memo, so keys of streamed elements are shared through this one
+        self._keys: Dict[str, str] = {}
+        self._buf = ''
+        self._pos = 0
+        self._eof = False
+
+    def parse(self) -> Any:
+        """Decode the whole body and return its value."""
+        value = self._parse(())
+        if self._peek():
+            raise self._error('Extra data')
+        return value
+
+    def _parse(self, path: Tuple[str, ...]) -> Any:
+        char = self._peek()
+        if char == '[' and self._descend(path):
+            return self._parse_array(path)
+        if char == '{' and self._descend(path):
+            return self._parse_object(path)
+        if not char:
+            raise self._error('Expecting value')
+        return self._decode_value()
+
+    def _parse_array(self, path: Tuple[str, ...]) -> list:
+        self._pos += 1
+        items = []
+        if self._peek() == ']':
+            self._pos += 1
+            return items
+        item_path = path + ('*',)
+        descend = self._descend(item_path)
+        while True:
+            if descend:
+                items.append(self._parse(item_path))
+            else:
+                if not self._peek():
+                    raise self._error('Expecting value')
+                items.append(self._share_keys(self._decode_value()))
+            char = self._peek()
+            self._pos += 1
+            if char == ']':
+                return items
+            if char != ',':
+                raise self._error("Expecting ',' delimiter")
+
+    def _parse_object(self, path: Tuple[str, ...]) -> dict:
+        self._pos += 1
+        obj = {}
+        if self._peek() == '}':
+            self._pos += 1
+            return obj
+        while True:
+            if self._peek() != '"':
+                raise self._error('Expecting property name enclosed in double quotes')
+            key = self._decode_value()
+            if self._peek() != ':':
+                raise self._error("Expecting ':' delimiter")
+            self._pos += 1
+            obj[self._keys.setdefault(key, key)] = self._parse(path + (key,))
+            char = self._peek()
+            self._pos += 1
+            if char == '}':
+                return obj
+            if char != ',':
+                raise self._error("Expecting ',' delimiter")
+
+    def _descend(self, path: Tuple[str, ...]) -> bool:
+        """Return True when path lies above the end of a streamed path, so its container is walked."""
+        descend = self._descend_cache.get(path)
+        if descend is None:
+            descend = self._descend_cache[path] = any(
+                len(streamed) > len(path) and all(part in ('*', key) for part, key in zip(streamed, path))
+                for streamed in self._streamed_paths
+            )
+        return descend
+
+    def _share_keys(self, value: Any) -> Any:
+        """Return value with the keys of a top level object replaced by the copies already seen."""
+        if not isinstance(value, dict):
+            return value
+        return dict(zip(map(self._keys.setdefault, value, value), value.values()))
+
+    def _decode_value(self) -> Any:
+        """Decode the value at the cursor, reading more of the body until it is complete."""
+        wanted = BLOCK_SIZE
+        while True:
+            try:
+                value, end = self._json_decoder.raw_decode(self._buf, self._pos)
+                # A number that ends with the buffer may continue in the next block
+                if end < len(self._buf) or self._eof:
+                    self._pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+            # Double what is buffered on each retry so a large value is rescanned only a few times
+            wanted = max(wanted, 2 * (len(self._buf) - self._pos))
+            self._fill(wanted)
+
+    def _peek(self) -> str:
+        """Skip whitespace and return the next character, or '' at the end of the body."""
+        while True:
+            self._pos = _WHITESPACE.match(self._buf, self._pos).end()
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if self._eof:
+                return ''
+            self._fill(1)
+
+    def _fill(self, wanted: int):
+        """Read blocks until at least wanted characters are buffered past the cursor, or the body ends."""
+        parts = [self._buf[self._pos:]]
+        buffered = len(parts[0])
+        while buffered < wanted and not self._eof:
+            block = next(self._blocks, None)
+            self._eof = block is None
+            text = self._text_decoder.decode(block or b'', final=self._eof)
+            parts.append(text)
+            buffered += len(text)
+        self._buf = ''.join(parts)
+        self._pos = 0
+
+    def _error(self, message: str) -> json.JSONDecodeError:
+        return json.JSONDecodeError(message, self._buf, self._pos)
+
+
+def decode_json_stream(blocks: Iterable[bytes], streamed_paths: Sequence[Tuple[str, ...]] = ()) -> Any:
+    """Decode JSON arriving as blocks of UTF-8, walking the containers above each streamed path.
+
+    A path is a tuple of object keys, with '*' matching any key or array index; the elements at the end
+    of a streamed path are decoded one at a time as they arrive.
+    """
+    return _StreamParser(blocks, streamed_paths).parse()
@@ -18,6 +18,10 @@ A simple decorator to add the options method to a Request Class.
 """
 import os.path
 import re
+from datetime import datetime
+from functools import lru_cache
+
+from dateutil import parser
 
 TEMPLATE_FOLDER_PATH = 'report-templates/'
 
@@ -55,3 +59,38 @@ def cors_preflight(methods: str = 'GET'):
         return f
 
     return wrapper
+
+
+DATE_FORMATS = {
+    'full': '%m-%d-%Y %I:%M %p',
+    'short': '%m-%d-%Y',
+    'month': '%B',
+    'yyyy-mm-dd': '%Y-%m-%d',
+    'mmm dd,yyyy': '%B %e, %Y',
+    'detail': '%B %d, %Y at %I:%M %p Pacific Time',
+}
+# Distinct (value, format) pairs remembered by format_datetime; a report repeats the same few dates on many rows
+DATE_FORMAT_CACHE_SIZE = 4096
+
+
+def _strftime(value: datetime, format: str):  # pylint: disable=redefined-builtin
+    if format == 'unix':
+        return int(value.timestamp())
+    return value.strftime(DATE_FORMATS.get(format, DATE_FORMATS['short']))
+
+
+@lru_cache(maxsize=DATE_FORMAT_CACHE_SIZE)
+def _format_iso_datetime(value: str, format: str):  # pylint: disable=redefined-builtin
+    return _strftime(datetime.fromisoformat(value), format)
+
+
+def format_datetime(value, format='short'):  # pylint: disable=redefined-builtin
+    """Filter to format datetime globally.
+
+    ISO 8601 values are parsed directly and their results cached; anything else goes through dateutil uncached,
+    since dateutil fills a partial date such as 2025-01 in from today.
+    """
+    try:
+        return _format_iso_datetime(value, format)
+    except (TypeError, ValueError):
+        return _strftime(parser.parse(value), format)
@@ -0,0 +1,56 @@
+# Copyright © 2025 Province of British Columbia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Fixtures for the benchmark suite.
+
+BENCHMARK_RESULTS_FILE is where results are written (benchmark-results.json by default). When
+BENCHMARK_BASELINE_FILE names an earlier results file, a scenario more than BENCHMARK_MAX_SLOWDOWN
+times slower than it fails. BENCHMARK_GOTENBERG_LATENCY sets the stand-in's seconds per conversion.
+"""
+import os
+
+import pytest
+
+from api.services.gotenberg_client import GotenbergClient
+
+from .gotenberg_stub import GotenbergStub
+from .harness import BenchmarkResults
+
+
+@pytest.fixture(scope='session')
+def gotenberg_stub():
+    """Return a running Gotenberg stand-in."""
+    stub = GotenbergStub(latency=float(os.getenv('BENCHMARK_GOTENBERG_LATENCY', '0.05'))).start()
+    yield stub
+    stub.stop()
+
+
+@pytest.fixture
+def bench_app(app, gotenberg_stub, monkeypatch):
+    """Return the app with its Gotenberg client pointed at the stand-in."""
+    monkeypatch.setitem(app.config, 'GOTENBERG_URL', gotenberg_stub.url)
+    GotenbergClient.reset()
+    yield app
+    GotenbergClient.reset()
+
+
+@pytest.fixture(scope='session')
+def benchmark_results():
+    """Return the run's results, written out when the session ends."""
+    results = BenchmarkResults(
+        os.getenv('BENCHMARK_RESULTS_FILE', 'benchmark-results.json'),
+        os.getenv('BENCHMARK_BASELINE_FILE'),
+        float(os.getenv('BENCHMARK_MAX_SLOWDOWN', '1.5')),
+    )
+    yield results
+    results.write()
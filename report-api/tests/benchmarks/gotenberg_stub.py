@@ -0,0 +1,103 @@
+# Copyright © 2025 Province of British Columbia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Local stand-in for Gotenberg that answers conversions with canned PDFs after a set latency.
+
+The PDF has one page for every bytes_per_page bytes of index.html, so merging and stamping see page
+counts that grow with the statement, and each conversion takes latency seconds plus seconds_per_mb for
+every MB posted. A footer template for native stamping gets its page number drawn in the sentinel colour,
+as Chromium would draw it.
+"""
+import asyncio
+import io
+import math
+import threading
+from typing import Dict, Tuple
+
+import pikepdf
+from aiohttp import web
+
+from api.services.footer_stamper import PAGE_NUMBER_SENTINEL_COLOR, PAGE_NUMBER_SENTINEL_CSS_COLOR
+
+
+def make_pdf(pages: int, text: str = 'Statement page', sentinel: bool = False) -> bytes:
+    """Return a letter size PDF of pages pages, each with a line of text and a sentinel page number if asked."""
+    pdf = pikepdf.Pdf.new()
+    font = pdf.make_indirect(pikepdf.Dictionary(Type=pikepdf.Name.Font, Subtype=pikepdf.Name.Type1,
+                                                BaseFont=pikepdf.Name.Helvetica))
+    for number in range(1, pages + 1):
+        page = pdf.add_blank_page(page_size=(612, 792))
+        page.Resources = pikepdf.Dictionary(Font=pikepdf.Dictionary(F1=font))
+        content = f'BT /F1 12 Tf 72 720 Td ({text} {number}) Tj ET'
+        if sentinel:
+            red, green, blue = PAGE_NUMBER_SENTINEL_COLOR
+            content += f' q {red} {green} {blue} rg BT /F1 9 Tf 480 30 Td (Page {pages} of {pages}) Tj ET Q'
+        page.Contents = pdf.make_stream(content.encode('ascii'))
+    buf = io.BytesIO()
+    pdf.save(buf)
+    return buf.getvalue()
+
+
+class GotenbergStub:
+    """Gotenberg stand-in served from a background thread on 127.0.0.1."""
+
+    def __init__(self, latency: float = 0.05, seconds_per_mb: float = 0.05, bytes_per_page: int = 24 * 1024):
+        """Configure the stub; call start to serve it."""
+        self.latency = latency
+        self.seconds_per_mb = seconds_per_mb
+        self.bytes_per_page = bytes_per_page
+        self.conversions = 0
+        self.url = None
+        self._pdfs: Dict[Tuple[int, bool], bytes] = {}
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name='gotenberg-stub', daemon=True)
+        self._runner = None
+
+    def start(self) -> 'GotenbergStub':
+        """Serve on a free port and set url."""
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._start(), self._loop).result()
+        return self
+
+    def stop(self):
+        """Stop serving and end the thread."""
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+
+    async def _start(self):
+        app = web.Application(client_max_size=1024 ** 3)
+        app.router.add_post('/forms/chromium/convert/html', self._convert)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]  # pylint: disable=protected-access
+        self.url = f'http://127.0.0.1:{port}'
+
+    async def _convert(self, request: web.Request) -> web.Response:
+        html_bytes = posted_bytes = 0
+        sentinel = False
+        reader = await request.multipart()
+        async for part in reader:
+            content = await part.read()
+            posted_bytes += len(content)
+            if part.filename == 'index.html':
+                html_bytes = len(content)
+                sentinel = PAGE_NUMBER_SENTINEL_CSS_COLOR.encode('ascii') in content
+        await asyncio.sleep(self.latency + self.seconds_per_mb * posted_bytes / 1024 / 1024)
+        self.conversions += 1
+        pages = 1 if sentinel else max(1, math.ceil(html_bytes / self.bytes_per_page))
+        if (pages, sentinel) not in self._pdfs:
+            self._pdfs[pages, sentinel] = make_pdf(pages, 'Footer' if sentinel else 'Statement page', sentinel)
+        return web.Response(body=self._pdfs[pages, sentinel], content_type='application/pdf')
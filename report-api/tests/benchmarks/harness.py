@@ -0,0 +1,116 @@
+# Copyright © 2025 Province of British Columbia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Measure benchmark scenarios and keep their results for regression comparison.
+
+Peak RSS is sampled from /proc while a scenario runs, since the process high water mark never comes
+back down between scenarios; elsewhere it falls back to that high water mark.
+"""
+import json
+import os
+import platform
+import resource
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Optional, Tuple
+
+
+RSS_SAMPLE_SECONDS = 0.01
+
+
+def current_rss_bytes() -> int:
+    """Return the resident set size of this process."""
+    try:
+        with open('/proc/self/statm', encoding='ascii') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class RssSampler:
+    """Track the highest RSS seen from a background thread while in the with block."""
+
+    def __init__(self):
+        """Start with nothing sampled."""
+        self.start_bytes = self.peak_bytes = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='rss-sampler', daemon=True)
+
+    def __enter__(self) -> 'RssSampler':
+        """Take the first sample and start sampling."""
+        self.start_bytes = self.peak_bytes = current_rss_bytes()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        """Stop sampling after one last sample."""
+        self._stop.set()
+        self._thread.join()
+        self.peak_bytes = max(self.peak_bytes, current_rss_bytes())
+
+    def _run(self):
+        while not self._stop.wait(RSS_SAMPLE_SECONDS):
+            self.peak_bytes = max(self.peak_bytes, current_rss_bytes())
+
+
+def measure(scenario: Callable[[], Any]) -> Tuple[Any, Dict[str, float]]:
+    """Run scenario once and return its result with its latency, peak RSS and RSS growth."""
+    with RssSampler() as sampler:
+        start = time.perf_counter()
+        result = scenario()
+        seconds = time.perf_counter() - start
+    return result, {
+        'seconds': seconds,
+        'peak_rss_mb': sampler.peak_bytes / 1024 / 1024,
+        'rss_growth_mb': (sampler.peak_bytes - sampler.start_bytes) / 1024 / 1024,
+    }
+
+
+class BenchmarkResults:
+    """Results of one benchmark run, written as JSON and checked against a baseline run."""
+
+    def __init__(self, path: str, baseline_path: Optional[str] = None, max_slowdown: float = 1.5):
+        """Write results to path; when baseline_path is given, a scenario slower by max_slowdown fails."""
+        self.path = path
+        self.max_slowdown = max_slowdown
+        self.baseline: Dict[str, Dict[str, float]] = {}
+        if baseline_path:
+            with open(baseline_path, encoding='utf-8') as baseline_file:
+                self.baseline = json.load(baseline_file)['results']
+        self.results: Dict[str, Dict[str, float]] = {}
+
+    def record(self, name: str, metrics: Dict[str, float]) -> Optional[str]:
+        """Keep a scenario's metrics and return a message when it regressed against the baseline."""
+        self.results[name] = metrics
+        summary = ', '.join(f'{key}={value:,.3f}' if isinstance(value, float) else f'{key}={value:,}'
+                            for key, value in metrics.items())
+        print(f'benchmark {name}: {summary}')
+        baseline = self.baseline.get(name)
+        if baseline and metrics['seconds'] > baseline['seconds'] * self.max_slowdown:
+            return (f'{name} took {metrics["seconds"]:.3f}s, more than {self.max_slowdown}x '
+                    f'the baseline {baseline["seconds"]:.3f}s')
+        return None
+
+    def write(self):
+        """Write every result with the environment it was measured in."""
+        with open(self.path, 'w', encoding='utf-8') as results_file:
+            json.dump({
+                'created': datetime.now(timezone.utc).isoformat(),
+                'python': platform.python_version(),
+                'machine': platform.machine(),
+                'cpus': os.cpu_count(),
+                'results': self.results,
+            }, results_file, indent=2, sort_keys=True)
@@ -0,0 +1,106 @@
+# Copyright © 2025 Province of British Columbia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Synthetic statement_report and CSV payloads for benchmarks.
+
+Payloads are seeded, so a size always produces the same payload. Row widths vary the way real statements
+do: most transactions buy one product with a short description, some carry several products and detail
+lines, and a few are refunded or credited.
+"""
+import random
+from datetime import date, timedelta
+from typing import Any, Dict, List
+
+
+PRODUCTS = (
+    'Annual Report', 'Change of Address', 'Change of Directors', 'Business Search',
+    'Document Copies - Certified', 'Incorporation Application - Benefit Company',
+    'Registration Statement - Sole Proprietorship', 'Amalgamation Application (Regular) - Long Form',
+)
+DETAIL_WORDS = ('ACME', 'Holdings', 'Ltd.', 'Incorporation', 'Number', 'BC1234567', 'Filing', 'Corrected', 'Name')
+STATUSES = ('COMPLETED',) * 16 + ('APPROVED', 'REFUNDED', 'CREDITED', 'PARTIALLY_REFUNDED')
+PAYMENT_METHODS = ('PAD', 'EFT', 'ONLINE_BANKING', 'DRAWDOWN', 'CC')
+
+
+def _money(rng: random.Random, high: float) -> str:
+    return f'{rng.uniform(0, high):.2f}'
+
+
+def make_transaction(rng: random.Random, index: int, created: date) -> Dict[str, Any]:
+    """Return one statement transaction row."""
+    products = [rng.choice(PRODUCTS) for _ in range(1 if rng.random() < 0.8 else rng.randint(2, 4))]
+    details = [
+        ' '.join(rng.choice(DETAIL_WORDS) for _ in range(rng.randint(2, 12)))
+        for _ in range(rng.choice((0, 1, 1, 2, 4)))
+    ]
+    fee, gst, service_fee = _money(rng, 350), _money(rng, 20), _money(rng, 3)
+    row = {
+        'id': index,
+        'products': products,
+        'details': details,
+        'folio': f'{rng.randint(100000, 999999)}',
+        'createdOn': created.isoformat(),
+        'statusCode': rng.choice(STATUSES),
+        'fee': fee,
+        'gst': gst,
+        'serviceFee': service_fee,
+        'total': f'{float(fee) + float(gst) + float(service_fee):.2f}',
+    }
+    if row['statusCode'] in ('REFUNDED', 'CREDITED', 'PARTIALLY_REFUNDED'):
+        row.update(refundId=f'R{index}', refundDate=created.isoformat(), refundFee=fee, refundGst=gst,
+                   refundServiceFee=service_fee, refundTotal=row['total'])
+    return row
+
+
+def make_statement_payload(invoices: int, transactions_per_invoice: int, seed: int = 0) -> Dict[str, Any]:
+    """Return templateVars for a statement of invoices, each with transactions_per_invoice rows."""
+    rng = random.Random(seed)
+    start = date(2025, 1, 1)
+    grouped_invoices = []
+    index = 0
+    for _ in range(invoices):
+        transactions = []
+        for _ in range(transactions_per_invoice):
+            transactions.append(make_transaction(rng, index, start + timedelta(days=index % 365)))
+            index += 1
+        grouped_invoices.append({
+            'paymentMethod': rng.choice(PAYMENT_METHODS),
+            'transactions': transactions,
+            'countedRefund': '0.00', 'creditsApplied': '0.00', 'due': _money(rng, 5000),
+            'fees': _money(rng, 5000), 'gst': _money(rng, 200), 'paid': '0.00', 'serviceFees': _money(rng, 50),
+            'totals': _money(rng, 5000), 'total_paid': '0.00', 'includeServiceProvided': True,
+        })
+    return {
+        'account': {'id': 1234, 'name': 'Acme Holdings Ltd.'},
+        'statement': {
+            'id': 5678, 'duration': 'January 1, 2025 - December 31, 2025', 'fromDate': '2025-01-01',
+            'toDate': '2025-12-31', 'defaultPaymentMethod': 'PAD', 'isInterimStatement': False,
+        },
+        'statementSummary': {'balanceForward': '0.00', 'lastStatementTotal': '0.00'},
+        'hasPaymentInstructions': False,
+        'grouped_invoices': grouped_invoices,
+    }
+
+
+def make_csv_payload(rows: int, seed: int = 0) -> Dict[str, List]:
+    """Return templateVars for a CSV export of rows transactions."""
+    rng = random.Random(seed)
+    columns = ['Transaction', 'Folio', 'Date', 'Status', 'Fee', 'GST', 'Service Fee', 'Total', 'Details']
+    values = []
+    for index in range(rows):
+        row = make_transaction(rng, index, date(2025, 1, 1) + timedelta(days=index % 365))
+        values.append([
+            ', '.join(row['products']), row['folio'], row['createdOn'], row['statusCode'], row['fee'], row['gst'],
+            row['serviceFee'], row['total'], ' / '.join(row['details']),
+        ])
+    return {'columns': columns, 'values': values}
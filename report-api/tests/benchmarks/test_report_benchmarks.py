@@ -0,0 +1,161 @@
+# Copyright © 2025 Province of British Columbia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Benchmarks of chunked statements, merging, footer stamping, CSV export and date filters at 1k, 10k and 100k rows."""
+
+import math
+
+import pytest
+from dateutil import parser
+from jinja2 import Environment
+
+from api.services import chunk_report_service
+from api.services.chunk_report_service import ChunkReportService
+from api.services.csv_service import CsvService
+from api.services.footer_service import add_page_numbers_to_pdf, get_pdf_page_count
+from api.services.pdf_spool import is_spooled, new_spooled_pdf, pdf_size
+from api.services.report_service import ReportService
+from api.utils import util
+
+from .gotenberg_stub import make_pdf
+from .harness import measure
+from .statement_generator import make_csv_payload, make_statement_payload
+
+
+TRANSACTION_COUNTS = (1_000, 10_000, 100_000)
+TRANSACTIONS_PER_INVOICE = 50
+ROWS_PER_PAGE = 25
+ROWS_PER_CHUNK = 500
+# A transaction table row formatting its dates the way routing slip and caller supplied templates do
+DATE_ROWS_TEMPLATE = (
+    '{% for row in rows %}<tr><td>{{ row.createdOn|format_datetime }}</td>'
+    "<td>{{ row.createdOn|format_datetime('mmm dd,yyyy') }}</td>"
+    "<td>{{ (row.refundDate or row.createdOn)|format_datetime('yyyy-mm-dd') }}</td></tr>{% endfor %}"
+)
+
+
+def _record(benchmark_results, name, metrics):
+    regression = benchmark_results.record(name, metrics)
+    assert regression is None, regression
+
+
+def _close(report):
+    if is_spooled(report):
+        report.close()
+
+
+@pytest.mark.parametrize('transactions', TRANSACTION_COUNTS)
+def test_chunked_statement(bench_app, gotenberg_stub, benchmark_results, transactions):
+    """Benchmark a statement end to end: chunk rendering, conversion, merging and footer stamping."""
+    payload = make_statement_payload(transactions // TRANSACTIONS_PER_INVOICE, TRANSACTIONS_PER_INVOICE)
+    conversions = gotenberg_stub.conversions
+    with bench_app.test_request_context():
+        report, metrics = measure(
+            lambda: ReportService.create_report_from_stored_template('statement_report', payload, True)
+        )
+        metrics['pages'] = get_pdf_page_count(report)
+    metrics.update(
+        transactions=transactions,
+        rows_per_second=transactions / metrics['seconds'],
+        conversions=gotenberg_stub.conversions - conversions,
+        pdf_mb=pdf_size(report) / 1024 / 1024,
+    )
+    _close(report)
+    _record(benchmark_results, f'chunked_statement_{transactions}', metrics)
+
+
+@pytest.mark.parametrize('transactions', TRANSACTION_COUNTS)
+def test_merge(app, benchmark_results, monkeypatch, transactions):
+    """Benchmark merging converted chunks, in order, into one spooled PDF."""
+    chunk_pdf = make_pdf(ROWS_PER_CHUNK // ROWS_PER_PAGE)
+    chunks = math.ceil(transactions / ROWS_PER_CHUNK)
+
+    def canned_render(tasks, window):  # pylint: disable=unused-argument
+        for _ in tasks:
+            yield chunk_pdf
+
+    monkeypatch.setattr(chunk_report_service.GotenbergService, 'iter_tasks_in_order', staticmethod(canned_render))
+    tasks = [(order_id, '') for order_id in range(chunks)]
+    with app.app_context():
+        report, metrics = measure(lambda: ChunkReportService._render_and_merge(tasks, 8, new_spooled_pdf()))
+        pages = get_pdf_page_count(report)
+    metrics.update(chunks=chunks, pages=pages, pages_per_second=pages / metrics['seconds'])
+    _close(report)
+    _record(benchmark_results, f'merge_{transactions}', metrics)
+
+
+@pytest.mark.parametrize('transactions', TRANSACTION_COUNTS)
+def test_footer_stamping(bench_app, benchmark_results, monkeypatch, transactions):
+    """Benchmark stamping the footer and page numbers natively onto a statement's pages."""
+    monkeypatch.setitem(bench_app.config, 'FOOTER_STAMPING_MODE', 'native')
+    pages = math.ceil(transactions / ROWS_PER_PAGE)
+    main_pdf = make_pdf(pages)
+    template_vars = make_statement_payload(1, 1)
+    with bench_app.test_request_context():
+        report, metrics = measure(lambda: add_page_numbers_to_pdf(template_vars, main_pdf, True, new_spooled_pdf()))
+    metrics.update(pages=pages, pages_per_second=pages / metrics['seconds'])
+    _close(report)
+    _record(benchmark_results, f'footer_stamping_{transactions}', metrics)
+
+
+@pytest.mark.parametrize('compress_level', (0, 6), ids=('plain', 'gzip'))
+@pytest.mark.parametrize('transactions', TRANSACTION_COUNTS)
+def test_csv_export(app, benchmark_results, transactions, compress_level):
+    """Benchmark streaming a CSV export, plain and gzipped."""
+    payload = make_csv_payload(transactions)
+
+    def export():
+        chunks = sent = 0
+        for chunk in CsvService.create_report(payload, compress_level=compress_level):
+            chunks += 1
+            sent += len(chunk)
+        return chunks, sent
+
+    with app.app_context():
+        (chunks, sent), metrics = measure(export)
+    metrics.update(
+        rows_per_second=transactions / metrics['seconds'],
+        mb_per_second=sent / 1024 / 1024 / metrics['seconds'],
+        chunks=chunks,
+        sent_mb=sent / 1024 / 1024,
+    )
+    _record(benchmark_results, f'csv_{"gzip" if compress_level else "plain"}_{transactions}', metrics)
+
+
+def _dateutil_format_datetime(value, format='short'):  # pylint: disable=redefined-builtin
+    """Format the way format_datetime did before its ISO fast path and cache."""
+    parsed = parser.parse(value)
+    if format == 'unix':
+        return int(parsed.timestamp())
+    return parsed.strftime(util.DATE_FORMATS.get(format, util.DATE_FORMATS['short']))
+
+
+@pytest.mark.parametrize('date_filter', ('format_datetime', 'dateutil'))
+@pytest.mark.parametrize('transactions', TRANSACTION_COUNTS)
+def test_date_filter_render(app, benchmark_results, transactions, date_filter):
+    """Benchmark rendering three date filters per transaction row, against parsing every date with dateutil."""
+    rows = [
+        transaction
+        for invoice in make_statement_payload(transactions // TRANSACTIONS_PER_INVOICE,
+                                              TRANSACTIONS_PER_INVOICE)['grouped_invoices']
+        for transaction in invoice['transactions']
+    ]
+    env = Environment(autoescape=True)
+    env.filters['format_datetime'] = {'format_datetime': util.format_datetime,
+                                      'dateutil': _dateutil_format_datetime}[date_filter]
+    template = env.from_string(DATE_ROWS_TEMPLATE)
+    util._format_iso_datetime.cache_clear()  # pylint: disable=protected-access
+    with app.app_context():
+        html, metrics = measure(lambda: template.render(rows=rows))
+    metrics.update(rows_per_second=transactions / metrics['seconds'], html_mb=len(html) / 1024 / 1024)
+    _record(benchmark_results, f'date_filters_{date_filter}_{transactions}', metrics)
@@ -0,0 +1,184 @@
+# Copyright © 2025 Province of British Columbia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Benchmarks of single rendering steps, each against the approach it replaced."""
+
+import csv
+import gzip
+import io
+import json
+import tracemalloc
+
+import pikepdf
+import pytest
+from weasyprint.formatting_structure.boxes import InlineBox
+
+from api.resources.report import STREAMED_JSON_PATHS
+from api.services import CsvService, footer_service
+from api.services.page_info import index_page_info, page_info_elements, populate_page_info_with_offset
+from api.utils.json_stream import decode_json_stream, read_body
+
+from .gotenberg_stub import make_pdf
+from .harness import measure
+from ..utilities.footer_pdfs import footer_batches
+from ..utilities.json_payloads import statement_payload
+from ..utilities.page_info_documents import make_document, page_info_texts
+
+
+FOOTER_PAGE_COUNTS = (100, 500, 2000)
+FOOTER_BATCH_PAGES = 200
+PAGE_INFO_PAGE_COUNTS = (10, 100, 1000)
+CSV_ROW_COUNTS = (10_000, 200_000)
+CSV_COLUMNS = ['id', 'account', 'created', 'amount', 'description', 'status']
+
+
+def _record(benchmark_results, name, metrics):
+    regression = benchmark_results.record(name, metrics)
+    assert regression is None, regression
+
+
+def _split_then_overlay(main_pdf_bytes, footer_batch_pdfs):
+    """Overlay the way it was done before: split every footer page into its own PDF, then re-open each one."""
+    footer_pdfs = []
+    for batch_pdf in footer_batch_pdfs:
+        with pikepdf.Pdf.open(io.BytesIO(batch_pdf)) as pdf:
+            for page in pdf.pages:
+                single_page_pdf = pikepdf.Pdf.new()
+                single_page_pdf.pages.append(page)
+                buf = io.BytesIO()
+                single_page_pdf.save(buf)
+                footer_pdfs.append(buf.getvalue())
+
+    with pikepdf.Pdf.open(io.BytesIO(main_pdf_bytes)) as main_pdf:
+        for main_page, footer_bytes in zip(main_pdf.pages, footer_pdfs):
+            with pikepdf.Pdf.open(io.BytesIO(footer_bytes)) as footer_pdf:
+                footer_page = footer_pdf.pages[0]
+                page_width, band_height = footer_service._prepare_footer_page_for_overlay(footer_page, main_page)
+                footer_service._overlay_page_content(main_page, footer_page, page_width, band_height)
+        buf = io.BytesIO()
+        main_pdf.save(buf)
+        return buf.getvalue()
+
+
+@pytest.mark.parametrize('approach', ('direct', 'split'))
+@pytest.mark.parametrize('pages', FOOTER_PAGE_COUNTS)
+def test_footer_overlay(app, benchmark_results, pages, approach):
+    """Benchmark overlaying footers straight from the batch documents, against splitting them into pages first."""
+    main_pdf, batches = make_pdf(pages), footer_batches(pages, FOOTER_BATCH_PAGES)
+    overlay = {'direct': footer_service._overlay_footer_batches_on_main_pdf, 'split': _split_then_overlay}[approach]
+    with app.app_context():
+        _, metrics = measure(lambda: overlay(main_pdf, batches))
+    metrics.update(pages=pages, pages_per_second=pages / metrics['seconds'])
+    _record(benchmark_results, f'footer_overlay_{approach}_{pages}', metrics)
+
+
+def _csv_per_row(columns, values):
+    """Encode rows the way the previous engine did, with one StringIO write, encode and yield per row."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in [columns, *values]:
+        writer.writerow(row)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate(0)
+
+
+@pytest.mark.parametrize('engine', ('per_row', 'blocks'))
+@pytest.mark.parametrize('rows', CSV_ROW_COUNTS)
+def test_csv_chunking(benchmark_results, rows, engine):
+    """Benchmark encoding CSV rows in blocks against one chunk per row; each chunk is one trip through the server."""
+    values = [[str(n), 'ACME Holdings Ltd', '2025-01-01T10:00:00', '123.45', 'Annual report filing', 'PAID']
+              for n in range(rows)]
+    encode = {
+        'per_row': lambda: _csv_per_row(CSV_COLUMNS, values),
+        'blocks': lambda: CsvService.create_report({'columns': CSV_COLUMNS, 'values': values}),
+    }[engine]
+
+    def export():
+        chunks = sent = 0
+        for chunk in encode():
+            chunks += 1
+            sent += len(chunk)
+        return chunks, sent
+
+    (chunks, sent), metrics = measure(export)
+    metrics.update(
+        rows_per_second=rows / metrics['seconds'],
+        mb_per_second=sent / 1024 / 1024 / metrics['seconds'],
+        chunks=chunks,
+    )
+    _record(benchmark_results, f'csv_chunks_{engine}_{rows}', metrics)
+
+
+def _traced_peak_mb(decode):
+    tracemalloc.start()
+    try:
+        baseline = tracemalloc.get_traced_memory()[0]
+        decode()
+        return (tracemalloc.get_traced_memory()[1] - baseline) / 1024 / 1024
+    finally:
+        tracemalloc.stop()
+
+
+@pytest.mark.parametrize('decoder', ('loads', 'streamed'))
+def test_json_request_decode(benchmark_results, decoder):
+    """Benchmark decoding a gzipped 50,000 transaction statement incrementally, against decompress then json.loads."""
+    body = gzip.compress(json.dumps(statement_payload(invoices=25, transactions=2000)).encode('utf-8'))
+    decode = {
+        'loads': lambda: json.loads(gzip.decompress(body).decode('utf-8')),
+        'streamed': lambda: decode_json_stream(read_body(io.BytesIO(body), compressed=True), STREAMED_JSON_PATHS),
+    }[decoder]
+
+    _, metrics = measure(decode)
+    metrics.update(traced_peak_mb=_traced_peak_mb(decode))
+    _record(benchmark_results, f'json_decode_{decoder}', metrics)
+
+
+def _recursive_populate_page_count(box, count, total):
+    """Walk every box recursively for each page, the way pageinfo boxes were numbered before."""
+    if getattr(box, 'element_tag', None):
+        if box.element_tag == 'pageinfo':
+            page_info_text = f'Page {count} of {total}'
+            if isinstance(box, InlineBox):
+                box.children[0].text = page_info_text
+            box.text = page_info_text
+    if hasattr(box, 'all_children') and box.all_children():
+        for child in box.children:
+            _recursive_populate_page_count(child, count, total)
+
+
+def _page_info_walks(root, document):
+    pages = len(document.pages)
+    index = index_page_info(document, page_info_elements(root))
+
+    def recursive():
+        for number, page in enumerate(document.pages, 1):
+            _recursive_populate_page_count(page._page_box, number, pages)
+
+    return {
+        'recursive': recursive,
+        'indexed': lambda: populate_page_info_with_offset(
+            document, 1, pages, index_page_info(document, page_info_elements(root))),
+        'from_index': lambda: populate_page_info_with_offset(document, 1, pages, index),
+    }
+
+
+@pytest.mark.parametrize('walk', ('recursive', 'indexed', 'from_index'))
+@pytest.mark.parametrize('pages', PAGE_INFO_PAGE_COUNTS)
+def test_page_info(benchmark_results, pages, walk):
+    """Benchmark numbering pageinfo boxes by walking every box, by indexing them, and by patching from an index."""
+    root, document = make_document(pages)
+    _, metrics = measure(_page_info_walks(root, document)[walk])
+    assert page_info_texts(document)[-1] == f'Page {pages} of {pages}'
+    metrics.update(pages=pages, pages_per_second=pages / metrics['seconds'])
+    _record(benchmark_results, f'page_info_{walk}_{pages}', metrics)
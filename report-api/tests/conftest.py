@@ -20,6 +20,7 @@ import requests as _req
 from api import create_app
 from api import jwt as _jwt
 from api import setup_jwt_manager
+from api.services.gotenberg_client import GotenbergClient
 
 
 @pytest.fixture(scope='session')
@@ -105,6 +106,7 @@ startxref
 
     class MockAsyncResponse:
         status = 200
+        headers = {}
 
         async def __aenter__(self):
             return self
@@ -117,16 +119,26 @@ startxref
 
     class MockAsyncSession:
 
+        def __init__(self, *args, **kwargs):
+            pass
+
         async def __aenter__(self):
             return self
 
         async def __aexit__(self, *args):
             pass
 
+        async def close(self):
+            pass
+
         def post(self, *args, **kwargs):
             return MockAsyncResponse()
 
     monkeypatch.setattr(_req, 'post', lambda *args, **kwargs: MockResponse())
     monkeypatch.setattr('aiohttp.ClientSession', MockAsyncSession)
+    monkeypatch.setattr('aiohttp.TCPConnector', lambda *args, **kwargs: None)
+    GotenbergClient.reset()
+
+    yield MockResponse()
 
-    return MockResponse()
+    GotenbergClient.reset()
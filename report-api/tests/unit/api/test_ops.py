@@ -18,6 +18,13 @@ Tests to assure the ops end-point.
 Test-Suite to ensure that the /ops endpoint is working as expected.
 """
 
+import json
+import os
+import subprocess
+
+from api.services.metrics_exporter import worker_snapshots
+from api.services.render_metrics import StageRecord, record_stage, render_metrics
+
 
 def test_ops_healthz_success(client):
     """Assert that the service is healthy if it can successfully access the database."""
@@ -33,3 +40,50 @@ def test_ops_readyz(client):
 
     assert rv.status_code == 200
     assert rv.json == {'message': 'api is ready'}
+
+
+def test_ops_metrics(client):
+    """Asserts that render metrics are exposed in the Prometheus text format."""
+    render_metrics.clear()
+    record_stage('merge', 0.2, StageRecord(bytes_in=100, pages=3))
+
+    rv = client.get('/ops/metrics')
+
+    assert rv.status_code == 200
+    assert rv.content_type.startswith('text/plain; version=0.0.4')
+    lines = rv.get_data(as_text=True).splitlines()
+    assert '# TYPE report_stage_duration_seconds histogram' in lines
+    assert 'report_stage_duration_seconds_bucket{stage="merge",le="0.25"} 1' in lines
+    assert 'report_stage_duration_seconds_bucket{stage="merge",le="+Inf"} 1' in lines
+    assert 'report_stage_pages_total{stage="merge"} 3' in lines
+
+
+def _snapshot(directory, pid, pages, queued):
+    families = [
+        ['report_stage_pages_total', 'counter', 'Pages.', [['report_stage_pages_total', {'stage': 'merge'}, pages]]],
+        ['report_jobs_queued', 'gauge', 'Queued jobs.', [['report_jobs_queued', {}, queued]]],
+    ]
+    (directory / f'{pid}.json').write_text(json.dumps(families), encoding='utf-8')
+
+
+def test_ops_metrics_merge_every_worker(app, client, tmp_path, monkeypatch):
+    """Counters are summed over every worker, exited ones included; gauges are kept per live worker."""
+    exited = subprocess.Popen(['true'])  # pylint: disable=consider-using-with
+    exited.wait()
+    _snapshot(tmp_path, os.getppid(), pages=4, queued=2)
+    _snapshot(tmp_path, exited.pid, pages=3, queued=5)
+    monkeypatch.setitem(app.config, 'METRICS_MULTIPROC_DIR', str(tmp_path))
+    monkeypatch.setitem(app.config, 'METRICS_SNAPSHOT_SECONDS', 0)
+    render_metrics.clear()
+    record_stage('merge', 0.2, StageRecord(pages=3))
+    worker_snapshots.init_app(app)
+    try:
+        lines = client.get('/ops/metrics').get_data(as_text=True).splitlines()
+    finally:
+        worker_snapshots.close()
+
+    assert 'report_stage_pages_total{stage="merge"} 10' in lines
+    assert lines.count('# TYPE report_stage_pages_total counter') == 1
+    assert f'report_jobs_queued{{pid="{os.getppid()}"}} 2' in lines
+    assert not any(line.startswith(f'report_jobs_queued{{pid="{exited.pid}"}}') for line in lines)
+    assert (tmp_path / f'{os.getpid()}.json').exists()
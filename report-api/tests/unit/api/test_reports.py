@@ -20,10 +20,27 @@ Test suite for reports
 
 import base64
 import gzip
+import io
 import json
+import time
+import zipfile
+
+import pikepdf
+import pytest
+from jinja2 import TemplateNotFound
 
 from .base_test import get_claims, token_header
-from api.services import report_service
+from api.services import CsvStreamError, chunk_report_service, report_service
+from api.services.csv_service import ERROR_RECORD
+from api.services.pdf_spool import copy_pdf
+from api.services.report_job_service import ReportJobService
+
+
+# Invoice fields the statement template reads for each grouped invoice
+INVOICE_TOTALS = {
+    'paymentMethod': 'PAD', 'countedRefund': '0.00', 'creditsApplied': '0.00', 'due': '0.00', 'fees': '0.00',
+    'gst': '0.00', 'paid': '0.00', 'serviceFees': '0.00', 'totals': '0.00', 'total_paid': '0.00',
+}
 
 
 def test_get_generate(client):
@@ -49,6 +66,22 @@ def test_generate_report_with_existing_template(client, jwt, app, mock_gotenberg
     assert rv.content_type == 'application/pdf'
 
 
+def test_server_timing_header_lists_render_stages(client, jwt, app, mock_gotenberg_requests, monkeypatch):
+    """With RENDER_SERVER_TIMING on, the response times each stage, including the conversion on the client loop."""
+    monkeypatch.setitem(app.config, 'RENDER_SERVER_TIMING', True)
+    token = jwt.create_jwt(get_claims(app_request=app), token_header)
+    headers = {'Authorization': f'Bearer {token}', 'content-type': 'application/json'}
+    request_data = {'templateName': 'invoice', 'templateVars': {'title': 'Timed'}, 'reportName': 'sample'}
+
+    rv = client.post('/api/v1/reports', data=json.dumps(request_data), headers=headers)
+
+    assert rv.status_code == 200
+    stages = [entry.split(';')[0] for entry in rv.headers['Server-Timing'].split(', ')]
+    assert stages[0] == 'template_render'
+    assert {'gotenberg_queue', 'gotenberg_convert', 'page_count', 'footer_render', 'overlay'} <= set(stages)
+    assert stages[-1] == 'total'
+
+
 def test_generate_report_with_invalid_template(client, jwt, app):
     """Call to generate report with invalid template."""
     token = jwt.create_jwt(get_claims(app_request=app), token_header)
@@ -226,6 +259,42 @@ def test_response_is_streaming(client, jwt, app, mock_gotenberg_requests):
     assert rv.data.startswith(b'%PDF')
 
 
+def test_chunked_statement_sent_from_spool_with_length(client, jwt, app, monkeypatch):
+    """Chunked statements are sent from a spooled file with a Content-Length."""
+    def fake_render(tasks, window):
+        for _ in tasks:
+            pdf = pikepdf.Pdf.new()
+            pdf.add_blank_page()
+            buf = io.BytesIO()
+            pdf.save(buf)
+            yield buf.getvalue()
+
+    monkeypatch.setattr(chunk_report_service.GotenbergService, 'iter_tasks_in_order', staticmethod(fake_render))
+    monkeypatch.setattr(chunk_report_service, 'add_page_numbers_to_pdf',
+                        lambda template_vars, pdf, generate_page_number, output: copy_pdf(pdf, output))
+    token = jwt.create_jwt(get_claims(app_request=app), token_header)
+    headers = {'Authorization': f'Bearer {token}', 'content-type': 'application/json'}
+    data = {
+        'templateName': 'statement_report',
+        'templateVars': {
+            'account': {'name': 'Acme'},
+            'statement': {'id': 1},
+            'grouped_invoices': [
+                {**INVOICE_TOTALS, 'transactions': [{'products': ['a']}] * 3},
+                {**INVOICE_TOTALS, 'transactions': [{'products': ['b']}]},
+            ],
+        },
+        'reportName': 'statement',
+    }
+
+    rv = client.post('/api/v1/reports', data=json.dumps(data), headers=headers)
+    assert rv.status_code == 200
+    assert rv.content_type == 'application/pdf'
+    assert int(rv.headers['Content-Length']) == len(rv.data)
+    with pikepdf.Pdf.open(io.BytesIO(rv.data)) as pdf:
+        assert len(pdf.pages) == 1  # both small invoices share one chunk
+
+
 def test_csv_response_is_streaming(client, jwt, app):
     """Verify that CSV response is streaming."""
     token = jwt.create_jwt(get_claims(app_request=app), token_header)
@@ -319,6 +388,86 @@ def test_gzip_request_compression_csv(client, jwt, app):
     assert b'col1' in rv.data or b'col1,col2' in rv.data
 
 
+def test_csv_from_ndjson_with_gzip_response(client, jwt, app):
+    """An NDJSON body streams its rows into the CSV, which is gzipped when the client accepts it."""
+    token = jwt.create_jwt(get_claims(app_request=app), token_header)
+    lines = [{'reportName': 'rows', 'templateVars': {'columns': ['n', 'name']}}]
+    lines += [[n, f'name {n}'] for n in range(5000)]
+    body = gzip.compress('\n'.join(json.dumps(line) for line in lines).encode('utf-8'))
+    headers = {
+        'Authorization': f'Bearer {token}',
+        'content-type': 'application/x-ndjson',
+        'Content-Encoding': 'gzip',
+        'Accept': 'text/csv',
+        'Accept-Encoding': 'gzip',
+    }
+
+    rv = client.post('/api/v1/reports', data=body, headers=headers)
+
+    assert rv.status_code == 200
+    assert rv.headers['Content-Encoding'] == 'gzip'
+    assert rv.headers['Vary'] == 'Accept-Encoding'
+    csv_lines = gzip.decompress(rv.data).decode('utf-8').splitlines()
+    assert len(csv_lines) == 5001
+    assert csv_lines[0] == 'n,name'
+    assert csv_lines[-1] == '4999,name 4999'
+
+
+def _ndjson_csv_request(client, jwt, app, rows, bad_line):
+    """Post an NDJSON CSV request whose body has a malformed line after rows good rows."""
+    token = jwt.create_jwt(get_claims(app_request=app), token_header)
+    lines = [json.dumps({'reportName': 'rows', 'templateVars': {'columns': ['n', 'name']}})]
+    lines += [json.dumps([n, f'name {n}']) for n in range(rows)]
+    lines.append(bad_line)
+    headers = {'Authorization': f'Bearer {token}', 'content-type': 'application/x-ndjson', 'Accept': 'text/csv'}
+    return client.post('/api/v1/reports', data='\n'.join(lines), headers=headers)
+
+
+def test_ndjson_malformed_early_row_is_bad_request(client, jwt, app):
+    """A malformed row read before the CSV response starts is a 400, not a truncated download."""
+    rv = _ndjson_csv_request(client, jwt, app, 10, '[1, "unterminated')
+
+    assert rv.status_code == 400
+
+
+def test_ndjson_malformed_late_row_ends_stream_with_error(client, jwt, app, monkeypatch):
+    """A malformed row after the CSV has started ends it with an error record and fails the transfer."""
+    monkeypatch.setitem(app.config, 'CSV_BLOCK_SIZE_KB', 1)
+    rv = _ndjson_csv_request(client, jwt, app, 2000, '{not json')
+    assert rv.status_code == 200
+
+    blocks = []
+    with pytest.raises(CsvStreamError):
+        for block in rv.response:
+            blocks.append(block)
+    csv_lines = b''.join(blocks).decode('utf-8').splitlines()
+    assert csv_lines[-2] == '1999,name 1999'
+    assert csv_lines[-1].startswith(f'{ERROR_RECORD},Report ended early: ')
+
+
+def test_ndjson_request_rejected_for_pdf(client, jwt, app):
+    """NDJSON bodies only carry CSV rows."""
+    token = jwt.create_jwt(get_claims(app_request=app), token_header)
+    headers = {'Authorization': f'Bearer {token}', 'content-type': 'application/x-ndjson'}
+    body = json.dumps({'templateName': 'invoice', 'templateVars': {}}) + '\n[1]\n'
+
+    rv = client.post('/api/v1/reports', data=body, headers=headers)
+
+    assert rv.status_code == 400
+
+
+def test_gzip_request_over_json_limit(client, jwt, app, monkeypatch):
+    """A body that decompresses past REQUEST_MAX_JSON_MB is rejected before it is fully read."""
+    monkeypatch.setitem(app.config, 'REQUEST_MAX_JSON_MB', 1)
+    token = jwt.create_jwt(get_claims(app_request=app), token_header)
+    headers = {'Authorization': f'Bearer {token}', 'content-type': 'application/json', 'Content-Encoding': 'gzip'}
+    body = gzip.compress(json.dumps({'templateName': 'invoice', 'templateVars': {'pad': 'x' * 2_000_000}}).encode())
+
+    rv = client.post('/api/v1/reports', data=body, headers=headers)
+
+    assert rv.status_code == 413
+
+
 def test_gzip_request_invalid_compression(client, jwt, app):
     """Verify that invalid GZIP data returns appropriate error."""
     token = jwt.create_jwt(get_claims(app_request=app), token_header)
@@ -382,3 +531,101 @@ def test_template_name_sanitization_invalid_chars(client, jwt, app, mock_gotenbe
 
     rv = client.post(request_url, data=json.dumps(request_data), headers=headers)
     assert rv.status_code == 400
+
+
+def test_report_job_lifecycle(client, jwt, app, monkeypatch, tmp_path):
+    """Submit a job, poll it until it completes, then download the PDF."""
+    monkeypatch.setitem(app.config, 'REPORT_JOB_SPOOL_DIR', str(tmp_path))
+    monkeypatch.setattr(report_service.ReportService, 'create_report_from_stored_template',
+                        staticmethod(lambda *args: b'%PDF-job'))
+    ReportJobService.reset()
+    token = jwt.create_jwt(get_claims(app_request=app), token_header)
+    headers = {'Authorization': f'Bearer {token}', 'content-type': 'application/json'}
+    data = {'templateName': 'invoice', 'templateVars': {}, 'reportName': 'statement'}
+
+    try:
+        rv = client.post('/api/v1/reports/jobs', data=json.dumps(data), headers=headers)
+        assert rv.status_code == 202
+        job_id = rv.json['jobId']
+        assert rv.headers['Location'].endswith(f'/api/v1/reports/jobs/{job_id}')
+
+        for _ in range(200):
+            rv = client.get(f'/api/v1/reports/jobs/{job_id}', headers=headers)
+            if rv.json['status'] == 'completed':
+                break
+            time.sleep(0.01)
+        assert rv.json['status'] == 'completed'
+
+        rv = client.get(f'/api/v1/reports/jobs/{job_id}/result', headers=headers)
+        assert rv.status_code == 200
+        assert rv.data == b'%PDF-job'
+        assert 'statement.pdf' in rv.headers['Content-Disposition']
+
+        rv = client.get(f'/api/v1/reports/jobs/{"0" * 32}', headers=headers)
+        assert rv.status_code == 404
+    finally:
+        ReportJobService.reset()
+
+
+def test_report_batch(client, jwt, app, monkeypatch):
+    """A batch comes back as a zip by default or a merged PDF, with failed items in a header."""
+    page = pikepdf.Pdf.new()
+    page.add_blank_page()
+    page_pdf = io.BytesIO()
+    page.save(page_pdf)
+
+    def fake_render(template_name, *args):  # pylint: disable=unused-argument
+        if template_name == 'donotexist':
+            raise TemplateNotFound(template_name)
+        return page_pdf.getvalue()
+
+    monkeypatch.setattr(report_service.ReportService, 'create_report_from_stored_template', staticmethod(fake_render))
+    token = jwt.create_jwt(get_claims(app_request=app), token_header)
+    headers = {'Authorization': f'Bearer {token}', 'content-type': 'application/json'}
+    items = [
+        {'templateName': 'invoice', 'templateVars': {}, 'reportName': 'receipt-1'},
+        {'templateName': 'donotexist', 'templateVars': {}, 'reportName': 'receipt-2'},
+        {'templateName': 'invoice', 'templateVars': {}, 'reportName': 'receipt-3'},
+    ]
+
+    rv = client.post('/api/v1/reports/batch', data=json.dumps({'items': items, 'reportName': 'receipts'}),
+                     headers=headers)
+    assert rv.status_code == 200
+    assert rv.mimetype == 'application/zip'
+    assert 'receipts.zip' in rv.headers['Content-Disposition']
+    assert json.loads(rv.headers['Report-Batch-Errors']) == [
+        {'index': 1, 'reportName': 'receipt-2', 'error': 'Template not found'}
+    ]
+    with zipfile.ZipFile(io.BytesIO(rv.data)) as archive:
+        assert archive.namelist() == ['receipt-1.pdf', 'receipt-3.pdf', 'manifest.json']
+
+    rv = client.post('/api/v1/reports/batch', data=json.dumps(items), headers={**headers, 'Accept': 'application/pdf'})
+    assert rv.status_code == 200
+    with pikepdf.Pdf.open(io.BytesIO(rv.data)) as pdf:
+        assert len(pdf.pages) == 2
+
+    rv = client.post('/api/v1/reports/batch', data=json.dumps(items[1:2]), headers=headers)
+    assert rv.status_code == 422
+    assert rv.json['items'][0]['error'] == 'Template not found'
+
+    rv = client.post('/api/v1/reports/batch', data=json.dumps({'items': []}), headers=headers)
+    assert rv.status_code == 400
+
+
+def test_generate_report_optimized(client, jwt, app, mock_gotenberg_requests):
+    """?optimize= runs the optimisation stage and rejects unknown values."""
+    token = jwt.create_jwt(get_claims(app_request=app), token_header)
+    headers = {'Authorization': f'Bearer {token}', 'content-type': 'application/json'}
+    request_data = {'templateName': 'invoice', 'templateVars': {'title': 'Optimized'}, 'reportName': 'sample'}
+    app.config['RENDER_SERVER_TIMING'] = True
+    try:
+        rv = client.post('/api/v1/reports?optimize=linearize', data=json.dumps(request_data), headers=headers)
+    finally:
+        app.config['RENDER_SERVER_TIMING'] = False
+    assert rv.status_code == 200
+    assert 'optimize;dur=' in rv.headers['Server-Timing']
+    with pikepdf.Pdf.open(io.BytesIO(rv.data)) as pdf:
+        assert pdf.is_linearized
+
+    rv = client.post('/api/v1/reports?optimize=smaller', data=json.dumps(request_data), headers=headers)
+    assert rv.status_code == 400
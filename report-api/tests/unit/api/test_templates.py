@@ -38,3 +38,23 @@ def test_get_one_templates(client):
     """Donotexist template."""
     rv = client.get('/api/v1/templates?name=donotexist')
     assert rv.status_code == 404
+
+
+def test_get_all_templates_revalidates_with_etag(client):
+    """A listing is not sent again while the templates are unchanged."""
+    rv = client.get('/api/v1/templates')
+    assert rv.headers['ETag']
+    rv = client.get('/api/v1/templates', headers={'If-None-Match': rv.headers['ETag']})
+    assert rv.status_code == 304
+    assert not rv.data
+
+
+def test_get_template_revalidates_with_etag(client):
+    """A stored template is not sent again while it is unchanged."""
+    rv = client.get('/api/v1/templates?name=payment_receipt_v2')
+    etag = rv.headers['ETag']
+    rv = client.get('/api/v1/templates?name=payment_receipt_v2', headers={'If-None-Match': etag})
+    assert rv.status_code == 304
+    rv = client.get('/api/v1/templates?name=payment_receipt_v2', headers={'If-None-Match': '"stale"'})
+    assert rv.status_code == 200
+    assert rv.headers['ETag'] == etag
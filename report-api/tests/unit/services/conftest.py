@@ -0,0 +1,68 @@
+# Copyright © 2025 Province of British Columbia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Fixtures shared by the service tests."""
+
+import io
+
+import pikepdf
+import pytest
+
+
+def _template_pdf(page_number_color=b'0.00392 0.00784 0.01176'):
+    pdf = pikepdf.Pdf.new()
+    pdf.add_blank_page(page_size=(595, 842))
+    page = pdf.pages[0]
+    page.Resources = pikepdf.Dictionary(Font=pikepdf.Dictionary(F1=pikepdf.Dictionary(
+        Type=pikepdf.Name.Font, Subtype=pikepdf.Name.Type1, BaseFont=pikepdf.Name.Helvetica
+    )))
+    page.Contents = pdf.make_stream(
+        b'q .75 0 0 -.75 0 842 cm 0 0 0 rg BT /F1 13 Tf 1 0 0 -1 100 1100 Tm (Account Statement #1) Tj ET '
+        b'%s rg BT /F1 13 Tf 1 0 0 -1 600 1100 Tm (Page 12 of 12) Tj ET Q' % page_number_color
+    )
+    buf = io.BytesIO()
+    pdf.save(buf)
+    return buf.getvalue()
+
+
+def _main_pdf(page_count, page_sizes=((612, 792),)):
+    pdf = pikepdf.Pdf.new()
+    for page_index in range(page_count):
+        pdf.add_blank_page(page_size=page_sizes[page_index % len(page_sizes)])
+    buf = io.BytesIO()
+    pdf.save(buf)
+    return buf.getvalue()
+
+
+def _page_text(page):
+    contents = page.obj.Contents
+    streams = contents if isinstance(contents, pikepdf.Array) else [contents]
+    return b''.join(stream.read_bytes() for stream in streams)
+
+
+@pytest.fixture
+def template_pdf():
+    """Return a builder of footer templates laid out the way Chromium does, with a sentinel coloured page number."""
+    return _template_pdf
+
+
+@pytest.fixture
+def main_pdf():
+    """Return a builder of blank PDFs of page_count pages, cycling through page_sizes."""
+    return _main_pdf
+
+
+@pytest.fixture
+def page_text():
+    """Return a reader of a page's content streams, joined."""
+    return _page_text
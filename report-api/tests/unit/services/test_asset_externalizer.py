@@ -0,0 +1,97 @@
+# Copyright © 2025 Province of British Columbia
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for moving inline assets out of rendered HTML."""
+import base64
+
+from api.services import asset_externalizer
+from api.services.asset_externalizer import externalize_assets
+from api.services.chunk_report_service import ChunkReportService
+
+
+# Invoice fields the statement template reads for each grouped invoice
+INVOICE_TOTALS = {
+    'paymentMethod': 'PAD', 'countedRefund': '0.00', 'creditsApplied': '0.00', 'due': '0.00', 'fees': '0.00',
+    'gst': '0.00', 'paid': '0.00', 'serviceFees': '0.00', 'totals': '0.00', 'total_paid': '0.00',
+}
+
+
+def test_repeated_data_uris_become_one_asset():
+    """The same font or image inlined many times is sent once; small data URIs stay inline."""
+    image = base64.b64encode(b'\x89PNG' + bytes(2000)).decode()
+    tiny = base64.b64encode(b'dot').decode()
+    html = (
+        f'<img src="data:image/png;base64,{image}"><img src="data:image/png;base64,{image}">'
+        f'<img src="data:image/png;base64,{tiny}">'
+    )
+
+    html_out, assets = externalize_assets(html)
+
+    assert len(assets) == 1
+    (name, content), = assets.items()
+    assert name.endswith('.png')
+    assert content == b'\x89PNG' + bytes(2000)
+    assert html_out.count(f'src="{name}"') == 2
+    assert f'data:image/png;base64,{tiny}' in html_out
+
+
+def test_only_attribute_and_url_data_uris_move():
+    """Data URIs in text and malformed base64 stay inline; the cache holds digests, not the URIs."""
+    image = base64.b64encode(b'\x89PNG' + bytes(2000)).decode()
+    broken = image[:-2]
+    html = (
+        f'<p>data:image/png;base64,{image}</p><img src="data:image/png;base64,{broken}">'
+        f'<div style="background: url( \'data:image/png;base64,{image}\')"></div>'
+    )
+
+    html_out, assets = externalize_assets(html)
+
+    (name,) = assets
+    assert html_out == (
+        f'<p>data:image/png;base64,{image}</p><img src="data:image/png;base64,{broken}">'
+        f'<div style="background: url( \'{name}\')"></div>'
+    )
+    assert all(len(key) == 64 for key in asset_externalizer._decoded)
+
+
+def test_large_style_blocks_become_stylesheets():
+    """Style blocks move to a linked stylesheet, with their font data URIs pointing at font files."""
+    font = base64.b64encode(bytes(3000)).decode()
+    css = f'@font-face {{ src: url(data:application/font-woff;charset=utf-8;base64,{font}); }}' + ' ' * 2048
+    html = f'<head><style media="print">{css}</style><style>p {{ color: red; }}</style></head>'
+
+    html_out, assets = externalize_assets(html)
+
+    css_name = next(name for name in assets if name.endswith('.css'))
+    font_name = next(name for name in assets if name.endswith('.woff'))
+    assert f'<link rel="stylesheet" href="{css_name}" media="print">' in html_out
+    assert '<style>p { color: red; }</style>' in html_out
+    assert f'url({font_name})' in assets[css_name].decode()
+
+
+def test_statement_chunk_payload_size(app):
+    """Externalising shrinks a rendered statement chunk's index.html and its whole request payload."""
+    invoice = {**INVOICE_TOTALS, 'id': 1, 'transactions': [{'products': [f'item {n}']} for n in range(50)]}
+    with app.test_request_context():
+        template_vars = {'statement': {'id': 1}, 'account': {'name': 'Acme'}}
+        html = ChunkReportService._build_chunk_html(
+            'statement_report', template_vars, [(invoice, ChunkReportService.ChunkInfo())]
+        )
+
+    html_out, assets = externalize_assets(html)
+
+    before = len(html.encode())
+    index_after = len(html_out.encode())
+    sent_after = index_after + sum(map(len, assets.values()))
+    assert index_after < before / 4
+    assert sent_after < before
@@ -0,0 +1,52 @@
+# Copyright © 2025 Province of British Columbia
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Test the chunk planner."""
+import pytest
+
+from api.services.chunk_planner import plan_chunk_rows, render_cost_history
+
+
+@pytest.fixture(autouse=True)
+def _clear_history():
+    render_cost_history.clear()
+    yield
+    render_cost_history.clear()
+
+
+def test_plan_without_history_uses_default_rows(app, monkeypatch):
+    """Without history chunks hold up to CHUNK_DEFAULT_ROWS rows, evened out, so short statements stay whole."""
+    monkeypatch.setitem(app.config, 'GOTENBERG_MAX_IN_FLIGHT_PER_REQUEST', 4)
+    monkeypatch.setitem(app.config, 'CHUNK_TARGET_PER_SLOT', 2)
+    monkeypatch.setitem(app.config, 'CHUNK_DEFAULT_ROWS', 500)
+    with app.app_context():
+        assert plan_chunk_rows('statement_report', 100) == 100  # one conversion, not one per slot
+        assert plan_chunk_rows('statement_report', 800) == 400
+        assert plan_chunk_rows('statement_report', 10_001) == 477  # 21 chunks of at most 500 rows
+
+
+def test_plan_uses_measured_cost(app, monkeypatch):
+    """History raises the chunk size for cheap rows and caps it by HTML size for wide rows."""
+    monkeypatch.setitem(app.config, 'GOTENBERG_MAX_IN_FLIGHT_PER_REQUEST', 4)
+    monkeypatch.setitem(app.config, 'CHUNK_TARGET_PER_SLOT', 2)
+    monkeypatch.setitem(app.config, 'CHUNK_MIN_SECONDS', 1.0)
+    monkeypatch.setitem(app.config, 'CHUNK_MAX_HTML_MB', 1)
+
+    render_cost_history.record('cheap', rows=3000, html_bytes=3000 * 100, convert_seconds=10)
+    render_cost_history.record('wide', rows=1000, html_bytes=1000 * 8192, convert_seconds=100)
+    with app.app_context():
+        assert plan_chunk_rows('cheap', 800) == 267  # 300 rows/s, so 3 chunks rather than 8
+        assert plan_chunk_rows('wide', 10_000) == 127  # 8KB rows, so at most 128 rows in 1MB of HTML
+
+    render_cost_history.record('cheap', rows=600, html_bytes=600 * 100, convert_seconds=10)
+    assert render_cost_history.estimate('cheap')[0] == pytest.approx(300 + 0.3 * (60 - 300))
@@ -13,15 +13,36 @@
 # limitations under the License.
 """Test chunk report service."""
 
-import types
+import asyncio
+import io
+import re
+import tempfile
+
+import pikepdf
+
+from api.services import chunk_report_service
+from api.services.chunk_planner import render_cost_history
+from api.services.chunk_render_pool import ChunkRenderPool
 from api.services.chunk_report_service import ChunkReportService
+from api.services.gotenberg_service import GotenbergService
+from api.services.render_metrics import end_trace, record_stage, start_trace
+from api.services.report_service import ReportService
+from api.services.template_registry import template_registry
+
+
+# Invoice fields the statement template reads for each grouped invoice
+INVOICE_TOTALS = {
+    'paymentMethod': 'PAD', 'countedRefund': '0.00', 'creditsApplied': '0.00', 'due': '0.00', 'fees': '0.00',
+    'gst': '0.00', 'paid': '0.00', 'serviceFees': '0.00', 'totals': '0.00', 'total_paid': '0.00',
+}
 
 
 def test_prepare_chunk_tasks_splits_transactions(monkeypatch):
     """Should split one invoice's transactions into multiple chunk tasks."""
     captured = []
 
-    def fake_build_chunk_html(template_name, template_vars, invoice_copy, chunk_info):
+    def fake_build_chunk_html(template_name, template_vars, parts):
+        [(invoice_copy, chunk_info)] = parts
         captured.append(
             {
                 'start': chunk_info.slice_start,
@@ -48,44 +69,206 @@ def test_prepare_chunk_tasks_splits_transactions(monkeypatch):
     assert captured[2] == {'start': 11, 'end': 12, 'len': 2}
 
 
-class _DummyPdf:
-    def __init__(self, pages=None):
-        self.pages = list(pages or [])
+def test_plan_chunks_carries_chunks_across_invoices():
+    """Small invoices share a chunk, and a chunk that fills up mid invoice continues in the next one."""
+    grouped_invoices = [
+        {'id': 'A', 'transactions': list(range(3))},
+        {'id': 'B', 'transactions': []},
+        {'id': 'C', 'transactions': list(range(2))},
+        {'id': 'D', 'transactions': list(range(6))},
+    ]
+
+    chunks = ChunkReportService._plan_chunks(grouped_invoices, chunk_size=4, pack=False)
+
+    assert [[(copy['id'], len(copy['transactions'])) for copy, _ in parts] for parts in chunks] == [
+        [('A', 3), ('C', 1)],
+        [('C', 1), ('D', 3)],
+        [('D', 3)],
+    ]
+    d_slices = [info for parts in chunks for copy, info in parts if copy['id'] == 'D']
+    assert [(info.slice_start, info.slice_end, info.current_chunk) for info in d_slices] == [(1, 3, 1), (4, 6, 2)]
+    assert all(info.invoice_chunks == 2 for info in d_slices)
+
+    chunk_vars = ChunkReportService._chunk_vars({'foo': 'bar'}, chunks[1])
+    assert [copy['id'] for copy in chunk_vars['grouped_invoices']] == ['C', 'D']
+    assert chunk_vars['_chunk_info']['invoice_index'] == 3
+    assert [part['invoice_index'] for part in chunk_vars['_chunk_info']['parts']] == [3, 4]
+
+
+def test_plan_chunks_packs_small_invoices_whole():
+    """Invoices that fit in one chunk are not split; slices sharing a chunk are marked packed."""
+    grouped_invoices = [
+        {'id': 'A', 'transactions': list(range(3))},
+        {'id': 'B', 'transactions': []},
+        {'id': 'C', 'transactions': list(range(2))},
+        {'id': 'D', 'transactions': list(range(6))},
+        {'id': 'E', 'transactions': list(range(1))},
+    ]
+
+    chunks = ChunkReportService._plan_chunks(grouped_invoices, chunk_size=4)
+
+    assert [[(copy['id'], len(copy['transactions'])) for copy, _ in parts] for parts in chunks] == [
+        [('A', 3)],
+        [('C', 2), ('D', 2)],
+        [('D', 4)],
+        [('E', 1)],
+    ]
+    assert [[copy['_chunk_info']['mode'] for copy, _ in parts] for parts in chunks] == [
+        ['transactions'], ['packed', 'packed'], ['transactions'], ['transactions'],
+    ]
+    d_infos = [copy['_chunk_info'] for parts in chunks for copy, _ in parts if copy['id'] == 'D']
+    assert [(info['current_chunk'], info['invoice_chunks']) for info in d_infos] == [(1, 2), (2, 2)]
+
+
+def test_packing_reduces_conversions(monkeypatch):
+    """Packing small invoices turns one conversion per invoice into a handful for a statement of 2,000."""
+    grouped_invoices = [{'id': n, 'transactions': list(range(3))} for n in range(2000)]
+    one_page = _make_pdf(1)
+    conversions = []
+
+    def fake_render(tasks, window):
+        conversions.append(len(tasks))
+        for _ in tasks:
+            yield one_page
+
+    monkeypatch.setattr(GotenbergService, 'iter_tasks_in_order', staticmethod(fake_render))
+    per_invoice = [[part] for parts in ChunkReportService._plan_chunks(grouped_invoices, 500) for part in parts]
+    packed = ChunkReportService._plan_chunks(grouped_invoices, 500)
+
+    for chunks in (per_invoice, packed):
+        ChunkReportService._render_and_merge([(order_id, '') for order_id in range(len(chunks))], window=8)
+
+    assert conversions == [2000, 13]
+    assert all(len(parts) == 166 for parts in packed[:-1])  # 498 rows, the next invoice would not fit
+
+
+def _make_pdf(page_count):
+    """Build a small in-memory PDF with the given number of blank pages."""
+    pdf = pikepdf.Pdf.new()
+    for _ in range(page_count):
+        pdf.add_blank_page()
+    buf = io.BytesIO()
+    pdf.save(buf)
+    return buf.getvalue()
+
+
+def test_render_and_merge_appends_chunks_in_order(monkeypatch):
+    """Chunks are merged in the order the renderer yields them, without temp files."""
+    chunks = [_make_pdf(1), _make_pdf(2), _make_pdf(3)]
+
+    def fake_render(tasks, window):
+        yield from chunks
+
+    monkeypatch.setattr(GotenbergService, 'iter_tasks_in_order', staticmethod(fake_render))
+    monkeypatch.setattr(tempfile, 'NamedTemporaryFile', None)
+
+    merged = ChunkReportService._render_and_merge([], window=2)
+
+    with pikepdf.Pdf.open(io.BytesIO(merged)) as pdf:
+        assert len(pdf.pages) == 6
+
+
+def test_pool_renders_match_inline_renders_in_order(app):
+    """Chunks rendered in pool processes match the inline renders, in the same order."""
+    grouped_invoices = [
+        {**INVOICE_TOTALS, 'id': 1, 'transactions': [{'products': [f'item {n}']} for n in range(7)]},
+        {**INVOICE_TOTALS, 'id': 2, 'transactions': [{'products': ['other']}]},
+    ]
+    template_vars = {'statement': {'id': 9}, 'account': {'name': 'Acme'}}
+    pool = ChunkRenderPool(processes=2)
+    try:
+        with app.test_request_context():
+            inline = ChunkReportService._prepare_chunk_tasks('statement_report', template_vars, grouped_invoices, 3)
+            deferred = ChunkReportService._prepare_deferred_chunk_tasks(
+                'statement_report', template_vars, grouped_invoices, 3, pool
+            )
+
+        async def render_all():
+            return await asyncio.gather(*[render() for _, render in reversed(deferred)])
+
+        pooled = list(reversed(asyncio.run(render_all())))
+    finally:
+        pool.close()
+
+    assert [order_id for order_id, _ in deferred] == [0, 1, 2]
+    assert pooled == [html_out for _, html_out in inline]
+
+
+def test_cost_history_counts_only_the_reports_chunks(app, monkeypatch):
+    """Footer conversions and the rest of the request do not count towards the template's render cost."""
+    grouped_invoices = [{**INVOICE_TOTALS, 'id': 1, 'transactions': [{'products': [f'item {n}']} for n in range(4)]}]
+    template_vars = {'statement': {'id': 9}, 'account': {'name': 'Acme'}, 'grouped_invoices': grouped_invoices}
+
+    def fake_render(tasks, window):
+        for _ in tasks:
+            record_stage('gotenberg_convert', 0.5)
+            yield _make_pdf(1)
+
+    def fake_footer(template_vars, pdf_content, generate_page_number, output):
+        record_stage('gotenberg_convert', 100.0)
+        return b'%PDF'
+
+    monkeypatch.setattr(GotenbergService, 'iter_tasks_in_order', staticmethod(fake_render))
+    monkeypatch.setattr(chunk_report_service, 'add_page_numbers_to_pdf', fake_footer)
+    render_cost_history.clear()
+    trace, token = start_trace()
+    try:
+        with app.test_request_context():
+            record_stage('gotenberg_convert', 50.0)
+            ChunkReportService.create_chunk_report('statement_report', template_vars, True, chunk_size=2)
+    finally:
+        end_trace(token)
+        rows_per_second, _ = render_cost_history.estimate('statement_report')
+        render_cost_history.clear()
 
-    # context manager compat
-    def __enter__(self):
-        return self
+    assert rows_per_second == 4 / (2 * 0.5)
+    assert trace.stages()['gotenberg_convert']['count'] == 4
 
-    def __exit__(self, exc_type, exc, tb):
-        return False
 
-    def save(self, buf):
-        # Write bytes proportional to number of pages so len > 0
-        buf.write(b'X' * (len(self.pages) + 1))
+def test_statement_falls_back_to_camel_case_invoices(app):
+    """An empty grouped_invoices does not hide invoices sent as groupedInvoices."""
+    invoice = {**INVOICE_TOTALS, 'id': 1, 'transactions': [{'products': ['camel case invoice item']}]}
+    template_vars = {'statement': {'id': 9}, 'account': {'name': 'Acme'}, 'grouped_invoices': [],
+                     'groupedInvoices': [invoice]}
+    with app.test_request_context():
+        template_path, urls = ChunkReportService._chunk_template('statement_report')
+        html_out = template_registry.render(template_path, template_vars, **urls)
 
+    assert 'camel case invoice item' in html_out
 
-def test_merge_pdf_files_merges_two_pdfs(tmp_path, monkeypatch):
-    """Merge two tiny PDFs and ensure result bytes are returned."""
-    p1 = tmp_path / 'a.pdf'
-    p2 = tmp_path / 'b.pdf'
-    p1.write_bytes(b'A')
-    p2.write_bytes(b'B')
 
-    fake_module = types.SimpleNamespace()
+def test_split_invoice_reads_like_the_whole_invoice(app):
+    """A 7 row invoice split into slices of 3 prints its count, totals and notes as often as the unsplit invoice."""
+    invoice = {**INVOICE_TOTALS, 'id': 1, 'totals': '70.00',
+               'transactions': [{'products': [f'item {row}']} for row in range(7)]}
+    template_vars = {'statement': {'id': 9, 'duration': 'January'}, 'account': {'name': 'Acme'},
+                     'grouped_invoices': [invoice]}
+    chunks = ChunkReportService._plan_chunks([invoice], chunk_size=3)
+    with app.test_request_context():
+        template_path, urls = ChunkReportService._chunk_template('statement_report')
+        whole = template_registry.render(template_path, template_vars, **urls)
+        split = ''.join(template_registry.render(template_path, ChunkReportService._chunk_vars(template_vars, parts),
+                                                 **urls) for parts in chunks)
 
-    def _open(_path):
-        # one page per file
-        return _DummyPdf(pages=[b'pg'])
+    assert len(chunks) == 3
+    assert re.findall(r'Number of Transactions: (\d+)', split) == ['7']
+    for text in ('Current Statement Total', 'Transactions from January',
+                 'This statement lists only the products and services provided'):
+        assert split.count(text) == whole.count(text) > 0, text
+    assert all(f'item {row}' in split for row in range(7))
 
-    def _new():
-        return _DummyPdf()
 
-    fake_module.open = staticmethod(_open)
-    fake_module.new = staticmethod(_new)
+def test_stored_statement_is_not_rendered_whole(app, monkeypatch):
+    """A statement that will be chunked goes straight to the chunks, without rendering the whole statement first."""
+    chunked = []
 
-    import pikepdf as _pike
-    monkeypatch.setattr(_pike, 'Pdf', fake_module)
+    def whole_render(*args, **kwargs):
+        raise AssertionError('the whole statement was rendered')
 
-    merged = ChunkReportService._merge_pdf_files([str(p1), str(p2)])
-    assert isinstance(merged, (bytes, bytearray))
-    assert len(merged) > 0
+    monkeypatch.setattr(template_registry, 'render', whole_render)
+    monkeypatch.setattr(ChunkReportService, 'create_chunk_report',
+                        staticmethod(lambda name, template_vars, page_numbers: chunked.append(name) or b'%PDF'))
+    template_vars = {'grouped_invoices': [{**INVOICE_TOTALS, 'transactions': [{}]}]}
+    with app.test_request_context():
+        assert ReportService.create_report_from_stored_template('statement_report', template_vars) == b'%PDF'
+    assert chunked == ['statement_report']
@@ -18,7 +18,14 @@
 Test suite for template service
 """
 
-from api.services import CsvService
+import csv
+import gzip
+import io
+
+import pytest
+
+from api.services import CsvService, CsvStreamError
+from api.services.csv_service import ERROR_RECORD
 
 
 def test_create_csv(app):
@@ -57,3 +64,58 @@ def test_create_csv_with_no_data(app):
         assert False, 'Generator should be empty'
     except StopIteration:
         pass
+
+
+def test_create_csv_streams_blocks_from_iterator(app):
+    """Rows from an iterator are written in blocks of about block_size bytes, not one chunk per row."""
+    rows = ([n, f'name {n}', 'x' * 20] for n in range(10000))
+
+    blocks = list(CsvService.create_report({'columns': ['n', 'name', 'pad'], 'values': rows}, block_size=16 * 1024))
+
+    assert 10 < len(blocks) < 40
+    assert all(len(block) >= 16 * 1024 for block in blocks[:-1])
+    parsed = list(csv.reader(io.StringIO(b''.join(blocks).decode('utf-8'))))
+    assert parsed[0] == ['n', 'name', 'pad']
+    assert parsed[-1] == ['9999', 'name 9999', 'x' * 20]
+    assert len(parsed) == 10001
+
+
+def test_create_csv_gzip(app):
+    """A compress level gzips the stream, and it decompresses to the plain CSV."""
+    payload = {'columns': ['a', 'b'], 'values': [['1', 'x,y'], ['2', 'z']]}
+
+    compressed = b''.join(CsvService.create_report(payload, compress_level=6))
+
+    assert gzip.decompress(compressed) == b''.join(CsvService.create_report(payload))
+    assert gzip.decompress(compressed) == b'a,b\r\n1,"x,y"\r\n2,z\r\n'
+
+
+def _failing_rows(good_rows, error):
+    yield from ([n, f'name {n}'] for n in range(good_rows))
+    raise error
+
+
+def test_rows_failing_before_any_block_raise_as_they_are(app):
+    """A failure before any CSV has been produced reaches the caller unchanged, so it can still send an error."""
+    report = CsvService.create_report({'columns': ['n', 'name'], 'values': _failing_rows(10, ValueError('bad row'))})
+
+    with pytest.raises(ValueError, match='bad row'):
+        next(report)
+
+
+@pytest.mark.parametrize('compress_level', (0, 6))
+def test_rows_failing_mid_stream_end_with_an_error_record(app, compress_level):
+    """A failure after the CSV has started ends it with an error record, gzipped when compressing, then raises."""
+    report = CsvService.create_report(
+        {'columns': ['n', 'name'], 'values': _failing_rows(5000, ValueError('bad row'))},
+        block_size=4096, compress_level=compress_level,
+    )
+    blocks = []
+    with pytest.raises(CsvStreamError):
+        for block in report:
+            blocks.append(block)
+
+    data = b''.join(blocks)
+    lines = (gzip.decompress(data) if compress_level else data).decode('utf-8').splitlines()
+    assert lines[-2] == '4999,name 4999'
+    assert lines[-1] == f'{ERROR_RECORD},Report ended early: bad row'
@@ -0,0 +1,84 @@
+# Copyright © 2025 Province of British Columbia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Test footer service."""
+
+import io
+
+import pikepdf
+
+from api.services import footer_service, pdf_spool
+from api.services.gotenberg_service import GotenbergService
+
+from ...utilities.footer_pdfs import footer_batches
+
+
+def test_large_document_numbers_every_page(app, monkeypatch, template_pdf, main_pdf, page_text):
+    """Documents over the native threshold get a footer on every page, not just the first."""
+    monkeypatch.setattr(GotenbergService, 'convert_html_to_pdf_sync', staticmethod(lambda html: template_pdf()))
+
+    with app.app_context():
+        result = footer_service.add_page_numbers_to_pdf({}, main_pdf(501), True)
+
+    with pikepdf.Pdf.open(io.BytesIO(result)) as pdf:
+        assert len(pdf.pages) == 501
+        assert b'(Page 2 of 501) Tj' in page_text(pdf.pages[1])
+        assert b'(Page 501 of 501) Tj' in page_text(pdf.pages[500])
+
+
+def test_missing_page_number_slot_falls_back_to_rendered_footers(app, monkeypatch, template_pdf, main_pdf):
+    """When the page numbers cannot be found in the native template, every footer is rendered instead."""
+    rendered = []
+
+    def render_batches(tasks, root_path):  # pylint: disable=unused-argument
+        rendered.extend(tasks)
+        return footer_batches(501)
+
+    monkeypatch.setattr(GotenbergService, 'convert_html_to_pdf_sync',
+                        staticmethod(lambda html: template_pdf(page_number_color=b'0 0 0')))
+    monkeypatch.setattr(GotenbergService, 'render_tasks_parallel', staticmethod(render_batches))
+
+    with app.app_context():
+        result = footer_service.add_page_numbers_to_pdf({}, main_pdf(501), True)
+
+    assert len(rendered) == 3
+    with pikepdf.Pdf.open(io.BytesIO(result)) as pdf:
+        (name,) = pdf.pages[500].Resources.XObject.keys()
+        assert pdf.pages[500].Resources.XObject[name].read_bytes() == b'BT /F1 9 Tf 450 17 Td (Page 501) Tj ET'
+
+
+def test_overlay_footer_batches_maps_pages_by_index(app, main_pdf):
+    """Footer page n of the concatenated batches lands on main page n."""
+    with app.app_context():
+        result = footer_service._overlay_footer_batches_on_main_pdf(main_pdf(5), footer_batches(5, batch_size=2))
+
+    with pikepdf.Pdf.open(io.BytesIO(result)) as pdf:
+        assert len(pdf.pages) == 5
+        for number, page in enumerate(pdf.pages, 1):
+            (name,) = page.Resources.XObject.keys()
+            footer = page.Resources.XObject[name]
+            assert footer.read_bytes() == b'BT /F1 9 Tf 450 17 Td (Page %d) Tj ET' % number
+
+
+def test_overlay_footer_batches_between_spooled_files(app, main_pdf):
+    """A spooled main PDF is overlaid into a spooled output without going through bytes."""
+    with app.app_context():
+        main = pdf_spool.new_spooled_pdf()
+        main.write(main_pdf(3))
+        output = pdf_spool.new_spooled_pdf()
+        result = footer_service._overlay_footer_batches_on_main_pdf(main, footer_batches(3), output)
+
+        assert result is output
+        with pikepdf.Pdf.open(io.BytesIO(pdf_spool.pdf_bytes(result))) as pdf:
+            assert len(pdf.pages) == 3
+            assert all(len(page.Resources.XObject.keys()) == 1 for page in pdf.pages)
@@ -0,0 +1,85 @@
+# Copyright © 2025 Province of British Columbia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Test native footer stamping."""
+
+import io
+
+import pikepdf
+import pytest
+
+from api.services import footer_stamper
+
+
+def test_extract_page_number_slot_removes_sentinel_text(template_pdf, page_text):
+    """The sentinel coloured run is removed and its right edge and baseline recorded."""
+    font = footer_stamper.load_footer_font()
+    with pikepdf.Pdf.open(io.BytesIO(template_pdf())) as pdf:
+        slot = footer_stamper.extract_page_number_slot(pdf, pdf.pages[0], 'Page 12 of 12', font)
+        remaining = page_text(pdf.pages[0])
+
+    assert slot is not None
+    assert round(slot.baseline, 2) == 17.0
+    assert round(slot.font_size, 2) == 9.75
+    assert round(slot.right_edge - font.text_width('Page 12 of 12', 9.75), 2) == 450.0
+    assert remaining.count(b'Tj') == 1
+
+
+def test_stamp_footer_numbers_every_page(template_pdf, main_pdf, page_text):
+    """Every page gets the shared footer form and its own right aligned page number."""
+    stamped = footer_stamper.stamp_footer(main_pdf(12), template_pdf(), generate_page_number=True)
+
+    with pikepdf.Pdf.open(io.BytesIO(stamped)) as pdf:
+        assert len(pdf.pages) == 12
+        forms = {pdf.pages[i].Resources.XObject[key].objgen
+                 for i in range(12) for key in pdf.pages[i].Resources.XObject.keys()}
+        assert len(forms) == 1
+        assert b'(Page 1 of 12) Tj' in page_text(pdf.pages[0])
+        assert b'(Page 12 of 12) Tj' in page_text(pdf.pages[11])
+
+
+def test_stamp_footer_without_page_numbers(template_pdf, main_pdf, page_text):
+    """When page numbers are off only the footer form is overlaid."""
+    stamped = footer_stamper.stamp_footer(main_pdf(2), template_pdf(), generate_page_number=False)
+
+    with pikepdf.Pdf.open(io.BytesIO(stamped)) as pdf:
+        assert '/Font' not in pdf.pages[0].Resources
+        assert b'Page' not in page_text(pdf.pages[1])
+
+
+def test_stamp_footer_past_old_page_cap(template_pdf, main_pdf, page_text):
+    """Documents longer than the old 500 page cap get every page stamped."""
+    stamped = footer_stamper.stamp_footer(main_pdf(600), template_pdf(), generate_page_number=True)
+
+    with pikepdf.Pdf.open(io.BytesIO(stamped)) as pdf:
+        assert len(pdf.pages) == 600
+        assert b'(Page 600 of 600) Tj' in page_text(pdf.pages[-1])
+
+
+def test_stamp_footer_without_a_page_number_slot_raises(template_pdf, main_pdf):
+    """Page numbers that cannot be found in the template are reported, not silently left out."""
+    with pytest.raises(footer_stamper.PageNumberSlotNotFoundError):
+        footer_stamper.stamp_footer(main_pdf(2), template_pdf(page_number_color=b'0 0 0'), generate_page_number=True)
+
+
+def test_stamp_footer_fits_each_page_size(template_pdf, main_pdf):
+    """Each page's footer spans that page's own width, with one form per page size."""
+    sizes = ((612, 792), (842, 595))
+    stamped = footer_stamper.stamp_footer(main_pdf(4, sizes), template_pdf(), generate_page_number=True)
+
+    with pikepdf.Pdf.open(io.BytesIO(stamped)) as pdf:
+        for page, (width, _) in zip(pdf.pages, sizes * 2):
+            (name,) = page.Resources.XObject.keys()
+            assert [float(value) for value in page.Resources.XObject[name].BBox] == [0, 0, width, 90]
+        assert len({page.Resources.XObject[name].objgen for page in pdf.pages
+                    for name in page.Resources.XObject.keys()}) == 2
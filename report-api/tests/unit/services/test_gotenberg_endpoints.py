@@ -0,0 +1,198 @@
+# Copyright © 2025 Province of British Columbia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Test routing conversions across several Gotenberg endpoints."""
+
+import asyncio
+import threading
+import time
+
+import pytest
+from aiohttp import web
+
+from api.services.gotenberg_client import WARMUP_HTML, GotenbergClient
+from api.services.gotenberg_endpoints import GotenbergEndpoints
+
+
+class StubGotenberg:
+    """Gotenberg stand-in answering conversions after latency seconds, or with status when it is not 200."""
+
+    def __init__(self, latency: float = 0.0, status: int = 200, healthy: bool = True):
+        """Configure the stub; StubServers serves it."""
+        self.latency = latency
+        self.status = status
+        self.healthy = healthy
+        self.conversions = []
+        self.url = None
+
+    def routes(self, app: web.Application):
+        """Add the health and conversion routes to app."""
+        app.router.add_get('/health', self._health)
+        app.router.add_post('/forms/chromium/convert/html', self._convert)
+
+    async def _health(self, request: web.Request) -> web.Response:  # pylint: disable=unused-argument
+        return web.json_response({'status': 'up' if self.healthy else 'down'}, status=200 if self.healthy else 503)
+
+    async def _convert(self, request: web.Request) -> web.Response:
+        html = b''
+        async for part in await request.multipart():
+            if part.filename == 'index.html':
+                html = await part.read()
+        await asyncio.sleep(self.latency)
+        self.conversions.append(html)
+        if self.status != 200:
+            return web.Response(status=self.status, text='conversion failed')
+        return web.Response(body=b'%PDF ' + html, content_type='application/pdf')
+
+
+class StubServers:
+    """Serve stubs on free local ports from one background loop."""
+
+    def __init__(self, *stubs: StubGotenberg):
+        """Start serving every stub and set its url."""
+        self.stubs = stubs
+        self._runners = []
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name='gotenberg-stubs', daemon=True)
+        self._thread.start()
+        for stub in stubs:
+            asyncio.run_coroutine_threadsafe(self._serve(stub), self._loop).result()
+
+    async def _serve(self, stub: StubGotenberg):
+        app = web.Application()
+        stub.routes(app)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        self._runners.append(runner)
+        stub.url = f'http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}'  # pylint: disable=protected-access
+
+    def close(self):
+        """Stop every stub and the loop."""
+        for runner in self._runners:
+            asyncio.run_coroutine_threadsafe(runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+
+
+@pytest.fixture
+def stubs():
+    """Return a fast, a slow and a failing stub, served until the test ends."""
+    fast, slow, failing = StubGotenberg(0.01), StubGotenberg(0.2), StubGotenberg(status=500)
+    servers = StubServers(fast, slow, failing)
+    yield fast, slow, failing
+    servers.close()
+
+
+def _client(*stubs, **kwargs):
+    return GotenbergClient(','.join(stub.url for stub in stubs), retry_backoff=0.001, **kwargs)
+
+
+def _wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'condition not met in time'
+        time.sleep(0.01)
+
+
+def _convert_all(client, count):
+    async def convert_all():
+        return await asyncio.gather(*(client.convert_html(f'<p>{index}</p>') for index in range(count)))
+    return client.run(convert_all())
+
+
+def test_least_outstanding_routing_favours_fast_endpoint(stubs):
+    """The fast endpoint finishes conversions sooner, so it is picked for most of them."""
+    fast, slow, _ = stubs
+    client = _client(fast, slow, max_in_flight=4, max_in_flight_per_request=4)
+    try:
+        results = _convert_all(client, 24)
+    finally:
+        client.close()
+
+    assert sorted(results) == sorted(f'%PDF <p>{index}</p>'.encode() for index in range(24))
+    assert len(fast.conversions) > 2 * len(slow.conversions)
+    assert all(endpoint['outstanding'] == 0 for endpoint in client.endpoint_stats())
+
+
+def test_failing_endpoint_is_ejected_and_conversions_fail_over(stubs):
+    """Conversions failing on one endpoint are retried on another, and the endpoint is ejected."""
+    fast, _, failing = stubs
+    client = _client(failing, fast, max_in_flight=1, eject_failures=2, eject_seconds=60)
+    try:
+        results = _convert_all(client, 10)
+    finally:
+        client.close()
+
+    assert len(results) == 10 and all(result.startswith(b'%PDF') for result in results)
+    assert len(failing.conversions) == 2
+    stats = {endpoint['url']: endpoint for endpoint in client.endpoint_stats()}
+    assert stats[failing.url]['ejected'] and stats[failing.url]['ejections'] == 1
+    assert stats[fast.url]['failures'] == 0
+
+
+def test_single_endpoint_does_not_retry_server_errors(stubs):
+    """With one endpoint a 500 is not retried, there being nowhere else to send it."""
+    _, _, failing = stubs
+    client = _client(failing)
+    try:
+        with pytest.raises(Exception, match='status 500'):
+            client.run(client.convert_html('<p>report</p>'))
+    finally:
+        client.close()
+    assert len(failing.conversions) == 1
+
+
+def test_health_probes_and_warm_up(stubs):
+    """Healthy endpoints get one warm-up conversion at startup; an unhealthy one gets no work until it recovers."""
+    fast, slow, _ = stubs
+    slow.healthy = False
+    client = _client(fast, slow, health_interval=0.05, warmup=True)
+    try:
+        _wait_for(lambda: fast.conversions == [WARMUP_HTML])
+        assert not slow.conversions
+        assert _convert_all(client, 3)
+        assert not slow.conversions
+
+        slow.healthy = True
+        _wait_for(lambda: slow.conversions == [WARMUP_HTML])
+        stats = {endpoint['url']: endpoint for endpoint in client.endpoint_stats()}
+        assert stats[slow.url]['healthy'] and stats[slow.url]['warm']
+    finally:
+        client.close()
+    assert fast.conversions.count(WARMUP_HTML) == 1
+
+
+def test_endpoints_rotate_and_recover_after_cool_down():
+    """Idle endpoints are picked in turn, and an ejected endpoint returns once its cool-down passes."""
+    now = [0.0]
+    endpoints = GotenbergEndpoints('http://a/, http://b', eject_failures=2, eject_seconds=30, clock=lambda: now[0])
+    first, second = endpoints.acquire(), endpoints.acquire()
+    assert (first.url, second.url) == ('http://a', 'http://b')
+    endpoints.release(first, ok=False)
+    endpoints.release(second, ok=True)
+
+    endpoints.release(endpoints.acquire(), ok=False)
+    assert endpoints.is_ejected(first)
+    assert [endpoints.acquire().url for _ in range(2)] == ['http://b', 'http://b']
+
+    now[0] = 31.0
+    assert not endpoints.is_ejected(first)
+    assert endpoints.acquire() is first
+
+
+def test_endpoints_require_a_url():
+    """An empty URL list is rejected."""
+    with pytest.raises(ValueError):
+        GotenbergEndpoints(' , ')
@@ -0,0 +1,164 @@
+# Copyright © 2025 Province of British Columbia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Test gotenberg service and client."""
+
+import asyncio
+
+import pytest
+
+from api.services.gotenberg_client import GotenbergClient
+from api.services.gotenberg_service import GotenbergService
+
+
+@pytest.fixture
+def client():
+    """Return a standalone Gotenberg client with fast retries."""
+    _client = GotenbergClient('http://gotenberg', max_in_flight=2, max_in_flight_per_request=2, retry_backoff=0.001)
+    yield _client
+    _client.close()
+
+
+def test_render_tasks_in_order_reorders_and_bounds_window(client, monkeypatch):
+    """Results come back in order id order even when later chunks finish first."""
+    delays = {'a': 0.03, 'b': 0.01, 'c': 0.0, 'd': 0.02}
+    state = {'in_flight': 0, 'peak': 0}
+
+    async def fake_post(html_data, assets=None):
+        state['in_flight'] += 1
+        state['peak'] = max(state['peak'], state['in_flight'])
+        await asyncio.sleep(delays[html_data.decode()])
+        state['in_flight'] -= 1
+        return 200, html_data, None
+
+    monkeypatch.setattr(client, '_post', fake_post)
+
+    tasks = [(3, 'd'), (0, 'a'), (2, 'c'), (1, 'b')]
+    results = list(client.iterate(GotenbergService.render_tasks_in_order_async(tasks, client, window=3)))
+
+    assert results == [b'a', b'b', b'c', b'd']
+    assert state['peak'] <= 2
+    assert client.memory_budget.stats()['in_flight_bytes'] == 0
+
+
+def test_deferred_html_renders_within_window(client, monkeypatch):
+    """Deferred HTML is only rendered once its task enters the window, and output stays in order."""
+    started = []
+
+    async def fake_post(html_data, assets=None):
+        await asyncio.sleep(0.01)
+        return 200, html_data, None
+
+    def deferred(name):
+        async def render():
+            started.append(name)
+            return name
+        return render
+
+    monkeypatch.setattr(client, '_post', fake_post)
+
+    tasks = [(index, deferred(name)) for index, name in enumerate('abcde')]
+    results = client.iterate(GotenbergService.render_tasks_in_order_async(tasks, client, window=2))
+
+    assert next(results) == b'a'
+    assert len(started) <= 3
+    assert list(results) == [b'b', b'c', b'd', b'e']
+    assert started == list('abcde')
+
+
+def test_convert_html_retries_when_busy(client, monkeypatch):
+    """A 503 or 429 is retried with backoff, other failures are raised straight away."""
+    responses = [(503, b'busy', None), (429, b'slow down', '0'), (200, b'%PDF', None)]
+
+    async def fake_post(html_data, assets=None):
+        return responses.pop(0)
+
+    monkeypatch.setattr(client, '_post', fake_post)
+    assert client.run(client.convert_html('<html></html>')) == b'%PDF'
+
+    async def failing_post(html_data, assets=None):
+        return 400, b'bad request', None
+
+    monkeypatch.setattr(client, '_post', failing_post)
+    with pytest.raises(Exception, match='status 400'):
+        client.run(client.convert_html('<html></html>'))
+
+
+def test_render_tasks_parallel_respects_global_cap(client, monkeypatch):
+    """Concurrent conversions never exceed the process wide cap."""
+    state = {'in_flight': 0, 'peak': 0}
+
+    async def fake_post(html_data, assets=None):
+        state['in_flight'] += 1
+        state['peak'] = max(state['peak'], state['in_flight'])
+        await asyncio.sleep(0.01)
+        state['in_flight'] -= 1
+        return 200, html_data, None
+
+    monkeypatch.setattr(client, '_post', fake_post)
+
+    tasks = [(i, str(i)) for i in range(6)]
+    results = client.run(GotenbergService.render_tasks_parallel_async(tasks, '.', client))
+
+    assert results == [str(i).encode() for i in range(6)]
+    assert state['peak'] == 2
+
+
+def test_convert_html_sends_inline_assets_as_files(client, monkeypatch):
+    """Inline data URIs are posted as separate files and the payload totals are recorded."""
+    sent = {}
+
+    async def fake_post(html_data, assets=None):
+        sent['html'], sent['assets'] = html_data, assets
+        return 200, b'%PDF', None
+
+    monkeypatch.setattr(client, '_post', fake_post)
+
+    image = 'data:image/png;base64,' + 'A' * 4000
+    assert client.run(client.convert_html(f'<img src="{image}"><img src="{image}">')) == b'%PDF'
+
+    (name, content), = sent['assets'].items()
+    assert sent['html'] == f'<img src="{name}"><img src="{name}">'.encode()
+    assert len(content) == 3000
+    stats = client.payload_stats()
+    assert stats['conversions'] == 1
+    assert stats['html_bytes'] > stats['sent_bytes']
+
+
+def test_held_pdfs_do_not_deadlock_small_budget(monkeypatch):
+    """Held PDFs waiting on their siblings, or on earlier chunks, never keep those renders from being admitted."""
+    client = GotenbergClient('http://gotenberg', max_in_flight=4, max_in_flight_per_request=4,
+                             memory_budget_bytes=10, externalize=False)
+
+    async def fake_post(html_data, assets=None):
+        # Three byte HTML in, four byte PDF out; later chunks finish first
+        await asyncio.sleep(0.001 * (4 - int(html_data[1:2])))
+        return 200, b'%PDF', None
+
+    monkeypatch.setattr(client, '_post', fake_post)
+    tasks = [(index, f'<{index}>') for index in range(4)]
+
+    async def in_order():
+        return [pdf async for pdf in GotenbergService.render_tasks_in_order_async(tasks, client, window=4)]
+
+    async def concurrent_requests():
+        return await asyncio.wait_for(asyncio.gather(
+            GotenbergService.render_tasks_parallel_async(tasks, '.', client), in_order(), in_order()
+        ), timeout=5)
+
+    try:
+        results = client.run(concurrent_requests())
+        assert [len(pdfs) for pdfs in results] == [4, 4, 4]
+        assert client.memory_budget.stats()['in_flight_bytes'] == 0
+    finally:
+        client.close()
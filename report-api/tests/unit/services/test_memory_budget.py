@@ -0,0 +1,95 @@
+# Copyright © 2025 Province of British Columbia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Test memory budget scheduler."""
+
+import asyncio
+
+from api.services.memory_budget import MemoryBudget
+
+
+def test_acquire_waits_until_bytes_fit():
+    """A render that does not fit waits for a release, and waiters are admitted in order."""
+    async def scenario():
+        budget = MemoryBudget(100)
+        admitted = []
+
+        async def render(name, nbytes):
+            await budget.acquire(nbytes)
+            admitted.append(name)
+
+        await budget.acquire(80)
+        waiting = [asyncio.ensure_future(render('first', 50)), asyncio.ensure_future(render('second', 10))]
+        await asyncio.sleep(0)
+        assert not admitted
+
+        budget.release(80)
+        await asyncio.gather(*waiting)
+        return budget, admitted
+
+    budget, admitted = asyncio.run(scenario())
+    assert admitted == ['first', 'second']
+    stats = budget.stats()
+    assert stats['in_flight_bytes'] == 60
+    assert stats['peak_in_flight_bytes'] == 80
+
+
+def test_oversized_render_admitted_when_idle():
+    """A single render larger than the budget still runs once nothing else is in flight."""
+    async def scenario():
+        budget = MemoryBudget(10)
+        await budget.acquire(500)
+        budget.hold(1000)
+        budget.release(500)
+        budget.release_held(1000)
+        return budget.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats['in_flight_bytes'] == 0
+    assert stats['peak_in_flight_bytes'] == 1500
+    assert stats['average_in_flight_bytes'] >= 0
+
+
+def test_cancelled_waiter_is_dropped():
+    """Cancelling a waiting render removes it from the queue without charging the budget."""
+    async def scenario():
+        budget = MemoryBudget(10)
+        await budget.acquire(10)
+        waiter = asyncio.ensure_future(budget.acquire(5))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        budget.release(10)
+        return budget.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats['in_flight_bytes'] == 0
+    assert stats['waiting'] == 0
+
+
+def test_held_pdfs_do_not_block_admission():
+    """Held PDFs count as in flight until their caller consumes them, but never keep a render waiting."""
+    async def scenario():
+        budget = MemoryBudget(10)
+        await budget.acquire(3)
+        budget.hold(8)
+        budget.release(3)
+        await asyncio.wait_for(budget.acquire(10), timeout=1)
+        stats = budget.stats()
+        budget.release(10)
+        budget.release_held(8)
+        return stats, budget.stats()
+
+    held, done = asyncio.run(scenario())
+    assert held['in_flight_bytes'] == 18 and held['held_bytes'] == 8
+    assert done['in_flight_bytes'] == 0 and done['held_bytes'] == 0
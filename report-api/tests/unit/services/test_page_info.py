@@ -0,0 +1,61 @@
+# Copyright © 2025 Province of British Columbia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Test page info population."""
+
+from xml.etree import ElementTree
+
+from api.services.page_info import (
+    index_page_info, page_info_elements, populate_page_info, populate_page_info_with_offset)
+
+from ...utilities.page_info_documents import make_document, page_info_texts
+
+
+def test_populate_page_info_numbers_each_page():
+    """Every pageinfo box gets its page number and the total."""
+    root, document = make_document(3, rows_per_page=2)
+    document = populate_page_info(document, page_info_elements(root))
+
+    assert page_info_texts(document) == ['Page 1 of 3', 'Page 2 of 3', 'Page 3 of 3']
+
+
+def test_populate_with_offset_reuses_index():
+    """An index built once patches the same boxes for another offset and total."""
+    _, document = make_document(2, rows_per_page=2)
+    index = index_page_info(document)
+
+    populate_page_info_with_offset(document, 5, 9, index)
+
+    assert page_info_texts(document) == ['Page 5 of 9', 'Page 6 of 9']
+
+
+def test_page_info_elements_keep_only_paths_to_pageinfo():
+    """Only the pageinfo elements and their ancestors are entered."""
+    root = ElementTree.fromstring('<html><body><table><tr><td>1</td></tr></table><p><pageinfo/></p></body></html>')
+
+    elements = page_info_elements(root)
+
+    assert sorted(element.tag for element in elements if element is not None) == ['body', 'html', 'p', 'pageinfo']
+    assert None in elements
+
+
+def test_index_patches_every_page_again():
+    """Indexed population numbers every page, and a second patch from the same index rewrites the same texts."""
+    expected = [f'Page {number} of 5' for number in range(1, 6)]
+    root, document = make_document(5, rows_per_page=3)
+    index = index_page_info(document, page_info_elements(root))
+    populate_page_info_with_offset(document, 1, 5, index)
+    assert page_info_texts(document) == expected
+
+    populate_page_info_with_offset(document, 1, 5, index)
+    assert page_info_texts(document) == expected
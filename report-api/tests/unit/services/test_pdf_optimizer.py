@@ -0,0 +1,99 @@
+# Copyright © 2025 Province of British Columbia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for the PDF optimiser."""
+import io
+import os
+import zlib
+
+import pikepdf
+import pytest
+
+from api.services.pdf_optimizer import OptimizeOptions, optimize_options, optimize_pdf
+
+
+FONT_DATA = os.urandom(40_000)
+LOGO_PX = 400
+
+
+def _chunk_pdf(pages):
+    """Return a PDF like one Chromium chunk: its own copy of the font file and the logo on every page."""
+    pdf = pikepdf.Pdf.new()
+    font_file = pdf.make_stream(FONT_DATA, Length1=len(FONT_DATA))
+    font = pdf.make_indirect(pikepdf.Dictionary(
+        Type=pikepdf.Name.Font, Subtype=pikepdf.Name.TrueType, BaseFont=pikepdf.Name.BCSans,
+        FontDescriptor=pikepdf.Dictionary(Type=pikepdf.Name.FontDescriptor, FontFile2=font_file),
+    ))
+    logo = pdf.make_stream(
+        zlib.compress(bytes(range(256)) * (LOGO_PX * LOGO_PX * 3 // 256)), Type=pikepdf.Name.XObject,
+        Subtype=pikepdf.Name.Image, Width=LOGO_PX, Height=LOGO_PX, ColorSpace=pikepdf.Name.DeviceRGB,
+        BitsPerComponent=8, Filter=pikepdf.Name.FlateDecode,
+    )
+    for number in range(pages):
+        page = pdf.add_blank_page()
+        page.Resources = pikepdf.Dictionary(Font=pikepdf.Dictionary(F1=font), XObject=pikepdf.Dictionary(Im1=logo))
+        page.Contents = pdf.make_stream(f'q 100 0 0 100 0 0 cm /Im1 Do Q BT /F1 9 Tf (Row {number}) Tj ET'.encode())
+    return pdf
+
+
+def _merged_statement(chunks, pages_per_chunk):
+    """Return a statement merged from chunks the way the chunk report service merges them."""
+    merged = pikepdf.Pdf.new()
+    for _ in range(chunks):
+        merged.pages.extend(_chunk_pdf(pages_per_chunk).pages)
+    buf = io.BytesIO()
+    merged.save(buf)
+    return buf.getvalue()
+
+
+def test_optimize_shares_streams_repeated_across_chunks(app):
+    """Each chunk's copy of the font file and logo collapses to one and the PDF shrinks."""
+    statement = _merged_statement(4, 3)
+    with app.app_context():
+        optimized, result = optimize_pdf(statement, OptimizeOptions())
+
+    assert result.streams_deduplicated == 6
+    assert result.bytes_before == len(statement)
+    assert result.bytes_after == len(optimized) < len(statement) / 2
+    with pikepdf.Pdf.open(io.BytesIO(optimized)) as pdf:
+        assert len(pdf.pages) == 12
+        fonts = {page.Resources.Font.F1.FontDescriptor.FontFile2.objgen for page in pdf.pages}
+        logos = {page.Resources.XObject.Im1.objgen for page in pdf.pages}
+        assert len(fonts) == len(logos) == 1
+        assert pdf.pages[11].Resources.Font.F1.FontDescriptor.FontFile2.read_bytes() == FONT_DATA
+
+
+def test_optimize_linearizes_and_downsamples(app):
+    """Linearization and image downsampling are applied when asked."""
+    statement = _merged_statement(2, 1)
+    output = io.BytesIO()
+    with app.app_context():
+        optimized, result = optimize_pdf(statement, OptimizeOptions(linearize=True, max_image_px=100), output)
+
+    assert optimized is output
+    assert result.images_downsampled == 1
+    with pikepdf.Pdf.open(output) as pdf:
+        assert pdf.is_linearized
+        assert (pdf.pages[0].Resources.XObject.Im1.Width, pdf.pages[0].Resources.XObject.Im1.Height) == (100, 100)
+
+
+def test_optimize_options(app, monkeypatch):
+    """The optimize parameter wins over PDF_OPTIMIZE_TEMPLATES."""
+    monkeypatch.setitem(app.config, 'PDF_OPTIMIZE_TEMPLATES', 'statement_report')
+    with app.app_context():
+        assert optimize_options('statement_report', None) == OptimizeOptions()
+        assert optimize_options('invoice', None) is None
+        assert optimize_options('statement_report', 'false') is None
+        assert optimize_options('invoice', 'linearize') == OptimizeOptions(linearize=True)
+        with pytest.raises(ValueError):
+            optimize_options('invoice', 'smaller')
@@ -0,0 +1,81 @@
+# Copyright © 2025 Province of British Columbia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Test render stage metrics and traces."""
+
+import asyncio
+import threading
+
+from api.services.render_metrics import RenderMetrics, StageRecord, end_trace, nested_trace, stage, start_trace
+
+
+def test_stage_records_into_the_current_trace_only():
+    """A stage counts against the trace started in its context, including tasks on another thread's loop."""
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+
+    async def convert():
+        with stage('gotenberg_convert', 10) as record:
+            record.bytes_out = 40
+
+    try:
+        trace, token = start_trace()
+        try:
+            with stage('template_render') as record:
+                record.bytes_out = 10
+            asyncio.run_coroutine_threadsafe(convert(), loop).result()
+        finally:
+            end_trace(token)
+        with stage('merge'):
+            pass
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+    stages = trace.stages()
+    assert list(stages) == ['template_render', 'gotenberg_convert']
+    assert stages['gotenberg_convert']['bytes_in'] == 10
+    assert stages['gotenberg_convert']['bytes_out'] == 40
+    assert trace.server_timing().startswith('template_render;dur=')
+
+
+def test_render_metrics_histogram_is_cumulative():
+    """Each run counts in every bucket at or above its duration."""
+    metrics = RenderMetrics(buckets=(0.1, 1.0))
+    for seconds in (0.05, 0.5, 5.0):
+        metrics.record('overlay', seconds, StageRecord(pages=2))
+
+    stats = metrics.stats()['overlay']
+    assert stats['buckets'] == [1, 2]
+    assert stats['count'] == 3
+    assert stats['pages'] == 6
+
+
+def test_nested_trace_totals_its_block_and_passes_stages_up():
+    """A nested trace sees only the stages in its block; the request's trace still sees them all."""
+    trace, token = start_trace()
+    try:
+        with stage('template_render'):
+            pass
+        with nested_trace() as chunks:
+            with stage('gotenberg_convert', 10):
+                pass
+    finally:
+        end_trace(token)
+
+    assert list(chunks.stages()) == ['gotenberg_convert']
+    assert chunks.totals('gotenberg_convert')['bytes_in'] == 10
+    assert chunks.totals('merge')['count'] == 0
+    assert list(trace.stages()) == ['template_render', 'gotenberg_convert']
@@ -0,0 +1,130 @@
+# Copyright © 2025 Province of British Columbia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for batch report rendering."""
+import io
+import json
+import threading
+import zipfile
+
+import pikepdf
+import pytest
+from jinja2 import TemplateNotFound
+
+from api.services import report_batch_service
+from api.services.report_batch_service import ReportBatchService, write_merged_pdf, write_zip
+
+
+def _pdf(pages):
+    pdf = pikepdf.Pdf.new()
+    for _ in range(pages):
+        pdf.add_blank_page()
+    buf = io.BytesIO()
+    pdf.save(buf)
+    return buf.getvalue()
+
+
+class _UnreadablePdf(io.BytesIO):
+    """A spooled PDF whose file fails on read."""
+
+    def read(self, *args):
+        raise OSError('disk read failed')
+
+
+@pytest.fixture
+def batch_service(app, monkeypatch):
+    """Return a batch service whose stored template reports have as many pages as templateVars asks."""
+    rendering = set()
+
+    def fake_render(template_name, template_vars, *args):  # pylint: disable=unused-argument
+        if template_name == 'missing':
+            raise TemplateNotFound(template_name)
+        if template_name == 'corrupt':
+            return b'%PDF-1.4 not really'
+        if template_name == 'unreadable':
+            return _UnreadablePdf()
+        rendering.add(threading.get_ident())
+        return _pdf(template_vars['pages'])
+
+    monkeypatch.setattr(report_batch_service.ReportService, 'create_report_from_stored_template',
+                        staticmethod(fake_render))
+    service = ReportBatchService(app, workers=3, max_items=4)
+    service.rendering_threads = rendering
+    yield service
+    service.close()
+
+
+ITEMS = [
+    {'templateName': 'invoice', 'templateVars': {'pages': 2}, 'reportName': 'invoice'},
+    {'templateName': 'missing', 'templateVars': {'pages': 1}, 'reportName': 'lost'},
+    {'templateName': 'invoice', 'templateVars': {'pages': 1}, 'reportName': 'invoice'},
+    {'templateVars': {'pages': 1}},
+]
+
+
+def test_zip_lists_failed_items_and_keeps_the_rest(batch_service):
+    """Completed items are archived under unique names and every item is in the manifest."""
+    output = io.BytesIO()
+    manifest = write_zip(batch_service.submit(ITEMS, 'http://localhost/'), output)
+
+    assert [entry['status'] for entry in manifest] == ['completed', 'failed', 'completed', 'failed']
+    assert manifest[1]['error'] == 'Template not found'
+    assert manifest[3]['error'] == 'templateName or template is required'
+    with zipfile.ZipFile(output) as archive:
+        assert archive.namelist() == ['invoice.pdf', 'invoice (2).pdf', 'manifest.json']
+        assert json.loads(archive.read('manifest.json'))['items'] == manifest
+        assert len(pikepdf.Pdf.open(io.BytesIO(archive.read('invoice.pdf'))).pages) == 2
+
+
+def test_merged_pdf_bookmarks_each_item(batch_service):
+    """Items are merged in order with a bookmark on each item's first page."""
+    output = io.BytesIO()
+    manifest = write_merged_pdf(batch_service.submit(ITEMS[:3], 'http://localhost/'), output)
+
+    assert [entry.get('firstPage') for entry in manifest] == [1, None, 3]
+    with pikepdf.Pdf.open(output) as pdf, pdf.open_outline() as outline:
+        assert len(pdf.pages) == 3
+        assert [item.title for item in outline.root] == ['invoice', 'invoice']
+    assert 1 <= len(batch_service.rendering_threads) <= 3
+
+
+@pytest.mark.parametrize('writer, bad_template, error', [
+    (write_zip, 'unreadable', 'Report could not be archived'),
+    (write_merged_pdf, 'corrupt', 'Report could not be merged'),
+])
+def test_item_failing_to_write_is_listed_and_the_rest_kept(app, batch_service, writer, bad_template, error):
+    """An item PDF that cannot be written out fails in the manifest alone, and its file is released."""
+    items = [dict(ITEMS[0]), {'templateName': bad_template, 'templateVars': {}, 'reportName': 'bad'}, dict(ITEMS[2])]
+    results = list(batch_service.submit(items, 'http://localhost/'))
+    output = io.BytesIO()
+    with app.app_context():
+        manifest = writer(iter(results), output)
+
+    assert [entry['status'] for entry in manifest] == ['completed', 'failed', 'completed']
+    assert manifest[1]['error'] == error and manifest[1]['fileName'] is None
+    if writer is write_zip:
+        assert results[1].report.closed
+        with zipfile.ZipFile(output) as archive:
+            assert json.loads(archive.read('manifest.json'))['items'] == manifest
+            assert len(pikepdf.Pdf.open(io.BytesIO(archive.read('invoice (2).pdf'))).pages) == 1
+    else:
+        assert [entry.get('firstPage') for entry in manifest] == [1, None, 3]
+        with pikepdf.Pdf.open(output) as pdf:
+            assert len(pdf.pages) == 3
+
+
+def test_batch_limits(batch_service):
+    """Empty, oversized and malformed batches are rejected before anything renders."""
+    for items in ([], ITEMS * 2, [1], None):
+        with pytest.raises(ValueError):
+            batch_service.submit(items, 'http://localhost/')
@@ -0,0 +1,136 @@
+# Copyright © 2025 Province of British Columbia
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for the stored template result cache."""
+import sys
+import time
+
+import pytest
+
+from api.services import report_cache, report_service
+from api.services.chunk_report_service import ChunkReportService
+from api.services.report_cache import DiskCacheBackend, MemoryCacheBackend, ReportCache
+from api.services.report_service import ReportService
+
+
+def test_memory_backend_evicts_least_recently_used_and_expired(monkeypatch):
+    """Entries beyond the byte budget go oldest-use first, and expired entries are never returned."""
+    backend = MemoryCacheBackend(max_bytes=10)
+    backend.set('a', b'aaaa', ttl=60)
+    backend.set('b', b'bbbb', ttl=60)
+    assert backend.get('a') == b'aaaa'
+    backend.set('c', b'cccc', ttl=60)
+
+    assert backend.get('b') is None
+    assert backend.get('a') == b'aaaa'
+    assert backend.evictions == 1
+
+    now = time.time()
+    monkeypatch.setattr(report_cache.time, 'time', lambda: now + 120)
+    assert backend.get('a') is None
+
+
+def test_disk_backend_round_trip_and_budget(tmp_path, monkeypatch):
+    """Cached files survive a new backend instance and are trimmed to the byte budget."""
+    DiskCacheBackend(str(tmp_path), max_bytes=1024).set('one', b'%PDF-1', ttl=60)
+    backend = DiskCacheBackend(str(tmp_path), max_bytes=1024)
+    assert backend.get('one') == b'%PDF-1'
+
+    backend.set('big', bytes(1000), ttl=60)
+    assert [path.name for path in tmp_path.glob('*.pdf')] == ['big.pdf']
+    assert backend.evictions == 1
+
+    now = time.time()
+    monkeypatch.setattr(report_cache.time, 'time', lambda: now + 120)
+    assert backend.get('big') is None
+
+
+def test_key_is_canonical(app):
+    """Variable order does not matter; values, page numbers and template do."""
+    with app.app_context():
+        key = ReportCache.key('invoice', {'a': 1, 'b': [1, 2]}, False)
+        assert ReportCache.key('invoice', {'b': [1, 2], 'a': 1}, False) == key
+        assert ReportCache.key('invoice', {'a': 2, 'b': [1, 2]}, False) != key
+        assert ReportCache.key('invoice', {'a': 1, 'b': [1, 2]}, True) != key
+        assert ReportCache.key('payment_receipt', {'a': 1, 'b': [1, 2]}, False) != key
+
+
+@pytest.fixture
+def memory_cache(app):
+    """Turn the memory backend on for one test."""
+    app.config['REPORT_CACHE_BACKEND'] = 'memory'
+    ReportCache.reset()
+    yield
+    app.config['REPORT_CACHE_BACKEND'] = ''
+    ReportCache.reset()
+
+
+def test_stored_template_report_served_from_cache(app, monkeypatch, memory_cache):
+    """A repeated request for the same receipt is generated once."""
+    calls = []
+
+    def fake_finalize(template_name, template_args, html_out, generate_page_number):
+        calls.append(template_name)
+        return b'%PDF-receipt'
+
+    monkeypatch.setattr(ReportService, '_finalize_pdf', staticmethod(fake_finalize))
+    monkeypatch.setattr(report_service.template_registry, 'render', lambda *args, **kwargs: '<html></html>')
+    with app.test_request_context():
+        first = ReportService.create_report_from_stored_template('payment_receipt', {'total': 10})
+        second = ReportService.create_report_from_stored_template('payment_receipt', {'total': 10})
+        ReportService.create_report_from_stored_template('payment_receipt', {'total': 11})
+
+        assert first == second == b'%PDF-receipt'
+        assert len(calls) == 2
+        stats = ReportCache.get().stats()
+    assert stats['hits'] == 1
+    assert stats['misses'] == 2
+    assert stats['stores'] == 2
+
+
+def test_unusable_backend_leaves_cache_off(app):
+    """A misconfigured backend is logged and reports are generated uncached."""
+    app.config['REPORT_CACHE_BACKEND'] = 'memcached'
+    ReportCache.reset()
+    try:
+        with app.app_context():
+            assert ReportCache.get() is None
+    finally:
+        app.config['REPORT_CACHE_BACKEND'] = ''
+        ReportCache.reset()
+
+
+def test_chunked_statement_skips_the_cache(app, monkeypatch, memory_cache):
+    """A chunked statement is never hashed into a cache key, looked up or stored."""
+    def no_key(*args):
+        raise AssertionError('a cache key was built')
+
+    monkeypatch.setattr(ReportCache, 'key', staticmethod(no_key))
+    monkeypatch.setattr(ChunkReportService, 'create_chunk_report', staticmethod(lambda *args: b'%PDF-statement'))
+    with app.test_request_context():
+        template_vars = {'grouped_invoices': [{'transactions': []}]}
+        report = ReportService.create_report_from_stored_template('statement_report', template_vars)
+        stats = ReportCache.get().stats()
+    assert report == b'%PDF-statement'
+    assert stats['hits'] == stats['misses'] == stats['stores'] == 0
+
+
+def test_redis_backend_without_redis_is_refused_at_startup(app, monkeypatch):
+    """Starting with REPORT_CACHE_BACKEND=redis and no redis package fails with a clear error."""
+    monkeypatch.setitem(sys.modules, 'redis', None)
+    monkeypatch.setitem(app.config, 'REPORT_CACHE_BACKEND', 'redis')
+    try:
+        with pytest.raises(RuntimeError, match='needs the redis package'):
+            ReportCache.init_app(app)
+    finally:
+        ReportCache.reset()
@@ -0,0 +1,150 @@
+# Copyright © 2025 Province of British Columbia
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for asynchronous report jobs."""
+import time
+
+import pytest
+
+from api.services import report_job_service
+from api.services.report_job_service import ReportJobService, ReportSpool
+from api.services.report_service import ReportService
+
+
+@pytest.fixture
+def job_service(app, tmp_path):
+    """Return a job service spooling into a temporary directory."""
+    service = ReportJobService(app, ReportSpool(str(tmp_path), ttl=60, max_bytes=1024), workers=1, max_queued=2)
+    yield service
+    service._executor.shutdown(wait=True)
+
+
+def _resolve_to(monkeypatch, address):
+    """Make every host name resolve to address."""
+    monkeypatch.setattr(report_job_service.socket, 'getaddrinfo',
+                        lambda host, port, proto: [(2, 1, 6, '', (address, 443))])
+
+
+def _wait_for(service, job_id):
+    for _ in range(200):
+        state = service.status(job_id)
+        if state['status'] in ('completed', 'failed'):
+            return state
+        time.sleep(0.01)
+    raise AssertionError('job did not finish')
+
+
+def test_job_renders_in_background_and_notifies(app, job_service, monkeypatch):
+    """A queued job renders off the request, lands in the spool and posts to the callback."""
+    posted = []
+    monkeypatch.setattr(ReportService, 'create_report_from_stored_template',
+                        staticmethod(lambda name, template_vars, page_numbers: b'%PDF-job'))
+    monkeypatch.setattr(report_job_service.requests, 'post',
+                        lambda url, json, timeout, allow_redirects: posted.append((url, json, allow_redirects)))
+    _resolve_to(monkeypatch, '93.184.216.34')
+    job_service.callback_hosts = ('pay.example',)
+
+    with app.app_context():
+        state = job_service.submit(
+            {'templateName': 'invoice', 'templateVars': {}, 'callbackUrl': 'https://pay.example/cb'},
+            'http://localhost/',
+        )
+    finished = _wait_for(job_service, state['jobId'])
+
+    assert finished['status'] == 'completed'
+    with open(job_service.spool.result_path(state['jobId']), 'rb') as result:
+        assert result.read() == b'%PDF-job'
+    assert posted == [('https://pay.example/cb', {
+        'jobId': state['jobId'], 'status': 'completed', 'error': None,
+        'completedAt': posted[0][1]['completedAt'], 'expiresAt': posted[0][1]['expiresAt'],
+    }, False)]
+
+
+def test_submit_validates_request(app, job_service):
+    """Bad template names and callback URLs are rejected before anything is queued."""
+    job_service.callback_hosts = ('pay.example',)
+    with app.app_context():
+        with pytest.raises(ValueError):
+            job_service.submit({'templateName': '../invoice', 'templateVars': {}}, 'http://localhost/')
+        with pytest.raises(ValueError):
+            job_service.submit(
+                {'templateName': 'invoice', 'templateVars': {}, 'callbackUrl': 'http://169.254.169.254/'},
+                'http://localhost/',
+            )
+    assert job_service.status('0' * 32) is None
+    assert job_service.status('../etc/passwd') is None
+
+
+@pytest.mark.parametrize('callback_url, address, hosts', [
+    ('https://pay.example/cb', '93.184.216.34', ()),
+    ('https://pay.example/cb', '127.0.0.1', ('pay.example',)),
+    ('https://pay.example/cb', '10.0.0.5', ('pay.example',)),
+    ('https://pay.example/cb', '169.254.169.254', ('pay.example',)),
+    ('https://pay.example/cb', 'fe80::1%eth0', ('pay.example',)),
+    ('https://pay.example/cb', '::ffff:192.168.1.1', ('pay.example',)),
+])
+def test_callback_url_is_default_deny(app, job_service, monkeypatch, callback_url, address, hosts):
+    """Without an allowlist every callback is rejected, and allowed hosts must not resolve to internal addresses."""
+    _resolve_to(monkeypatch, address)
+    job_service.callback_hosts = hosts
+    with app.app_context():
+        with pytest.raises(ValueError):
+            job_service.submit({'templateName': 'invoice', 'templateVars': {}, 'callbackUrl': callback_url},
+                               'http://localhost/')
+
+
+def test_spool_expires_jobs_and_trims_to_budget(tmp_path, monkeypatch):
+    """Expired jobs disappear, and the oldest finished results go first when over budget."""
+    spool = ReportSpool(str(tmp_path), ttl=60, max_bytes=1000)
+    now = time.time()
+    for index, job_id in enumerate(['a' * 32, 'b' * 32, 'c' * 32]):
+        spool.write_result(job_id, bytes(600))
+        spool.write_state({'jobId': job_id, 'status': 'completed', 'completedAt': now + index,
+                           'expiresAt': now + 60 + index, 'size': 600})
+
+    spool.purge()
+    assert spool.read_state('a' * 32) is None
+    assert spool.read_state('b' * 32) is None
+    assert spool.read_state('c' * 32)['size'] == 600
+
+    monkeypatch.setattr(report_job_service.time, 'time', lambda: now + 120)
+    assert spool.read_state('c' * 32) is None
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_unfinished_jobs_outlive_the_ttl(app, job_service, monkeypatch):
+    """A job queued or running for longer than the TTL stays in the spool until it finishes."""
+    started = []
+    release = report_job_service.threading.Event()
+
+    def render(name, template_vars, page_numbers):
+        started.append(name)
+        release.wait(5)
+        return b'%PDF-job'
+
+    monkeypatch.setattr(ReportService, 'create_report_from_stored_template', staticmethod(render))
+    with app.app_context():
+        state = job_service.submit({'templateName': 'invoice', 'templateVars': {}}, 'http://localhost/')
+    while not started:
+        time.sleep(0.01)
+
+    now = time.time()
+    monkeypatch.setattr(report_job_service.time, 'time', lambda: now + 120)
+    job_service.spool.purge()
+    assert job_service.status(state['jobId'])['status'] == 'running'
+    assert report_job_service.job_response(job_service.status(state['jobId']))['expiresAt'] is None
+
+    release.set()
+    finished = _wait_for(job_service, state['jobId'])
+    assert finished['status'] == 'completed'
+    assert finished['expiresAt'] == now + 180
@@ -0,0 +1,61 @@
+# Copyright © 2025 Province of British Columbia
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for the shared template registry."""
+import os
+
+from api.services.template_registry import TemplateRegistry, template_registry
+
+
+def _write_template(root, name, content, mtime=None):
+    path = root / 'report-templates' / name
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(content)
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+
+
+def test_precompile_compiles_every_template_once(tmp_path, monkeypatch):
+    """Templates in nested folders are compiled at startup and reused afterwards."""
+    monkeypatch.chdir(tmp_path)
+    _write_template(tmp_path, 'report.html', "{% include 'report-templates/styles/part.html' %}{{ name }}")
+    _write_template(tmp_path, 'styles/part.html', '<style></style>')
+    registry = TemplateRegistry()
+
+    assert registry.precompile() == 2
+    assert registry.render('report-templates//report.html', {'name': '<b>'}) == '<style></style>&lt;b&gt;'
+
+    stats = registry.stats()
+    assert stats['report-templates/report.html']['compiles'] == 1
+    assert stats['report-templates/report.html']['renders'] == 1
+    assert stats['report-templates/styles/part.html']['compiles'] == 1
+
+
+def test_template_recompiled_when_mtime_changes(tmp_path, monkeypatch):
+    """A template edited on disk is picked up without restarting the worker."""
+    monkeypatch.chdir(tmp_path)
+    _write_template(tmp_path, 'report.html', 'first', mtime=1_000_000)
+    registry = TemplateRegistry()
+    assert registry.render('report-templates/report.html') == 'first'
+
+    _write_template(tmp_path, 'report.html', 'second', mtime=2_000_000)
+    assert registry.render('report-templates/report.html') == 'second'
+    assert registry.stats()['report-templates/report.html']['compiles'] == 2
+
+
+def test_app_registry_has_stored_templates(app):
+    """The app wide registry precompiles the shipped templates and their includes."""
+    stats = template_registry.stats()
+    assert 'report-templates/statement_report.html' in stats
+    assert 'report-templates/styles/footer.html' in stats
+    assert 'format_datetime' in template_registry.env.filters
@@ -19,39 +19,102 @@ Test suite for template service
 """
 
 
-from unittest.mock import patch
+import os
 
-from api.services import TemplateService
+import pytest
+from jinja2 import TemplateNotFound
 
+from api.services import TemplateService, template_service
+from api.services.template_catalogue import TemplateCatalogue
+from api.services.template_registry import template_registry
 
-def test_find_all_templates_by_three_templates(app):
+
+def _use_catalogue(monkeypatch, tmp_path, filenames):
+    folder = tmp_path / 'report-templates'
+    folder.mkdir()
+    for filename in filenames:
+        (folder / filename).write_text(f'<p>{filename}</p>')
+    catalogue = TemplateCatalogue(str(folder))
+    monkeypatch.setattr(template_service, 'template_catalogue', catalogue)
+    return catalogue
+
+
+def test_find_all_templates_by_three_templates(app, tmp_path, monkeypatch):
     """Test create account."""
     with app.app_context():
-        with patch('os.listdir') as mock_list_of_files:
-            mock_list_of_files.return_value = ['payment_receipt.html', 'payment_bill.html', 'payment_signed.html']
-            templates = TemplateService.find_all_templates()
-            assert len(templates) == 3
-            assert templates[0] == 'payment_receipt'
-            assert templates[1] == 'payment_bill'
-            assert templates[2] == 'payment_signed'
+        _use_catalogue(monkeypatch, tmp_path, ['payment_receipt.html', 'payment_bill.html', 'payment_signed.html'])
+        templates = TemplateService.find_all_templates()
+        assert len(templates) == 3
+        assert templates[0] == 'payment_bill'
+        assert templates[1] == 'payment_receipt'
+        assert templates[2] == 'payment_signed'
 
 
-def test_find_all_templates_by_non_html_templates(app):
+def test_find_all_templates_by_non_html_templates(app, tmp_path, monkeypatch):
     """Test create account."""
     with app.app_context():
-        with patch('os.listdir') as mock_list_of_files:
-            mock_list_of_files.return_value = ['payment_receipt.word', 'payment_bill.html', 'payment_signed.html']
-            templates = TemplateService.find_all_templates()
-            assert len(templates) == 2
-            assert templates[0] == 'payment_bill'
-            assert templates[1] == 'payment_signed'
+        _use_catalogue(monkeypatch, tmp_path, ['payment_receipt.word', 'payment_bill.html', 'payment_signed.html'])
+        templates = TemplateService.find_all_templates()
+        assert len(templates) == 2
+        assert templates[0] == 'payment_bill'
+        assert templates[1] == 'payment_signed'
 
 
-def test_find_all_templates_by_no_templates(app):
+def test_find_all_templates_by_no_templates(app, tmp_path, monkeypatch):
     """Test create account."""
     with app.app_context():
-        with patch('os.listdir') as mock_list_of_files:
-            mock_list_of_files.return_value = []
-            templates = TemplateService.find_all_templates()
-            print(templates)
-            assert len(templates) == 0
+        _use_catalogue(monkeypatch, tmp_path, [])
+        templates = TemplateService.find_all_templates()
+        assert len(templates) == 0
+
+
+def test_catalogue_picks_up_changes_without_listing_per_request(tmp_path, monkeypatch):
+    """Listing is served from memory; a refresh rehashes only changed files and changes the ETag."""
+    catalogue = _use_catalogue(monkeypatch, tmp_path, ['payment_bill.html', 'part.html'])
+    names, etag = catalogue.listing()
+    assert names == ['part', 'payment_bill']
+
+    def no_listing(*args):
+        raise AssertionError('listed the template folder')
+
+    monkeypatch.setattr(os, 'walk', no_listing)
+    assert catalogue.listing() == (names, etag)
+    monkeypatch.undo()
+
+    entry = catalogue.entries()[f'{catalogue.folder}/payment_bill.html']
+    assert entry.size == len('<p>payment_bill.html</p>')
+    assert not catalogue.refresh()
+
+    (tmp_path / 'report-templates' / 'payment_bill.html').write_text('<p>changed</p>')
+    os.utime(tmp_path / 'report-templates' / 'payment_bill.html', ns=(entry.mtime_ns + 10**9,) * 2)
+    assert catalogue.refresh()
+    assert catalogue.listing()[1] != etag
+    assert catalogue.entries()[f'{catalogue.folder}/payment_bill.html'].content_hash != entry.content_hash
+
+
+def test_catalogue_caches_rendered_templates_until_an_include_changes(tmp_path, monkeypatch):
+    """Stored templates render once and render again when a file they include changes."""
+    monkeypatch.chdir(tmp_path)
+    folder = tmp_path / 'report-templates'
+    (folder / 'styles').mkdir(parents=True)
+    (folder / 'report.html').write_text("<p>{% include 'report-templates/styles/part.html' %}</p>")
+    (folder / 'styles' / 'part.html').write_text('first')
+    catalogue = TemplateCatalogue('report-templates')
+    renders = []
+    render = template_registry.render
+    monkeypatch.setattr(template_registry, 'render', lambda name: renders.append(name) or render(name))
+
+    html, etag = catalogue.rendered('report')
+    assert html == '<p>first</p>'
+    assert catalogue.rendered('report') == (html, etag)
+    assert renders == ['report-templates/report.html']
+    assert catalogue.listing()[0] == ['report']
+    with pytest.raises(TemplateNotFound):
+        catalogue.rendered('part')
+
+    (folder / 'styles' / 'part.html').write_text('second!')
+    os.utime(folder / 'styles' / 'part.html', (2_000_000_000, 2_000_000_000))
+    assert catalogue.refresh()
+    html, new_etag = catalogue.rendered('report')
+    assert html == '<p>second!</p>'
+    assert new_etag != etag
@@ -0,0 +1,113 @@
+# Copyright © 2025 Province of British Columbia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Test the WeasyPrint render pool."""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from api.services import weasyprint_pool
+from api.services.weasyprint_pool import ReportRenderTimeoutError, WeasyPrintPool, render_template_pdf
+
+
+class _Document:  # pylint: disable=too-few-public-methods
+    def write_pdf(self):
+        return b'%PDF-1.4 fake'
+
+
+def test_renders_reuse_compiled_templates_and_font_config(monkeypatch):
+    """Repeated renders share one compiled template, one font configuration and one image cache."""
+    calls = []
+
+    class FakeHTML:  # pylint: disable=too-few-public-methods
+        def __init__(self, string):
+            self.string = string
+
+        def render(self, **kwargs):
+            calls.append((self.string, kwargs))
+            return _Document()
+
+    monkeypatch.setattr(weasyprint_pool, 'HTML', FakeHTML)
+    weasyprint_pool._compile.cache_clear()
+
+    for name in ('one', 'two'):
+        assert render_template_pdf('<p>{{ name }}</p>', {'name': name}) == b'%PDF-1.4 fake'
+
+    assert [string for string, _ in calls] == ['<p>one</p>', '<p>two</p>']
+    assert weasyprint_pool._compile.cache_info().hits == 1
+    assert calls[0][1]['font_config'] is calls[1][1]['font_config']
+    assert calls[0][1]['cache'] is calls[1][1]['cache']
+
+
+def test_pool_renders_in_worker_processes():
+    """A warmed pool process renders the template to a PDF."""
+    pool = WeasyPrintPool(processes=1, timeout=60)
+    try:
+        assert pool.render('<p>{{ name }}</p>', {'name': 'Acme'}).startswith(b'%PDF')
+    finally:
+        pool.close()
+
+
+SLOW_TEMPLATE = '{% for a in range(100000) %}{% for b in range(100000) %}{% endfor %}{% endfor %}'
+
+
+def test_pool_timeout_starts_when_the_render_does():
+    """Spawning and warming up a process does not count against the render timeout."""
+    pool = WeasyPrintPool(processes=1, timeout=0.5)
+    try:
+        assert pool.render('<p>{{ name }}</p>', {'name': 'Acme'}).startswith(b'%PDF')
+    finally:
+        pool.close()
+
+
+def test_pool_render_errors_are_raised_and_the_process_kept():
+    """A template error reaches the caller, and the process goes on rendering."""
+    pool = WeasyPrintPool(processes=1, timeout=60)
+    try:
+        with pytest.raises(ZeroDivisionError):
+            pool.render('{{ 1 // 0 }}', {})
+        assert pool.render('<p>ok</p>', {}).startswith(b'%PDF')
+    finally:
+        pool.close()
+
+
+def test_pool_render_times_out_killing_only_its_process(app, monkeypatch):
+    """A render over the timeout raises; renders on the other process carry on and the pool is kept."""
+    monkeypatch.setitem(app.config, 'WEASYPRINT_RENDER_PROCESSES', 2)
+    monkeypatch.setitem(app.config, 'WEASYPRINT_RENDER_TIMEOUT', 2)
+    try:
+        with app.app_context():
+            pool = WeasyPrintPool.get()
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                stuck = executor.submit(pool.render, SLOW_TEMPLATE, {})
+                while pool._idle.qsize() == 2:
+                    time.sleep(0.01)
+                assert pool.render('<p>alongside</p>', {}).startswith(b'%PDF')
+                with pytest.raises(ReportRenderTimeoutError):
+                    stuck.result()
+            assert pool.render('<p>after</p>', {}).startswith(b'%PDF')
+            assert WeasyPrintPool.get() is pool
+    finally:
+        WeasyPrintPool.reset()
+
+
+def test_pool_starts_with_the_app(app, monkeypatch):
+    """init_app creates the pool at startup so its processes warm up before the first request."""
+    monkeypatch.setitem(app.config, 'WEASYPRINT_RENDER_PROCESSES', 1)
+    try:
+        WeasyPrintPool.init_app(app)
+        assert WeasyPrintPool._instance is not None
+    finally:
+        WeasyPrintPool.reset()
@@ -0,0 +1,48 @@
+# Copyright © 2025 Province of British Columbia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for the format_datetime template filter."""
+import pytest
+from dateutil import parser
+
+from api.utils import util
+from api.utils.util import DATE_FORMATS, format_datetime
+
+
+VALUES = ('2025-01-05', '2025-01-05T18:30:00', '2025-01-05T18:30:00Z', '2025-01-05 18:30:00.123+00:00',
+          'Jan 5, 2025 6:30 PM', '2025-01')
+
+
+@pytest.mark.parametrize('value', VALUES)
+@pytest.mark.parametrize('date_format', (*DATE_FORMATS, 'unix', 'unknown'))
+def test_format_datetime_matches_dateutil(value, date_format):
+    """ISO values take the fast path and every value formats as dateutil parsing it would."""
+    expected = parser.parse(value)
+    if date_format == 'unix':
+        expected = int(expected.timestamp())
+    else:
+        expected = expected.strftime(DATE_FORMATS.get(date_format, DATE_FORMATS['short']))
+    assert format_datetime(value, date_format) == expected
+
+
+def test_format_datetime_caches_iso_values_only():
+    """Repeated ISO dates are formatted once; dateutil's partial dates are never cached."""
+    util._format_iso_datetime.cache_clear()  # pylint: disable=protected-access
+    for _ in range(3):
+        assert format_datetime('2025-01-05T18:30:00') == '01-05-2025'
+        format_datetime('2025-01')
+    info = util._format_iso_datetime.cache_info()  # pylint: disable=protected-access
+    assert (info.hits, info.currsize) == (2, 1)
+
+    with pytest.raises(TypeError):
+        format_datetime(None)
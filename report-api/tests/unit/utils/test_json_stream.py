@@ -0,0 +1,94 @@
+# Copyright © 2025 Province of British Columbia
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for the incremental JSON request decoder."""
+import gzip
+import io
+import json
+import tracemalloc
+
+import pytest
+
+from api.resources.report import STREAMED_JSON_PATHS
+from api.utils.json_stream import RequestTooLargeError, decode_json_stream, iter_lines, read_body
+
+from ...utilities.json_payloads import statement_payload
+
+
+def _blocks(data: bytes, size: int):
+    return [data[start:start + size] for start in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize('text', [
+    '{}',
+    ' [1, 2 ,3] ',
+    '"café"',
+    '{"a": [1, {"b": "c\\u00e9"}], "templateVars": {"grouped_invoices": [{"x": 1.5e3, "transactions": '
+    '[{"p": ["é"]}, 12345, true, null]}, {"transactions": []}], "values": [[1], [2]]}}',
+])
+def test_decode_matches_json_loads_for_any_block_split(text):
+    """Decoding gives the json.loads result however the body is split, even inside numbers and characters."""
+    data = text.encode('utf-8')
+    for size in (1, 2, 3, 7, len(data)):
+        assert decode_json_stream(_blocks(data, size), STREAMED_JSON_PATHS) == json.loads(text)
+
+
+@pytest.mark.parametrize('text', [
+    '', '{"a": 1,}', '[1 2]', '{"a" 1}', '[1,', '{"a": 1} x', '{"templateVars": {"values": [1,]}}',
+])
+def test_decode_rejects_invalid_json(text):
+    """Malformed bodies raise JSONDecodeError, in walked containers and decoded values alike."""
+    with pytest.raises(json.JSONDecodeError):
+        decode_json_stream(_blocks(text.encode('utf-8'), 2), STREAMED_JSON_PATHS)
+
+
+def test_read_body_limits_and_gzip():
+    """Bodies are gunzipped across members, and both size limits stop reading as soon as they are passed."""
+    body = gzip.compress(b'{"a": [1,') + gzip.compress(b'2]}')
+    assert decode_json_stream(read_body(io.BytesIO(body), compressed=True)) == {'a': [1, 2]}
+
+    bomb = gzip.compress(b' ' * 50_000_000)
+    blocks = read_body(io.BytesIO(bomb), compressed=True, max_json_bytes=1_000_000)
+    with pytest.raises(RequestTooLargeError):
+        for _ in blocks:
+            pass
+
+    with pytest.raises(RequestTooLargeError):
+        list(read_body(io.BytesIO(b'x' * 200_000), max_body_bytes=100_000))
+    with pytest.raises(EOFError):
+        list(read_body(io.BytesIO(gzip.compress(b'{}')[:-5]), compressed=True))
+    assert list(iter_lines([b'{"a"', b': 1}\n[1]\n', b'[2]'])) == [b'{"a": 1}', b'[1]', b'[2]']
+
+
+def test_decode_peak_memory_stays_near_result_size():
+    """Streamed decoding peaks near the size of its result, below decompressing then json.loads."""
+    payload = statement_payload(invoices=4, transactions=500)
+    body = gzip.compress(json.dumps(payload).encode('utf-8'))
+
+    tracemalloc.start()
+    try:
+        parsed = json.loads(gzip.decompress(body).decode('utf-8'))
+        loads_peak = tracemalloc.get_traced_memory()[1]
+        del parsed
+
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        streamed = decode_json_stream(read_body(io.BytesIO(body), compressed=True), STREAMED_JSON_PATHS)
+        stream_peak = tracemalloc.get_traced_memory()[1] - baseline
+        result_size = tracemalloc.get_traced_memory()[0] - baseline
+    finally:
+        tracemalloc.stop()
+
+    assert streamed == payload
+    assert stream_peak < loads_peak
+    assert stream_peak < result_size * 1.1
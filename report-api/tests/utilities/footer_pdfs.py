@@ -0,0 +1,31 @@
+# Copyright © 2025 Province of British Columbia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Footer PDFs for the footer overlay tests and benchmarks."""
+import io
+
+import pikepdf
+
+
+def footer_batches(page_count, batch_size=200, page_size=(612, 792)):
+    """Build footer batch PDFs the way the Gotenberg footer pass returns them."""
+    batches = []
+    for batch_start in range(0, page_count, batch_size):
+        pdf = pikepdf.Pdf.new()
+        for page_num in range(batch_start, min(batch_start + batch_size, page_count)):
+            pdf.add_blank_page(page_size=page_size)
+            pdf.pages[-1].Contents = pdf.make_stream(b'BT /F1 9 Tf 450 17 Td (Page %d) Tj ET' % (page_num + 1))
+        buf = io.BytesIO()
+        pdf.save(buf)
+        batches.append(buf.getvalue())
+    return batches
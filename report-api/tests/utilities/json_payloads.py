@@ -0,0 +1,26 @@
+# Copyright © 2025 Province of British Columbia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Request bodies for the streamed JSON decoder tests and benchmarks."""
+
+
+def statement_payload(invoices: int, transactions: int) -> dict:
+    """Return a statement request body with invoices of identical transactions."""
+    transaction = {
+        'products': ['Business Search'], 'folio': 'ABC123', 'createdOn': '2025-01-01T00:00:00',
+        'fee': '7.00', 'serviceFees': '1.50', 'gst': '0.00', 'total': '8.50', 'details': ['detail text'],
+    }
+    return {'templateVars': {'grouped_invoices': [
+        {'id': invoice, 'paymentMethod': 'PAD', 'transactions': [dict(transaction) for _ in range(transactions)]}
+        for invoice in range(invoices)
+    ]}}
@@ -0,0 +1,69 @@
+# Copyright © 2025 Province of British Columbia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Laid out documents with pageinfo footers, shaped like WeasyPrint's boxes, for page info tests and benchmarks."""
+from xml.etree import ElementTree
+
+from weasyprint.formatting_structure.boxes import InlineBox
+
+from api.services.page_info import index_page_info
+
+
+class _Box:  # pylint: disable=too-few-public-methods
+    def __init__(self, element, children=(), element_tag=None):
+        self.element = element
+        self.element_tag = element_tag or element.tag
+        self.children = list(children)
+        self.text = None
+
+    def all_children(self):
+        return self.children
+
+
+class _PageInfoBox(InlineBox, _Box):  # pylint: disable=too-few-public-methods
+    def __init__(self, element):
+        _Box.__init__(self, element, [_Box(element)])
+
+
+class _Page:  # pylint: disable=too-few-public-methods
+    def __init__(self, page_box):
+        self._page_box = page_box
+
+
+class _Document:  # pylint: disable=too-few-public-methods
+    def __init__(self, pages):
+        self.pages = pages
+
+
+def make_document(page_count, rows_per_page=40):
+    """Build a parsed HTML tree and a laid out document of it, with rows of table cells and a pageinfo footer."""
+    root = ElementTree.Element('html')
+    body = ElementTree.SubElement(root, 'body')
+    pages = []
+    for _ in range(page_count):
+        table = ElementTree.SubElement(body, 'table')
+        rows = []
+        for _ in range(rows_per_page):
+            row = ElementTree.SubElement(table, 'tr')
+            cells = [ElementTree.SubElement(row, 'td') for _ in range(5)]
+            rows.append(_Box(row, [_Box(cell, [_Box(cell, [_Box(cell)], 'line')]) for cell in cells]))
+        footer = ElementTree.SubElement(body, 'div')
+        page_info = _PageInfoBox(ElementTree.SubElement(footer, 'pageinfo'))
+        page_box = _Box(None, [_Box(root, [_Box(body, [_Box(table, rows), _Box(footer, [page_info])])])], 'page')
+        pages.append(_Page(page_box))
+    return root, _Document(pages)
+
+
+def page_info_texts(document):
+    """Return the text of every pageinfo box in the document, in page order."""
+    return [box.children[0].text for boxes in index_page_info(document) for box in boxes if box.children]